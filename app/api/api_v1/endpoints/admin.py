@@ -1,23 +1,37 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime
+from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from app.api import deps
 from app.schemas.admin import AppConfig, ConfigUpdate, TopicPreset
-from app.schemas.user import UserResponse
+from app.schemas.user import UserPlan, UserResponse, UserRole
 from app.db.mongodb import get_database
+from app.services.audio_cache import audio_cache
+from app.services.content_cache import content_cache
+from app.services.config_cache import config_cache
+from app.services.tts_fragments import tts_fragment_cache
+from app.services.usage_rollup import usage_rollup
+from app.core import http_range, pagination, security
+from app.core.auth_cache import auth_cache
 from motor.motor_asyncio import AsyncIOMotorDatabase
+import asyncio
+import re
 
 router = APIRouter()
 
 @router.get("/config", response_model=AppConfig)
 async def get_app_config(
+    request: Request,
+    response: Response,
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: Any = Depends(deps.get_current_active_admin),
 ) -> Any:
-    config = await db["config"].find_one({"_id": "app_config"})
-    if not config:
-        # Return default config if not found
-        return AppConfig()
-    return config
+    config = await config_cache.get(db)
+    headers = {"ETag": config.etag, "Cache-Control": "private, no-cache"}
+    if http_range.etag_matches(request.headers.get("if-none-match"), config.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    # Returns the default config if none is stored
+    return config.public()
 
 @router.put("/config", response_model=AppConfig)
 async def update_app_config(
@@ -26,13 +40,15 @@ async def update_app_config(
     current_user: Any = Depends(deps.get_current_active_admin),
     config_in: ConfigUpdate
 ) -> Any:
-    update_data = config_in.dict(exclude_unset=True)
+    # Character limits and topic templates are part of every content key, so
+    # changing them never needs content_version bumped
     await db["config"].update_one(
         {"_id": "app_config"},
-        {"$set": update_data},
+        {"$set": config_in.dict(exclude_unset=True), "$inc": {"version": 1}},
         upsert=True
     )
     config = await db["config"].find_one({"_id": "app_config"})
+    config_cache.invalidate()
     return config
 
 @router.post("/topics", response_model=List[TopicPreset])
@@ -42,31 +58,95 @@ async def add_topic_preset(
     current_user: Any = Depends(deps.get_current_active_admin),
     topic: TopicPreset
 ) -> Any:
+    # The template is part of the content key, so only this topic's new
+    # requests miss the shared content cache
     await db["config"].update_one(
         {"_id": "app_config"},
-        {"$push": {"topics": topic.dict()}},
+        {"$push": {"topics": topic.dict()}, "$inc": {"version": 1}},
         upsert=True
     )
     config = await db["config"].find_one({"_id": "app_config"})
+    config_cache.invalidate()
     return config["topics"]
 
+# Listing projections: never hashed passwords, tokens or audio blobs
+USER_LIST_FIELDS = {
+    "email": 1, "full_name": 1, "is_active": 1, "is_email_verified": 1, "role": 1, "plan": 1, "created_at": 1
+}
+SESSION_LIST_FIELDS = {
+    "user_id": 1, "topic": 1, "prompt": 1, "content_key": 1, "duration_minutes": 1,
+    "exam_mode": 1, "listen_count": 1, "created_at": 1
+}
+
 @router.get("/users", response_model=List[UserResponse])
 async def get_all_users(
+    response: Response,
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: Any = Depends(deps.get_current_active_admin),
+    plan: Optional[UserPlan] = None,
+    role: Optional[UserRole] = None,
+    email_prefix: Optional[str] = Query(None, min_length=1, max_length=254),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
 ) -> Any:
-    cursor = db["users"].find()
-    users = await cursor.to_list(length=100)
+    """Newest users first; the next page's cursor is in the X-Next-Cursor header."""
+    query = pagination.created_range(created_from, created_to)
+    if plan:
+        query["plan"] = plan.value
+    if role:
+        query["role"] = role.value
+    if email_prefix:
+        # Anchored, so it can use the email index
+        query["email"] = {"$regex": f"^{re.escape(email_prefix)}"}
+
+    users, next_cursor = await pagination.keyset_page(db["users"], query, USER_LIST_FIELDS, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [{**u, "id": u["_id"]} for u in users]
 
+@router.post("/users/{user_id}/deactivate", response_model=UserResponse)
+async def deactivate_user(
+    user_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: Any = Depends(deps.get_current_active_admin),
+) -> Any:
+    result = await db["users"].update_one({"_id": user_id}, {"$set": {"is_active": False}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Takes effect immediately here; other workers within AUTH_CACHE_TTL_SECONDS
+    auth_cache.invalidate_user(user_id)
+    user = await db["users"].find_one({"_id": user_id})
+    return {**user, "id": user["_id"]}
+
 @router.get("/sessions")
 async def get_all_sessions(
+    response: Response,
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: Any = Depends(deps.get_current_active_admin),
+    topic: Optional[str] = None,
+    user_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    include_content: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
 ) -> Any:
-    cursor = db["study_sessions"].find().sort("created_at", -1)
-    sessions = await cursor.to_list(length=100)
-    # Exclude audio_data (binary) to prevent serialization errors
+    """Newest sessions first; the next page's cursor is in the X-Next-Cursor header."""
+    query = pagination.created_range(created_from, created_to)
+    if topic:
+        query["topic"] = topic
+    if user_id:
+        query["user_id"] = user_id
+
+    projection = {**SESSION_LIST_FIELDS, "content": 1} if include_content else SESSION_LIST_FIELDS
+    sessions, next_cursor = await pagination.keyset_page(db["study_sessions"], query, projection, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if include_content:
+        await content_cache.hydrate(db, sessions, fields=("content",))
+
     return [{
         "id": s["_id"],
         "user_id": s.get("user_id"),
@@ -83,69 +163,44 @@ async def get_all_sessions(
 async def get_usage_report(
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: Any = Depends(deps.get_current_active_admin),
+    from_date: Optional[date] = Query(None, alias="from", description="First day (UTC), inclusive"),
+    to_date: Optional[date] = Query(None, alias="to", description="Last day (UTC), inclusive"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
 ) -> Any:
-    pipeline = [
-        {
-            "$group": {
-                "_id": None,
-                "total_openai_tokens": {"$sum": "$openai_tokens"},
-                "total_polly_characters": {"$sum": "$polly_characters"},
-                "total_openai_cost": {"$sum": "$openai_cost"},
-                "total_polly_cost": {"$sum": "$polly_cost"},
-                "total_cost": {"$sum": "$total_cost"},
-                "total_sessions": {"$sum": 1}
-            }
-        }
-    ]
-    cursor = db["usage"].aggregate(pipeline)
-    result = await cursor.to_list(length=1)
-    
-    if not result:
-        summary = {
-            "total_openai_tokens": 0,
-            "total_polly_characters": 0,
-            "total_openai_cost": 0,
-            "total_polly_cost": 0,
-            "total_cost": 0,
-            "total_sessions": 0
-        }
-    else:
-        summary = result[0]
-
-    # Get detailed usage per user
-    user_pipeline = [
-        {
-            "$group": {
-                "_id": "$user_id",
-                "openai_tokens": {"$sum": "$openai_tokens"},
-                "polly_characters": {"$sum": "$polly_characters"},
-                "total_cost": {"$sum": "$total_cost"},
-                "sessions": {"$sum": 1}
-            }
-        },
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "_id",
-                "foreignField": "_id",
-                "as": "user_info"
-            }
-        },
-        {"$unwind": "$user_info"},
-        {
-            "$project": {
-                "email": "$user_info.email",
-                "openai_tokens": 1,
-                "polly_characters": 1,
-                "total_cost": 1,
-                "sessions": 1
-            }
-        }
-    ]
-    user_cursor = db["usage"].aggregate(user_pipeline)
-    user_usage = await user_cursor.to_list(length=100)
+    # Served from the daily rollups, not the raw usage events
+    summary, user_usage = await asyncio.gather(
+        usage_rollup.summary(db, from_date, to_date),
+        usage_rollup.per_user(db, from_date, to_date, (page - 1) * page_size, page_size + 1),
+    )
 
     return {
+        "from": from_date,
+        "to": to_date,
         "summary": summary,
-        "user_usage": user_usage
+        "user_usage": user_usage[:page_size],
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(user_usage) > page_size
+    }
+
+@router.get("/cache-stats")
+async def get_cache_stats(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: Any = Depends(deps.get_current_active_admin),
+) -> Any:
+    return {
+        "content_cache": await content_cache.stats(db),
+        "auth_cache": auth_cache.stats(),
+        "audio_cache": audio_cache.stats(),
+        "tts_fragments": await tts_fragment_cache.stats(db),
+    }
+
+@router.get("/runtime-stats")
+async def get_runtime_stats(
+    current_user: Any = Depends(deps.get_current_active_admin),
+) -> Any:
+    """Per-process pools: how busy password hashing is on this worker."""
+    return {
+        "password_hasher": security.password_hasher.stats(),
     }
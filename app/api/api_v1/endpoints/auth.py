@@ -9,7 +9,10 @@ from app.api import deps
 from app.schemas.user import Token, UserCreate, UserResponse, UserInDB
 from app.db.mongodb import get_database
 from app.services.email import email_service
+from app.core.auth_cache import auth_cache
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from typing import Optional
 import uuid
 import logging
 
@@ -17,13 +20,56 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# One-time email tokens live in auth_tokens so a TTL index can expire them
+VERIFY_EMAIL = "verify_email"
+RESET_PASSWORD = "reset_password"
+_LEGACY_TOKEN_FIELDS = {VERIFY_EMAIL: "verification_token", RESET_PASSWORD: "reset_token"}
+
+async def _issue_auth_token(
+    db: AsyncIOMotorDatabase, user_id: str, purpose: str, lifetime: timedelta
+) -> str:
+    token = security.create_verification_token()
+    # Only the most recent token of each kind stays valid
+    await db["auth_tokens"].delete_many({"user_id": user_id, "purpose": purpose})
+    await db["auth_tokens"].insert_one({
+        "_id": token,
+        "user_id": user_id,
+        "purpose": purpose,
+        "expires_at": datetime.utcnow() + lifetime
+    })
+    return token
+
+async def _find_token_user(
+    db: AsyncIOMotorDatabase, token: str, purpose: str
+) -> tuple[Optional[dict], Optional[datetime]]:
+    """Return (user, token expiry) for a one-time token, or (None, None)."""
+    token_doc = await db["auth_tokens"].find_one({"_id": token, "purpose": purpose})
+    if token_doc:
+        user = await db["users"].find_one({"_id": token_doc["user_id"]})
+        return user, token_doc["expires_at"]
+
+    # Tokens issued before auth_tokens existed are stored on the user
+    field = _LEGACY_TOKEN_FIELDS[purpose]
+    user = await db["users"].find_one({field: token})
+    if not user:
+        return None, None
+    return user, user.get(f"{field}_expires")
+
+async def _revoke_auth_tokens(db: AsyncIOMotorDatabase, user_id: str, purpose: str):
+    field = _LEGACY_TOKEN_FIELDS[purpose]
+    await db["auth_tokens"].delete_many({"user_id": user_id, "purpose": purpose})
+    await db["users"].update_one(
+        {"_id": user_id},
+        {"$set": {field: None, f"{field}_expires": None}}
+    )
+
 @router.post("/login", response_model=Token)
 async def login_access_token(
     db: AsyncIOMotorDatabase = Depends(get_database),
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     user = await db["users"].find_one({"email": form_data.username})
-    if not user or not security.verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await security.verify_password_async(form_data.password, user["hashed_password"]):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user["is_active"]:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -32,6 +78,14 @@ async def login_access_token(
             status_code=401, 
             detail="Please verify your email before logging in. Check your inbox for the verification link."
         )
+
+    # Move the stored hash to the current cost while we have the plain password
+    if security.password_needs_rehash(user["hashed_password"]):
+        await db["users"].update_one(
+            {"_id": user["_id"], "hashed_password": user["hashed_password"]},
+            {"$set": {"hashed_password": await security.get_password_hash_async(form_data.password)}}
+        )
+        auth_cache.invalidate_user(user["_id"])
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
@@ -57,25 +111,34 @@ async def register_user(
     # Create user with unverified email
     user_dict = user_in.dict()
     password = user_dict.pop("password")
-    user_dict["hashed_password"] = security.get_password_hash(password)
+    user_dict["hashed_password"] = await security.get_password_hash_async(password)
     user_dict["_id"] = str(uuid.uuid4())
     user_dict["is_email_verified"] = False
+    user_dict["created_at"] = datetime.utcnow()
     
+    try:
+        await db["users"].insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system.",
+        )
+
     # Generate verification token
-    verification_token = security.create_verification_token()
-    user_dict["verification_token"] = verification_token
-    user_dict["verification_token_expires"] = datetime.utcnow() + timedelta(hours=24)
-    
-    await db["users"].insert_one(user_dict)
+    verification_token = await _issue_auth_token(
+        db, user_dict["_id"], VERIFY_EMAIL, timedelta(hours=24)
+    )
     
-    # Send verification email
+    # Queue verification email; the outbox sender delivers it
     email_sent = await email_service.send_verification_email(
+        db,
         user_in.email, 
         verification_token
     )
     
     if not email_sent:
-        logger.warning(f"Failed to send verification email to {user_in.email}")
+        logger.warning(f"Failed to queue verification email to {user_in.email}")
     
     return {
         "message": "Registration successful! Please check your email to verify your account.",
@@ -89,7 +152,7 @@ async def verify_email(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ) -> Any:
     """Verify user email with token"""
-    user = await db["users"].find_one({"verification_token": token})
+    user, expires = await _find_token_user(db, token, VERIFY_EMAIL)
     
     if not user:
         raise HTTPException(
@@ -98,13 +161,13 @@ async def verify_email(
         )
     
     # Check if token is expired
-    if not user.get("verification_token_expires"):
+    if not expires:
         raise HTTPException(
             status_code=400,
             detail="Invalid verification token"
         )
     
-    if not security.verify_token_expiry(user["verification_token_expires"]):
+    if not security.verify_token_expiry(expires):
         raise HTTPException(
             status_code=400,
             detail="Verification token has expired. Please request a new verification email."
@@ -113,14 +176,10 @@ async def verify_email(
     # Update user as verified
     await db["users"].update_one(
         {"_id": user["_id"]},
-        {
-            "$set": {
-                "is_email_verified": True,
-                "verification_token": None,
-                "verification_token_expires": None
-            }
-        }
+        {"$set": {"is_email_verified": True}}
     )
+    await _revoke_auth_tokens(db, user["_id"], VERIFY_EMAIL)
+    auth_cache.invalidate_user(user["_id"])
     
     return {
         "message": "Email verified successfully! You can now log in.",
@@ -146,23 +205,16 @@ async def resend_verification(
         )
     
     # Generate new verification token
-    verification_token = security.create_verification_token()
-    
-    await db["users"].update_one(
-        {"_id": user["_id"]},
-        {
-            "$set": {
-                "verification_token": verification_token,
-                "verification_token_expires": datetime.utcnow() + timedelta(hours=24)
-            }
-        }
+    await _revoke_auth_tokens(db, user["_id"], VERIFY_EMAIL)
+    verification_token = await _issue_auth_token(
+        db, user["_id"], VERIFY_EMAIL, timedelta(hours=24)
     )
     
-    # Send verification email
-    email_sent = await email_service.send_verification_email(email, verification_token)
+    # Queue verification email
+    email_sent = await email_service.send_verification_email(db, email, verification_token)
     
     if not email_sent:
-        logger.warning(f"Failed to resend verification email to {email}")
+        logger.warning(f"Failed to queue resent verification email to {email}")
     
     return {"message": "If an account exists with this email, a verification email has been sent."}
 
@@ -179,23 +231,16 @@ async def forgot_password(
         return {"message": "If an account exists with this email, a password reset link has been sent."}
     
     # Generate password reset token
-    reset_token = security.create_verification_token()
-    
-    await db["users"].update_one(
-        {"_id": user["_id"]},
-        {
-            "$set": {
-                "reset_token": reset_token,
-                "reset_token_expires": datetime.utcnow() + timedelta(hours=1)
-            }
-        }
+    await _revoke_auth_tokens(db, user["_id"], RESET_PASSWORD)
+    reset_token = await _issue_auth_token(
+        db, user["_id"], RESET_PASSWORD, timedelta(hours=1)
     )
     
-    # Send password reset email
-    email_sent = await email_service.send_password_reset_email(email, reset_token)
+    # Queue password reset email
+    email_sent = await email_service.send_password_reset_email(db, email, reset_token)
     
     if not email_sent:
-        logger.warning(f"Failed to send password reset email to {email}")
+        logger.warning(f"Failed to queue password reset email to {email}")
     
     return {"message": "If an account exists with this email, a password reset link has been sent."}
 
@@ -206,7 +251,7 @@ async def reset_password(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ) -> Any:
     """Reset password using reset token"""
-    user = await db["users"].find_one({"reset_token": token})
+    user, expires = await _find_token_user(db, token, RESET_PASSWORD)
     
     if not user:
         raise HTTPException(
@@ -215,31 +260,27 @@ async def reset_password(
         )
     
     # Check if token is expired
-    if not user.get("reset_token_expires"):
+    if not expires:
         raise HTTPException(
             status_code=400,
             detail="Invalid or expired reset token"
         )
     
-    if not security.verify_token_expiry(user["reset_token_expires"]):
+    if not security.verify_token_expiry(expires):
         raise HTTPException(
             status_code=400,
             detail="Reset token has expired. Please request a new password reset."
         )
     
     # Update password and clear reset token
-    hashed_password = security.get_password_hash(new_password)
+    hashed_password = await security.get_password_hash_async(new_password)
     
     await db["users"].update_one(
         {"_id": user["_id"]},
-        {
-            "$set": {
-                "hashed_password": hashed_password,
-                "reset_token": None,
-                "reset_token_expires": None
-            }
-        }
+        {"$set": {"hashed_password": hashed_password}}
     )
+    await _revoke_auth_tokens(db, user["_id"], RESET_PASSWORD)
+    auth_cache.invalidate_user(user["_id"])
     
     logger.info(f"Password reset successful for user {user['email']}")
     
@@ -1,56 +1,93 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException, Response
-from fastapi.responses import StreamingResponse
+from typing import Any, List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
+from jose import jwt
 from app.api import deps
-from app.schemas.study import StudyPrompt, StudySessionResponse
+from app.schemas.study import SpeechMarksWindow, StudyJobResponse, StudyPrompt, StudySessionResponse, StudySessionSummary
 from app.schemas.user import UserInDB, UserPlan
-from app.services.study_service import study_service
-from app.services.polly_service import polly_service
+from app.services.audio_cache import audio_cache
+from app.services.audio_store import AudioNotFound, audio_store
+from app.services.content_cache import content_cache
+from app.services.generation_service import STAGES, generation_service
+from app.services.job_queue import QUEUED, RUNNING, job_queue
+from app.services.renditions import rendition_service
+from app.services.config_cache import ConfigSnapshot, config_cache
+from app.services import mp3, renditions, speech_marks
 from app.schemas.admin import AppConfig
 from app.db.mongodb import get_database
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+import hashlib
 import uuid
 from datetime import datetime, timedelta
-import io
 from app.core.rate_limit import generation_limiter, audio_limiter
-from app.core import security
+from app.core import security, http_range, metrics, pagination
+from app.core.config import settings
+import json
+import logging
+import math
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get("/config", response_model=AppConfig)
-async def get_public_config(
-    db: AsyncIOMotorDatabase = Depends(get_database),
-    current_user: UserInDB = Depends(deps.get_current_active_user),
-) -> Any:
-    config = await db["config"].find_one({"_id": "app_config"})
-    if not config:
-        return AppConfig()
-    return config
+HISTORY_SUMMARY_FIELDS = {"topic": 1, "duration_minutes": 1, "created_at": 1}
+# Without audio blobs or speech marks; content comes from the shared entry
+HISTORY_FULL_FIELDS = {"topic": 1, "content": 1, "content_key": 1, "created_at": 1}
 
-@router.post("/generate", response_model=StudySessionResponse)
-async def generate_study_session(
-    *,
-    db: AsyncIOMotorDatabase = Depends(get_database),
-    current_user: UserInDB = Depends(deps.get_current_active_user),
-    study_in: StudyPrompt,
-    _ = Depends(generation_limiter)
-) -> Any:
-    # Fetch dynamic config
-    config = await db["config"].find_one({"_id": "app_config"})
-    if not config:
-        # Fallback to defaults if config not found
-        daily_limit = 5
-        plan_access = {
-            "exam_mode": ["paid"],
-            "durations": {"3": ["trial", "paid"], "5": ["paid"], "10": ["paid"]}
-        }
-    else:
-        daily_limit = config.get("daily_generation_limit", 5)
-        plan_access = config.get("plan_access", {})
+# Ranges this small only probe the file (Safari asks for bytes=0-1 before playing)
+LISTEN_PROBE_MAX_BYTES = 1024
+
+def _audio_url(session_id: str) -> str:
+    # Short-lived audio token
+    audio_token = security.create_access_token(
+        subject=session_id, expires_delta=timedelta(hours=1)
+    )
+    return f"/api/v1/study/audio/{session_id}?token={audio_token}"
+
+def _playlist_url(session_id: str) -> str:
+    audio_token = security.create_access_token(
+        subject=session_id, expires_delta=timedelta(hours=1)
+    )
+    return f"/api/v1/study/audio/{session_id}/playlist.m3u8?token={audio_token}"
+
+def _session_response(session: dict) -> dict:
+    return {
+        "id": session["_id"],
+        "topic": session["topic"],
+        "content": session["content"],
+        "audio_url": _audio_url(session["_id"]),
+        "playlist_url": _playlist_url(session["_id"]),
+        "listen_count": session.get("listen_count", 0),
+        "speech_marks": speech_marks.from_document(session).to_list(),
+        "created_at": session["created_at"]
+    }
+
+def _entry_fields(entry: dict) -> dict:
+    """Fields a new session's response takes from its shared content entry."""
+    return {field: entry[field] for field in ("content", "speech_marks", "speech_marks_packed") if field in entry}
+
+async def _with_marks_if_wanted(
+    db: AsyncIOMotorDatabase, config: ConfigSnapshot, user: UserInDB, study_in: StudyPrompt, session: dict
+) -> dict:
+    """Add speech marks to a hydrated session that was synthesized without them, if this request wants them."""
+    if session.get("content_key") and generation_service.wants_speech_marks(config, user, study_in):
+        return await generation_service.ensure_speech_marks(db, session["content_key"], session)
+    return session
+
+def _check_generation_allowed(
+    config: ConfigSnapshot, current_user: UserInDB, study_in: StudyPrompt, now: datetime, pending: int = 0
+) -> None:
+    """
+    Plan access and daily limit checks shared by every generation entry point.
+
+    pending counts queued jobs that will use up daily generations once they finish.
+    """
+    daily_limit = config.daily_limit
 
     # Check duration access
-    duration_access = plan_access.get("durations", {}).get(str(study_in.duration_minutes), ["paid"])
-    if current_user.plan not in duration_access:
+    if not config.duration_allowed(current_user.plan, study_in.duration_minutes):
         raise HTTPException(
             status_code=403,
             detail=f"Your plan ({current_user.plan}) does not have access to {study_in.duration_minutes}-minute sessions."
@@ -58,171 +95,505 @@ async def generate_study_session(
 
     # Check feature access (Exam Mode)
     if study_in.exam_mode:
-        exam_mode_access = plan_access.get("exam_mode", ["paid"])
-        if current_user.plan not in exam_mode_access:
+        if not config.feature_allowed(current_user.plan, "exam_mode"):
             raise HTTPException(
                 status_code=403,
                 detail=f"Exam Mode is not available for your plan ({current_user.plan})."
             )
 
     # Check daily generation limit
-    now = datetime.utcnow()
     today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     
     # Reset daily count if it's a new day
     if not current_user.last_generation_date or current_user.last_generation_date < today:
         current_user.daily_generations = 0
     
-    if current_user.daily_generations >= daily_limit:
+    if current_user.daily_generations + pending >= daily_limit:
         raise HTTPException(
             status_code=403,
             detail=f"Daily generation limit reached ({daily_limit} sessions). Please try again tomorrow or upgrade."
         )
-    
-    # 1. Check Cache (Optimization)
-    existing_session = await db["study_sessions"].find_one({
+
+async def _find_user_session(
+    db: AsyncIOMotorDatabase, current_user: UserInDB, study_in: StudyPrompt
+) -> Optional[dict]:
+    """This user's earlier session for exactly the same request, if any."""
+    return await db["study_sessions"].find_one({
         "user_id": current_user.id,
         "topic": study_in.topic,
         "duration_minutes": study_in.duration_minutes,
         "exam_mode": study_in.exam_mode,
         "prompt": study_in.prompt
-    })
+    }, {"audio_data": 0})
+
+def _media_token_payload(token: str) -> dict:
+    try:
+        return jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+    except Exception:
+        raise HTTPException(status_code=403, detail="Invalid or expired audio token")
+
+def _verify_media_token(token: str, subject: str) -> None:
+    """Check a short-lived media token issued for subject."""
+    if _media_token_payload(token).get("sub") != subject:
+        raise HTTPException(status_code=403, detail="Invalid audio token")
+
+def _verify_scoped_token(token: str, prefix: str) -> tuple[str, datetime]:
+    """
+    Check a media token whose subject is prefix:<scope>; returns (scope,
+    expiry) so callers can tell tokens of the same resource apart.
+    """
+    payload = _media_token_payload(token)
+    scope = payload.get("sub", "").removeprefix(f"{prefix}:")
+    if scope == payload.get("sub", "") or not scope:
+        raise HTTPException(status_code=403, detail="Invalid audio token")
+    return scope, datetime.utcfromtimestamp(payload["exp"])
+
+def _job_response(job: dict, session: Optional[dict] = None) -> dict:
+    stage = job["stage"]
+    return {
+        "id": job["_id"],
+        "status": job["status"],
+        "stage": stage,
+        "progress": STAGES.index(stage) / (len(STAGES) - 1) if stage in STAGES else 0.0,
+        "error": job.get("error") if job["status"] == "failed" else None,
+        "session": _session_response(session) if session else None,
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.get("/config", response_model=AppConfig)
+async def get_public_config(
+    request: Request,
+    response: Response,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserInDB = Depends(deps.get_current_active_user),
+) -> Any:
+    config = await config_cache.get(db)
+    headers = {"ETag": config.etag, "Cache-Control": "private, no-cache"}
+    if http_range.etag_matches(request.headers.get("if-none-match"), config.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return config.public()
+
+def _request_hash(study_in: StudyPrompt) -> str:
+    """
+    Fingerprint of the request body alone; unlike the content key it does
+    not change when the admin config does, so a retry still matches.
+    """
+    body = json.dumps(jsonable_encoder(study_in), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+@router.post("/generate", response_model=StudySessionResponse)
+async def generate_study_session(
+    *,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserInDB = Depends(deps.get_current_active_user),
+    study_in: StudyPrompt,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    _ = Depends(generation_limiter)
+) -> Any:
+    # Fetch dynamic config
+    with metrics.timer("config"):
+        config = await config_cache.get(db)
+    content_key = generation_service.content_key(config, study_in)
+
+    # A retried request gets the stored result, even if limits have since been reached
+    idempotency_id = f"{current_user.id}:{idempotency_key}" if idempotency_key else None
+    request_hash = _request_hash(study_in)
+    if idempotency_id:
+        previous = await db["idempotency_keys"].find_one({"_id": idempotency_id})
+        if previous:
+            # Keys stored before request hashes were recorded are taken as matching
+            if previous.get("request_hash", request_hash) != request_hash:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was already used for a different request."
+                )
+            session = await db["study_sessions"].find_one({"_id": previous["session_id"]}, {"audio_data": 0})
+            if session:
+                await content_cache.hydrate(db, [session])
+                return _session_response(session)
+
+    now = datetime.utcnow()
+    _check_generation_allowed(config, current_user, study_in, now)
+
+    # 1. Check Cache (Optimization): this user's identical earlier session
+    with metrics.timer("session_lookup"):
+        existing_session = await _find_user_session(db, current_user, study_in)
+    metrics.cache_requests.inc(cache="user_session", result="hit" if existing_session else "miss")
     
     if existing_session:
-        return {
-            "id": existing_session["_id"],
-            "topic": existing_session["topic"],
-            "content": existing_session["content"],
-            "audio_url": f"/api/v1/study/audio/{existing_session['_id']}",
-            "listen_count": existing_session.get("listen_count", 0),
-            "speech_marks": existing_session.get("speech_marks", []),
-            "created_at": existing_session["created_at"]
-        }
+        await content_cache.hydrate(db, [existing_session])
+        existing_session = await _with_marks_if_wanted(db, config, current_user, study_in, existing_session)
+        return _session_response(existing_session)
 
-    # 2. Generate content
-    content, openai_usage = await study_service.generate_content(
-        db=db,
-        topic=study_in.topic,
-        duration_minutes=study_in.duration_minutes,
-        prompt=study_in.prompt,
-        exam_mode=study_in.exam_mode,
-        system_prompt_override=study_in.system_prompt
+    # 2. Shared content cache across users, else generate content and audio,
+    # then link a new session for this user to the shared entry
+    session_dict, entry = await generation_service.generate_session(
+        db, current_user, study_in, config, content_key, now
     )
-    
-    # 3. Synthesize audio and speech marks
-    audio_data, speech_marks, polly_usage = await polly_service.text_to_speech(content)
-    
-    # 4. Calculate Costs (Cost Awareness)
-    # GPT-4 rates: $0.03/1k input, $0.06/1k output (approximate average $0.045/1k)
-    openai_cost = (openai_usage / 1000) * 0.045
-    # Polly Neural: $16.00 per 1M characters
-    polly_cost = (polly_usage / 1000000) * 16.00
-    total_cost = openai_cost + polly_cost
-
-    session_id = str(uuid.uuid4())
-    
-    session_dict = {
-        "_id": session_id,
-        "user_id": current_user.id,
-        "topic": study_in.topic,
-        "prompt": study_in.prompt,
-        "content": content,
-        "audio_data": audio_data,
-        "speech_marks": speech_marks,
-        "duration_minutes": study_in.duration_minutes,
-        "exam_mode": study_in.exam_mode,
-        "listen_count": 0,
-        "created_at": now
-    }
-    
-    await db["study_sessions"].insert_one(session_dict)
-    
-    # Update user usage
-    await db["users"].update_one(
-        {"_id": current_user.id},
-        {
-            "$set": {"last_generation_date": now},
-            "$inc": {"daily_generations": 1}
-        }
+
+    if idempotency_id:
+        await db["idempotency_keys"].update_one(
+            {"_id": idempotency_id},
+            {"$setOnInsert": {
+                "user_id": current_user.id,
+                "request_hash": request_hash,
+                "content_key": content_key,
+                "session_id": session_dict["_id"],
+                "created_at": now
+            }},
+            upsert=True
+        )
+
+    return _session_response({**session_dict, **_entry_fields(entry)})
+
+@router.post("/generate/stream")
+async def generate_study_session_stream(
+    *,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserInDB = Depends(deps.get_current_active_user),
+    study_in: StudyPrompt,
+    _ = Depends(generation_limiter)
+) -> Any:
+    """
+    Server-sent events version of /generate.
+
+    Emits "delta" events with generated text, "segment" events with an
+    audio_url and speech marks for each synthesized piece as it becomes
+    ready, then "done" with the same body /generate returns (or "error").
+    """
+    config = await config_cache.get(db)
+    now = datetime.utcnow()
+    _check_generation_allowed(config, current_user, study_in, now)
+    content_key = generation_service.content_key(config, study_in)
+
+    existing_session = await _find_user_session(db, current_user, study_in)
+
+    async def events():
+        if existing_session:
+            await content_cache.hydrate(db, [existing_session])
+            yield _sse("delta", {"text": existing_session["content"]})
+            session = await _with_marks_if_wanted(db, config, current_user, study_in, existing_session)
+            yield _sse("done", _session_response(session))
+            return
+
+        with_marks = generation_service.wants_speech_marks(config, current_user, study_in)
+        entry = await content_cache.get(db, content_key)
+        cache_hit = entry is not None
+        if cache_hit:
+            yield _sse("delta", {"text": entry["content"]})
+            if with_marks:
+                entry = await generation_service.ensure_speech_marks(db, content_key, entry)
+        else:
+            stream_id = uuid.uuid4().hex
+            # Scoped to the user so segment fetches count against their audio limit
+            segment_token = security.create_access_token(
+                subject=f"{stream_id}:{current_user.id}", expires_delta=timedelta(hours=1)
+            )
+            try:
+                # Identical requests in flight share one generation
+                async for kind, data in generation_service.stream_once(
+                    db, content_key, config, study_in, stream_id, with_marks
+                ):
+                    if kind in ("entry", "shared"):
+                        entry, cache_hit = data, kind == "shared"
+                        continue
+                    if kind == "segment":
+                        data["audio_url"] = (
+                            f"/api/v1/study/stream/{stream_id}/segments/{data['index']}?token={segment_token}"
+                        )
+                    yield _sse(kind, data)
+            except Exception as e:
+                logger.error(f"Streaming generation failed: {e}")
+                yield _sse("error", {"detail": "Generation failed. Please try again."})
+                return
+
+        session_dict = await generation_service.create_session(
+            db, current_user, study_in, entry, cache_hit, now
+        )
+        yield _sse("done", _session_response(
+            {**session_dict, **_entry_fields(entry)}
+        ))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    
-    # Store usage and cost
-    usage_dict = {
-        "session_id": session_id,
-        "user_id": current_user.id,
-        "openai_tokens": openai_usage,
-        "polly_characters": polly_usage,
-        "openai_cost": openai_cost,
-        "polly_cost": polly_cost,
-        "total_cost": total_cost,
-        "created_at": now
-    }
-    await db["usage"].insert_one(usage_dict)
-    
-    # Generate short-lived audio token
-    audio_token = security.create_access_token(
-        subject=session_id, expires_delta=timedelta(hours=1)
+
+@router.get("/stream/{stream_id}/segments/{index}")
+async def get_stream_segment(
+    stream_id: str,
+    index: int,
+    token: str,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+) -> Any:
+    """
+    A segment of a generation in progress, for live playback only: each one
+    can be fetched STREAM_SEGMENT_MAX_FETCHES times, and the first segment
+    counts against the audio rate limit like any other listen.
+    """
+    user_id, _ = _verify_scoped_token(token, stream_id)
+    segment = await db["stream_segments"].find_one_and_update(
+        {"_id": f"{stream_id}:{index}", "fetches": {"$not": {"$gte": settings.STREAM_SEGMENT_MAX_FETCHES}}},
+        {"$inc": {"fetches": 1}}
     )
-    
-    return {
-        "id": session_id,
-        "topic": study_in.topic,
-        "content": content,
-        "audio_url": f"/api/v1/study/audio/{session_id}?token={audio_token}",
-        "listen_count": 0,
-        "speech_marks": speech_marks,
-        "created_at": session_dict["created_at"]
-    }
+    if not segment:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    if index == 0 and not segment.get("fetches"):
+        await audio_limiter.hit(f"user:{user_id}")
+    return Response(
+        content=bytes(segment["audio"]),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "private, max-age=3600"}
+    )
+
+@router.post("/jobs", response_model=StudyJobResponse, status_code=202)
+async def create_study_job(
+    *,
+    response: Response,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserInDB = Depends(deps.get_current_active_user),
+    study_in: StudyPrompt,
+    _ = Depends(generation_limiter)
+) -> Any:
+    """
+    Queue a generation and return right away.
+
+    Poll the job's Location for its stage; once completed it carries the same
+    session /generate returns.
+    """
+    config = await config_cache.get(db)
+    now = datetime.utcnow()
+    pending = await job_queue.pending_count(db, current_user.id)
+    _check_generation_allowed(config, current_user, study_in, now, pending=pending)
+    content_key = generation_service.content_key(config, study_in)
+
+    existing_session = await _find_user_session(db, current_user, study_in)
+    job = await job_queue.enqueue(
+        db,
+        current_user.id,
+        study_in.dict(),
+        content_key,
+        session_id=existing_session["_id"] if existing_session else None
+    )
+    response.headers["Location"] = f"{settings.API_V1_STR}/study/jobs/{job['_id']}"
+
+    if existing_session:
+        await content_cache.hydrate(db, [existing_session])
+    return _job_response(job, existing_session)
+
+@router.get("/jobs/{job_id}", response_model=StudyJobResponse)
+async def get_study_job(
+    job_id: str,
+    response: Response,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserInDB = Depends(deps.get_current_active_user),
+) -> Any:
+    job = await job_queue.get(db, job_id)
+    if not job or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-@router.get("/history", response_model=List[StudySessionResponse])
+    session = None
+    if job.get("session_id"):
+        session = await db["study_sessions"].find_one({"_id": job["session_id"]}, {"audio_data": 0})
+        if session:
+            await content_cache.hydrate(db, [session])
+    if job["status"] in (QUEUED, RUNNING):
+        response.headers["Retry-After"] = str(max(1, round(settings.JOB_POLL_SECONDS)))
+    return _job_response(job, session)
+
+@router.get("/history", response_model=List[Union[StudySessionResponse, StudySessionSummary]])
 async def get_study_history(
+    response: Response,
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: UserInDB = Depends(deps.get_current_active_user),
+    summary: bool = Query(False, description="Only id, topic, duration and date; fetch the rest per session"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    since: Optional[str] = Query(None, description="X-Sync-Cursor of the last sync; returns only newer sessions"),
+    limit: int = Query(100, ge=1, le=100),
 ) -> Any:
-    cursor = db["study_sessions"].find({"user_id": current_user.id}).sort("created_at", -1)
-    sessions = await cursor.to_list(length=100)
-    
+    """
+    Newest sessions first. X-Next-Cursor pages further back; X-Sync-Cursor
+    is where the next ?since= sync should start (X-Sync-More: 1 means
+    there are more new sessions than one response holds).
+    """
+    query = {"user_id": current_user.id}
+    projection = HISTORY_SUMMARY_FIELDS if summary else HISTORY_FULL_FIELDS
+
+    if since:
+        sessions, sync_cursor, more = await pagination.keyset_since(
+            db["study_sessions"], query, projection, since, limit
+        )
+        if more:
+            response.headers["X-Sync-More"] = "1"
+    else:
+        sessions, next_cursor = await pagination.keyset_page(
+            db["study_sessions"], query, projection, cursor, limit
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        # The first page starts the sync; older pages don't move it
+        sync_cursor = pagination.cursor_for(sessions[0]) if sessions and not cursor else None
+    if sync_cursor:
+        response.headers["X-Sync-Cursor"] = sync_cursor
+
+    if summary:
+        return [
+            {
+                "id": s["_id"],
+                "topic": s["topic"],
+                "duration_minutes": s.get("duration_minutes"),
+                "created_at": s["created_at"]
+            }
+            for s in sessions
+        ]
+
+    await content_cache.hydrate(db, sessions, fields=("content",))
     return [
         {
             "id": s["_id"],
             "topic": s["topic"],
             "content": s["content"],
-            "audio_url": f"/api/v1/study/audio/{s['_id']}?token={security.create_access_token(subject=s['_id'], expires_delta=timedelta(hours=1))}",
+            "audio_url": _audio_url(s["_id"]),
             "created_at": s["created_at"]
         }
         for s in sessions
     ]
 
-@router.get("/audio/{session_id}")
-async def get_study_audio(
+@router.get("/sessions/{session_id}", response_model=StudySessionResponse)
+async def get_study_session(
     session_id: str,
-    token: str,
     db: AsyncIOMotorDatabase = Depends(get_database),
-    _ = Depends(audio_limiter)
+    current_user: UserInDB = Depends(deps.get_current_active_user),
 ) -> Any:
-    # Verify short-lived token
-    try:
-        from jose import jwt
-        from app.core.config import settings
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
-        if payload.get("sub") != session_id:
-            raise HTTPException(status_code=403, detail="Invalid audio token")
-    except Exception:
-        raise HTTPException(status_code=403, detail="Invalid or expired audio token")
+    """Full content, speech marks and a fresh audio URL for one session."""
+    session = await db["study_sessions"].find_one(
+        {"_id": session_id, "user_id": current_user.id}, {"audio_data": 0}
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    await content_cache.hydrate(db, [session], fields=("content", "speech_marks", "speech_marks_packed"))
+    return _session_response(session)
 
-    session = await db["study_sessions"].find_one({"_id": session_id})
+@router.get("/sessions/{session_id}/marks", response_model=SpeechMarksWindow)
+async def get_speech_marks(
+    session_id: str,
+    from_ms: int = Query(0, ge=0),
+    to_ms: Optional[int] = Query(None, ge=0),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserInDB = Depends(deps.get_current_active_user),
+) -> Any:
+    """Speech marks for one stretch of playback, for highlighting as the audio plays."""
+    session = await db["study_sessions"].find_one(
+        {"_id": session_id, "user_id": current_user.id},
+        {"content_key": 1, "speech_marks": 1, "speech_marks_packed": 1}
+    )
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    
+
+    key = session.get("content_key")
+    marks = speech_marks.decoded_cache.get(key) if key else None
+    if marks is None:
+        await content_cache.hydrate(
+            db, [session], fields=("content", "speech_marks", "speech_marks_packed", "speech_timeline")
+        )
+        if key and not generation_service.has_speech_marks(session):
+            # Synthesized without highlighting; fetch the marks now if the plan includes it
+            config = await config_cache.get(db)
+            if not config.highlighting_allowed(current_user.plan):
+                raise HTTPException(
+                    status_code=403,
+                    detail=f"Text highlighting is not available for your plan ({current_user.plan})."
+                )
+            session = await generation_service.ensure_speech_marks(db, key, session)
+        marks = speech_marks.from_document(session)
+        if key:
+            speech_marks.decoded_cache.set(key, marks)
+
+    return {"from_ms": from_ms, "to_ms": to_ms, "speech_marks": marks.window(from_ms, to_ms)}
+
+# Fields get_study_audio and the HLS endpoints need from a session
+AUDIO_SESSION_FIELDS = ("user_id", "content_key", "audio_file_id", "audio_frame_index", "audio_size", "audio_duration_ms", "created_at")
+
+async def _audio_session(db: AsyncIOMotorDatabase, session_id: str) -> dict:
+    """Audio metadata and current listen count of a session, cached per process."""
+    session = audio_cache.sessions.get(session_id)
+    if session is None:
+        session = await db["study_sessions"].find_one({"_id": session_id}, {"audio_data": 0})
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        await content_cache.hydrate(
+            db, [session], fields=("audio_file_id", "audio_frame_index", "audio_size", "audio_duration_ms")
+        )
+        if session.get("audio_file_id"):
+            audio_cache.sessions.set(session_id, {field: session.get(field) for field in AUDIO_SESSION_FIELDS})
+        return session
+
+    # Only the listen count changes after creation; this read also
+    # notices a session deleted since it was cached
+    current = await db["study_sessions"].find_one({"_id": session_id}, {"listen_count": 1})
+    if not current:
+        audio_cache.invalidate_session(session_id)
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {**session, "listen_count": current.get("listen_count", 0)}
+
+async def _open_audio(db: AsyncIOMotorDatabase, session_id: str, session: dict):
+    """
+    Resolve a session's audio without reading the body yet.
+
+    Returns (size, local path or None, etag, read_range) where read_range
+    yields bytes start..end inclusive.
+    """
+    file_id = session.get("audio_file_id")
+    cached_audio = audio_cache.get(file_id) if file_id else None
+    if cached_audio is not None:
+        async def read_cached(start: int, end: int):
+            yield cached_audio[start:end + 1]
+        return len(cached_audio), None, f'"{file_id}"', read_cached
+
+    if file_id:
+        try:
+            handle = await audio_store.open(db, file_id)
+        except AudioNotFound:
+            logger.error(f"Audio {file_id} for session {session_id} is missing from the store")
+            raise HTTPException(status_code=404, detail="Audio not found")
+        # Local files are already served from the page cache; keep memory
+        # for audio that would otherwise come over the network
+        if handle.path is None and audio_cache.should_admit(file_id, handle.size):
+            audio_data = await handle.read()
+            audio_cache.put(file_id, audio_data)
+
+            async def read_admitted(start: int, end: int):
+                yield audio_data[start:end + 1]
+            return handle.size, None, f'"{file_id}"', read_admitted
+        return handle.size, handle.path, f'"{file_id}"', handle.read_range
+
+    # Legacy session with the audio still embedded in the document
+    legacy = await db["study_sessions"].find_one({"_id": session_id}, {"audio_data": 1})
+    legacy_data = bytes(legacy.get("audio_data") or b"")
+
+    async def read_legacy(start: int, end: int):
+        yield legacy_data[start:end + 1]
+    return len(legacy_data), None, f'"{session_id}-{len(legacy_data)}"', read_legacy
+
+async def _count_listen(db: AsyncIOMotorDatabase, session_id: str, session: dict) -> None:
+    """Rate-limit a listen and enforce and count the trial listen limit."""
+    await audio_limiter.hit(f"user:{session['user_id']}")
+
     # Get user to check plan and listen count
     user = await db["users"].find_one({"_id": session["user_id"]})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     current_user = UserInDB(**user)
-    
+
     # Check listen limit for trial users
     if current_user.plan == UserPlan.TRIAL:
         if session.get("listen_count", 0) >= 3:
@@ -230,18 +601,246 @@ async def get_study_audio(
                 status_code=403,
                 detail="Trial users can listen to each session a maximum of 3 times. Please upgrade for unlimited listens."
             )
-        
+
         # Increment listen count
         await db["study_sessions"].update_one(
             {"_id": session_id},
             {"$inc": {"listen_count": 1}}
         )
-    
+
+async def _claim_listen(db: AsyncIOMotorDatabase, session_id: str, token: str, expires_at: datetime) -> Optional[str]:
+    """
+    Mark a listen as started with this media token until expires_at.
+    Returns the mark's id, or None when the token already has a live mark.
+    """
+    now = datetime.utcnow()
+    mark_id = hashlib.sha256(f"{session_id}:{token}".encode("utf-8")).hexdigest()
+    try:
+        # Replaces a mark that has expired but not been removed yet
+        await db["listen_starts"].update_one(
+            {"_id": mark_id, "expires_at": {"$lt": now}},
+            {"$set": {"expires_at": expires_at}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    return mark_id
+
+async def _start_listen(
+    db: AsyncIOMotorDatabase, session_id: str, session: dict, token: str, expires_at: Optional[datetime] = None
+) -> None:
+    """Count a listen, once per media token until expires_at (by default LISTEN_DEDUPE_SECONDS)."""
+    if expires_at is None:
+        expires_at = datetime.utcnow() + timedelta(seconds=settings.LISTEN_DEDUPE_SECONDS)
+    mark_id = await _claim_listen(db, session_id, token, expires_at)
+    if mark_id is None:
+        return
+    try:
+        await _count_listen(db, session_id, session)
+    except BaseException:
+        # A rejected listen must be checked again next time
+        await db["listen_starts"].delete_one({"_id": mark_id})
+        raise
+
+async def _with_rendition(
+    db: AsyncIOMotorDatabase, session_id: str, session: dict, quality: Optional[str], request: Request
+):
+    """Point session at the requested rendition of its audio; returns (session, media type)."""
+    try:
+        name = renditions.choose(quality, request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Sessions from before the shared content cache only have the original
+    if name == renditions.ORIGINAL or not session.get("content_key"):
+        return session, "audio/mpeg"
+    try:
+        rendition = await rendition_service.get(db, session["content_key"], name, session["user_id"], session_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return {**session, **rendition}, rendition["media_type"]
+
+def _segments(session: dict, size: int) -> list:
+    return mp3.segment_bounds(
+        session.get("audio_frame_index") or [],
+        size,
+        settings.HLS_SEGMENT_SECONDS * 1000,
+        session.get("audio_duration_ms")
+    )
+
+@router.get("/audio/{session_id}")
+async def get_study_audio(
+    session_id: str,
+    token: str,
+    request: Request,
+    t: Optional[float] = Query(None, ge=0, description="Start playback at this offset in seconds"),
+    quality: Optional[str] = Query(
+        None, description="original, mp3_16k, mp3_22k, mp3_24k or ogg; by default from the Save-Data/ECT hints"
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+) -> Any:
+    # Verify short-lived token
+    _verify_media_token(token, session_id)
+
+    session = await _audio_session(db, session_id)
+    session, media_type = await _with_rendition(db, session_id, session, quality, request)
+    size, audio_path, etag, read_range = await _open_audio(db, session_id, session)
+
+    last_modified = session["created_at"]
+    headers = {
+        "Content-Disposition": "inline",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": http_range.http_date(last_modified),
+        "Cache-Control": "private, max-age=3600",
+    }
+    if quality is None:
+        headers["Vary"] = "Save-Data, ECT"
+
+    # Revalidation never counts as a listen
+    if http_range.is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    if t is not None and "range" not in request.headers:
+        offset = mp3.offset_for_time(session.get("audio_frame_index", []), t * 1000)
+        ranges = [(offset, size - 1)] if offset < size else None
+    elif http_range.if_range_allows(request.headers, etag, last_modified):
+        try:
+            ranges = http_range.parse_range(request.headers.get("range"), size)
+        except http_range.RangeNotSatisfiable:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+    # Only a request from the start of the file is a new listen; seeks and
+    # resumes continue one, unless nothing has been played yet. Probes never
+    # count, and players re-requesting the start count once per token.
+    listen_count = session.get("listen_count", 0)
+    is_probe = ranges is not None and sum(end - start + 1 for start, end in ranges) <= LISTEN_PROBE_MAX_BYTES
+    is_new_listen = t is None and (ranges is None or (len(ranges) == 1 and ranges[0][0] == 0))
+    if not is_probe and (is_new_listen or listen_count == 0):
+        await _start_listen(db, session_id, session, token)
+
+    if ranges is None:
+        if audio_path:
+            # Local disk: FileResponse streams the file from disk in chunks
+            # without loading it into memory
+            return FileResponse(audio_path, media_type=media_type, headers=headers)
+        return StreamingResponse(
+            read_range(0, size - 1),
+            media_type=media_type,
+            headers={**headers, "Content-Length": str(size)}
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return StreamingResponse(
+            read_range(start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1)
+            }
+        )
+
+    boundary = uuid.uuid4().hex
+    parts, closing, total_length = http_range.multipart_layout(ranges, size, media_type, boundary)
+
+    async def multipart_body():
+        for part_header, start, end in parts:
+            yield part_header
+            async for data in read_range(start, end):
+                yield data
+        yield closing
+
     return StreamingResponse(
-        io.BytesIO(session["audio_data"]),
+        multipart_body(),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers={**headers, "Content-Length": str(total_length)}
+    )
+
+@router.get("/audio/{session_id}/playlist.m3u8")
+async def get_study_playlist(
+    session_id: str,
+    token: str,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+) -> Any:
+    """
+    HLS playlist splitting the session's audio into segments of about
+    HLS_SEGMENT_SECONDS, cut on MP3 frame boundaries.
+
+    Every fetch hands out a new segment token, valid for the audio's
+    duration plus HLS_TOKEN_GRACE_SECONDS; the first segment requested
+    with it starts a listen, like requesting the audio from the beginning.
+    """
+    _verify_media_token(token, session_id)
+    session = await _audio_session(db, session_id)
+    size = session.get("audio_size")
+    if size is None:
+        size, _, _, _ = await _open_audio(db, session_id, session)
+    segments = _segments(session, size)
+    total_ms = sum(duration for _, _, duration in segments)
+    segment_token = security.create_access_token(
+        subject=f"{session_id}:{uuid.uuid4().hex}",
+        expires_delta=timedelta(milliseconds=total_ms, seconds=settings.HLS_TOKEN_GRACE_SECONDS)
+    )
+
+    target = max((math.ceil(duration / 1000) for _, _, duration in segments), default=1)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for index, (_, _, duration) in enumerate(segments):
+        lines.append(f"#EXTINF:{duration / 1000:.3f},")
+        lines.append(f"segments/{index}.mp3?token={segment_token}")
+    lines.append("#EXT-X-ENDLIST")
+
+    return Response(
+        "\n".join(lines) + "\n",
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": "private, no-cache"}
+    )
+
+@router.get("/audio/{session_id}/segments/{index}.mp3")
+async def get_study_segment(
+    session_id: str,
+    index: int,
+    token: str,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+) -> Any:
+    """
+    One playlist segment. Audio never changes, so segments are cached for
+    good; the first segment fetched with a playlist's token counts a listen.
+    """
+    _, expires_at = _verify_scoped_token(token, session_id)
+    session = await _audio_session(db, session_id)
+    await _start_listen(db, session_id, session, token, expires_at)
+    size, _, etag, read_range = await _open_audio(db, session_id, session)
+    segments = _segments(session, size)
+    if not 0 <= index < len(segments):
+        raise HTTPException(status_code=404, detail="Segment not found")
+
+    start, end, _ = segments[index]
+    etag = f'{etag[:-1]}-{index}"'
+    last_modified = session["created_at"]
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_range.http_date(last_modified),
+        "Cache-Control": "private, max-age=31536000, immutable",
+    }
+    if http_range.is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    return StreamingResponse(
+        read_range(start, end),
         media_type="audio/mpeg",
-        headers={
-            "Content-Disposition": "inline",
-            "Accept-Ranges": "bytes"
-        }
+        headers={**headers, "Content-Length": str(end - start + 1)}
     )
@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from app.api import deps
 from app.schemas.user import UserInDB, UserResponse, UserPlan
 from app.db.mongodb import get_database
+from app.core.auth_cache import auth_cache
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import logging
 
@@ -38,6 +39,8 @@ async def upgrade_to_premium(
             detail="Failed to upgrade plan. Please try again."
         )
     
+    auth_cache.invalidate_user(current_user.id)
+
     # Fetch updated user
     updated_user = await db["users"].find_one({"_id": current_user.id})
     
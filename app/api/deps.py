@@ -5,9 +5,11 @@ from jose import jwt
 from pydantic import ValidationError
 from app.core.config import settings
 from app.core import security
+from app.core.auth_cache import auth_cache
 from app.db.mongodb import get_database
 from app.schemas.user import TokenPayload, UserInDB
 from motor.motor_asyncio import AsyncIOMotorDatabase
+import time
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
@@ -17,20 +19,31 @@ async def get_current_user(
     db: AsyncIOMotorDatabase = Depends(get_database),
     token: str = Depends(reusable_oauth2)
 ) -> UserInDB:
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-    except (jwt.JWTError, ValidationError):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
-    user = await db["users"].find_one({"_id": token_data.sub})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return UserInDB(**user)
+    token_data = auth_cache.tokens.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+            )
+            token_data = TokenPayload(**payload)
+        except (jwt.JWTError, ValidationError):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        # Never keep a token cached past its own expiry
+        lifetime = payload["exp"] - time.time() if "exp" in payload else None
+        auth_cache.tokens.set(token, token_data, ttl=lifetime)
+
+    user = auth_cache.users.get(token_data.sub)
+    if user is None:
+        user_doc = await db["users"].find_one({"_id": token_data.sub})
+        if not user_doc:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = UserInDB(**user_doc)
+        auth_cache.users.set(token_data.sub, user)
+    # Handlers may mutate the user they get; keep the cached snapshot intact
+    return user.copy()
 
 def get_current_active_user(
     current_user: UserInDB = Depends(get_current_user),
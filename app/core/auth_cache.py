@@ -0,0 +1,33 @@
+from app.core.config import settings
+from app.core.ttl_cache import TTLCache
+
+
+class AuthCache:
+    """
+    Caches decoded access tokens and user snapshots for get_current_user.
+
+    Entries live at most AUTH_CACHE_TTL_SECONDS, which is the maximum time
+    any worker can act on a stale user (plan, is_active, password). Writers
+    in this process call invalidate_user() so the change is visible here
+    immediately; other workers catch up within the TTL.
+    """
+
+    def __init__(self):
+        self.tokens = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+        self.users = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+
+    def invalidate_user(self, user_id: str) -> None:
+        self.users.pop(user_id)
+
+    def clear(self) -> None:
+        self.tokens.clear()
+        self.users.clear()
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": settings.AUTH_CACHE_TTL_SECONDS,
+            "tokens": self.tokens.stats(),
+            "users": self.users.stats(),
+        }
+
+auth_cache = AuthCache()
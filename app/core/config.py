@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Study.io"
@@ -8,19 +8,111 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URL: str
     DATABASE_NAME: str = "study_io"
+    MONGODB_ENSURE_INDEXES: bool = True  # Apply app.db.indexes on startup
     
     # JWT
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+
+    # Password hashing: bcrypt cost, and the per-process pool it runs on.
+    # Changing BCRYPT_ROUNDS rehashes each user's password at their next login.
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 64  # Waiting hashes beyond this get a 503
+
+    # Logging: "json" or "text"; LOG_SAMPLE_RATES maps logger names to the
+    # fraction of their DEBUG/INFO records kept, e.g. {"app.services.polly_service": 0.1}
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+    LOG_MAX_FIELD_CHARS: int = 2000
+    LOG_QUEUE_SIZE: int = 10000  # Records beyond this are dropped rather than blocking
+
+    # Prometheus /metrics; when set, scrapers must send "Authorization: Bearer <token>"
+    METRICS_TOKEN: Optional[str] = None
+
+    # Auth cache (per worker): max seconds a stale user/plan can be served
+    AUTH_CACHE_TTL_SECONDS: float = 30.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
     
     # AWS
     AWS_ACCESS_KEY_ID: Optional[str] = None
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     AWS_REGION: str = "us-east-1"
+
+    # Polly
+    POLLY_VOICE_ID: str = "Joanna"
+    POLLY_ENGINE: str = "neural"
+    POLLY_CHUNK_SIZE: int = 2500  # Neural allows 3000 billed chars per request
+    POLLY_MAX_CONCURRENCY: int = 4
+    STREAM_SEGMENT_MIN_CHARS: int = 200  # Batch streamed sentences into segments of at least this size
+    STREAM_SEGMENT_MAX_FETCHES: int = 2  # Live playback plus one retry; replays go through /audio
+
+    # Rate limiting: "memory" (per worker) or "mongo" (shared by all workers)
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_MAX_KEYS: int = 100000  # Memory backend LRU bound
+
+    # app_config cache (per worker)
+    CONFIG_CACHE_POLL_SECONDS: float = 5.0  # Max staleness after another worker's update
+    CONFIG_CACHE_MAX_AGE_SECONDS: float = 300.0
+
+    # Generation de-duplication
+    GENERATION_LEASE_SECONDS: int = 120  # Renewed while the leader is working
+    GENERATION_POLL_SECONDS: float = 1.0
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 60 * 60 * 24
+
+    # Background generation jobs
+    GENERATION_WORKERS: int = 2  # In-process workers per API process; 0 to use only `python -m app.workers.generation_worker`
+    JOB_LEASE_SECONDS: int = 60  # Renewed while a worker is running the job
+    JOB_POLL_SECONDS: float = 1.0  # Idle worker poll interval
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE_SECONDS: float = 15.0  # Doubles on each failed attempt
+    JOB_RETRY_MAX_SECONDS: float = 600.0
+    JOB_SWEEP_SECONDS: float = 30.0  # How often jobs abandoned on their last attempt are failed
+    JOB_DRAIN_SECONDS: float = 30.0  # Grace period for running jobs on shutdown
+    JOB_RETENTION_SECONDS: int = 60 * 60 * 24 * 7
+
+    # Audio storage: "gridfs", "local" (files under AUDIO_LOCAL_ROOT) or "s3"
+    AUDIO_BACKEND: str = "gridfs"
+    AUDIO_CHUNK_SIZE_BYTES: int = 255 * 1024  # GridFS chunk and streaming read size
+    AUDIO_LOCAL_ROOT: str = "./data/audio"
+    AUDIO_S3_BUCKET: Optional[str] = None
+    AUDIO_S3_PREFIX: str = "audio/"
+    AUDIO_S3_ENDPOINT_URL: Optional[str] = None  # e.g. a local MinIO for testing
+
+    # Per-sentence synthesized audio shared across sessions
+    TTS_FRAGMENT_CACHE_ENABLED: bool = True
+    TTS_FRAGMENT_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # A sentence gets its own Polly request and cache entry once seen this often;
+    # until then it is batched with its neighbours
+    TTS_FRAGMENT_ADMIT_AFTER: int = 2
+    # How long a sighting of an uncached sentence counts towards admission
+    TTS_FRAGMENT_SIGHTING_TTL_SECONDS: int = 60 * 60 * 24 * 7
+
+    # Shared cache hit/miss counters are written in batches per worker
+    CACHE_STATS_FLUSH_EVERY: int = 100  # Lookups
+    CACHE_STATS_FLUSH_SECONDS: float = 10.0
+
+    # Target length of HLS playlist segments
+    HLS_SEGMENT_SECONDS: int = 6
+    # Segment tokens from one playlist fetch stay valid this long past the audio's duration
+    HLS_TOKEN_GRACE_SECONDS: int = 600
+
+    # Requests from the start of a session's audio with the same media token
+    # within this window are one listen (players re-request and probe)
+    LISTEN_DEDUPE_SECONDS: int = 300
+
+    # Hot-audio cache (per worker) in front of the audio store
+    AUDIO_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    AUDIO_CACHE_MAX_ITEM_BYTES: int = 16 * 1024 * 1024
+    AUDIO_CACHE_ADMIT_AFTER: int = 2  # Requests before a file is cached
+    AUDIO_CACHE_MAX_SESSIONS: int = 10000
+    AUDIO_CACHE_SESSION_TTL_SECONDS: float = 300.0
     
     # OpenAI
     OPENAI_API_KEY: Optional[str] = None
+    OPENAI_MODEL: str = "gpt-4"
     
     # Email Configuration
     SMTP_HOST: Optional[str] = None
@@ -30,6 +122,14 @@ class Settings(BaseSettings):
     EMAIL_FROM: Optional[str] = None
     EMAIL_FROM_NAME: str = "Study.io"
     FRONTEND_URL: str = "http://localhost:5173"
+    SMTP_TIMEOUT_SECONDS: float = 30.0
+    EMAIL_BATCH_SIZE: int = 50  # Emails sent per SMTP connection
+    EMAIL_POLL_SECONDS: float = 2.0
+    EMAIL_LEASE_SECONDS: int = 120  # A batch not finished by then is sent again
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BASE_SECONDS: float = 30.0  # Doubles on each failed attempt
+    EMAIL_RETRY_MAX_SECONDS: float = 3600.0
+    EMAIL_RETENTION_SECONDS: int = 60 * 60 * 24 * 7
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,151 @@
+"""
+Helpers for HTTP byte ranges (RFC 9110 section 14) and conditional requests.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+# Ranges past this count are almost certainly abusive; serve the full body instead
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlap the representation."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a Range header into sorted, merged, inclusive (start, end) pairs.
+
+    Returns None when the header is absent or malformed, in which case the
+    full representation should be sent. Raises RangeNotSatisfiable when the
+    header is valid but no range overlaps [0, size).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                # Open-ended ranges starting at or past the end are valid but
+                # unsatisfiable, not malformed
+                end = int(last) if last else max(start, size - 1)
+                if end < start:
+                    return None
+            elif last:
+                # Suffix range: the final N bytes
+                suffix = int(last)
+                if suffix == 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                return None
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def http_date(dt: datetime) -> str:
+    """Format a (naive UTC or aware) datetime as an IMF-fixdate."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _as_utc_seconds(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.replace(microsecond=0)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match style list against etag."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in header.split(","))
+
+
+def is_not_modified(headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    """True when a GET can be answered with 304 Not Modified."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and _as_utc_seconds(last_modified) <= since
+    return False
+
+
+def if_range_allows(headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Whether a Range header should be honoured given If-Range."""
+    if_range = headers.get("if-range")
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range requires a strong match
+        return if_range == etag and not etag.startswith("W/")
+    since = _parse_http_date(if_range)
+    return since is not None and last_modified is not None and _as_utc_seconds(last_modified) == since
+
+
+def multipart_layout(
+    ranges: List[Tuple[int, int]], size: int, content_type: str, boundary: str
+) -> Tuple[List[Tuple[bytes, int, int]], bytes, int]:
+    """
+    Build the framing for a multipart/byteranges body.
+
+    Returns ([(part_header, start, end), ...], closing_delimiter, total_length).
+    """
+    parts = []
+    total = 0
+    for start, end in ranges:
+        header = (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("ascii")
+        parts.append((header, start, end))
+        total += len(header) + (end - start + 1)
+    closing = f"\r\n--{boundary}--\r\n".encode("ascii")
+    return parts, closing, total + len(closing)
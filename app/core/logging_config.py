@@ -0,0 +1,157 @@
+"""
+Process-wide logging setup: JSON lines, per-logger sampling and a queue so
+request handlers never wait on log I/O.
+
+Loggers keep using logging.getLogger(__name__); structured fields go in
+extra={...} and become top-level JSON keys.
+"""
+from app.core.config import settings
+from app.core import metrics
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import traceback
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _truncate(value, limit: int):
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}... [{len(value) - limit} more chars]"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    # Timestamps are UTC, as the trailing "Z" says
+    converter = time.gmtime
+
+    def __init__(self, max_field_chars: int):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _truncate(record.getMessage(), self.max_field_chars),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = _truncate(value, self.max_field_chars)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, max_field_chars: int):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.max_field_chars = max_field_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, self.max_field_chars)
+        return super().formatMessage(record)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of records from noisy loggers. Rates apply to a
+    logger and its children (longest name wins); WARNING and above are
+    always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix in sorted(self.rates, key=len, reverse=True):
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; drops them if the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now (args may change later), but
+        # leave the formatting to the listener thread
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+
+metrics.registry.register(metrics.Gauge(
+    "studyio_log_records_dropped", "Log records dropped because the log queue was full",
+    lambda: NonBlockingQueueHandler.dropped
+))
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging() -> None:
+    """Install the queue handler on the root logger. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter(settings.LOG_MAX_FIELD_CHARS)
+    else:
+        formatter = TextFormatter(settings.LOG_MAX_FIELD_CHARS)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    handler = NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
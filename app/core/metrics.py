@@ -0,0 +1,212 @@
+"""
+Minimal in-process Prometheus metrics and per-request stage timing.
+
+Metrics are per worker process, like prometheus_client without its
+multiprocess mode; scrape each worker or aggregate by instance.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import bisect
+import time
+
+# Seconds; spans cache lookups (ms) to full generations (a minute or more)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Stages timed during the current request: list of (stage, seconds)
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name} {self.fn()}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_request_seconds = registry.register(Histogram(
+    "studyio_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+))
+stage_seconds = registry.register(Histogram(
+    "studyio_stage_duration_seconds", "Time spent in each request stage", ("stage",)
+))
+rate_limit_rejections = registry.register(Counter(
+    "studyio_rate_limit_rejections_total", "Requests rejected by a rate limiter", ("limiter",)
+))
+cache_requests = registry.register(Counter(
+    "studyio_cache_requests_total", "Cache lookups by result", ("cache", "result")
+))
+cache_evictions = registry.register(Counter(
+    "studyio_cache_evictions_total", "Entries evicted from a bounded cache", ("cache",)
+))
+openai_tokens = registry.register(Counter(
+    "studyio_openai_tokens_total", "OpenAI tokens used for generations"
+))
+polly_characters = registry.register(Counter(
+    "studyio_polly_characters_total", "Characters sent to Polly"
+))
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """Time a block into the stage histogram and the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value; repeated stages (e.g. Polly chunks) are summed."""
+    totals: Dict[str, List[float]] = {}
+    for stage, elapsed in timings:
+        total = totals.setdefault(stage, [0.0, 0])
+        total[0] += elapsed
+        total[1] += 1
+    return ", ".join(
+        f'{stage};dur={seconds * 1000:.1f}' + (f';desc="{count}x"' if count > 1 else "")
+        for stage, (seconds, count) in totals.items()
+    )
+
+
+class MetricsMiddleware:
+    """
+    Times every request and adds a Server-Timing header with the stages
+    recorded through timer() up to the moment the response starts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timings.append(("total", time.perf_counter() - start))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status
+            )
@@ -0,0 +1,116 @@
+"""
+Keyset pagination on (created_at, _id), newest first.
+
+A cursor is the opaque position of the last document of a page; the next
+page is everything strictly before it in (created_at desc, _id desc)
+order, which an index on those two fields serves without skipping.
+
+Documents without created_at (users registered before it was recorded)
+count as older than any that have it, which is also where Mongo sorts
+them.
+"""
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorCollection
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import json
+
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+
+
+def encode_cursor(created_at: Optional[datetime], doc_id: str) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, doc_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, doc_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at is not None else None), doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def before(cursor: str) -> dict:
+    """Filter for documents after cursor in newest-first order."""
+    created_at, doc_id = decode_cursor(cursor)
+    if created_at is None:
+        return {"created_at": None, "_id": {"$lt": doc_id}}
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": doc_id}},
+        {"created_at": None},
+    ]}
+
+
+def after(cursor: str) -> dict:
+    """Filter for documents newer than cursor (incremental sync)."""
+    created_at, doc_id = decode_cursor(cursor)
+    if created_at is None:
+        return {"$or": [
+            {"created_at": None, "_id": {"$gt": doc_id}},
+            {"created_at": {"$ne": None}},
+        ]}
+    return {"$or": [
+        {"created_at": {"$gt": created_at}},
+        {"created_at": created_at, "_id": {"$gt": doc_id}},
+    ]}
+
+
+def created_range(created_from: Optional[datetime], created_to: Optional[datetime]) -> dict:
+    """Filter on created_at; documents without it are older than any created_from."""
+    bounds = {}
+    if created_from:
+        bounds["$gte"] = created_from
+    if created_to:
+        bounds["$lt"] = created_to
+    if not bounds:
+        return {}
+    if not created_from:
+        return {"$or": [{"created_at": bounds}, {"created_at": None}]}
+    return {"created_at": bounds}
+
+
+async def keyset_page(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    projection: dict,
+    cursor: Optional[str],
+    limit: int
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of documents and the cursor for the next page (None at the end)."""
+    if cursor:
+        query = {"$and": [query, before(cursor)]} if query else before(cursor)
+    docs = await collection.find(query, projection).sort(KEYSET_SORT).limit(limit + 1).to_list(length=limit + 1)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, cursor_for(docs[-1])
+
+
+def cursor_for(doc: dict) -> str:
+    return encode_cursor(doc.get("created_at"), doc["_id"])
+
+
+async def keyset_since(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    projection: dict,
+    since: str,
+    limit: int
+) -> Tuple[List[dict], str, bool]:
+    """
+    Documents newer than since, oldest first so a partial batch never skips
+    any. Returns (documents newest first, cursor to sync from next, more).
+    """
+    query = {"$and": [query, after(since)]} if query else after(since)
+    docs = await collection.find(query, projection).sort(
+        [("created_at", 1), ("_id", 1)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+    more = len(docs) > limit
+    docs = docs[:limit]
+    sync_cursor = cursor_for(docs[-1]) if docs else since
+    docs.reverse()
+    return docs, sync_cursor, more
@@ -1,34 +1,140 @@
 from fastapi import HTTPException, Request
-from typing import Dict, List
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import ReturnDocument
+from app.core.config import settings
+from app.core import metrics, security
+from app.core.auth_cache import auth_cache
+from app.db.mongodb import get_database
+import asyncio
+import math
 import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate(previous: int, current: int, now: float, window_seconds: int) -> float:
+    """
+    Sliding-window-counter estimate: the previous fixed window's count is
+    weighted by how much of it still overlaps the sliding window.
+    """
+    elapsed = (now % window_seconds) / window_seconds
+    return previous * (1 - elapsed) + current
+
+
+class MemoryBackend:
+    """
+    Per-process counters, O(1) per request.
+
+    Each key keeps two fixed-window counters. Keys are kept in LRU order and
+    the least recently seen ones are dropped past max_keys.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> [window_index, current_count, previous_count]
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+
+    async def hit(self, key: str, limit: int, window_seconds: int) -> bool:
+        now = time.time()
+        window = math.floor(now / window_seconds)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = [window, 0, 0]
+            self._counters[key] = counter
+            while len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+            if counter[0] != window:
+                # Roll forward; anything older than the previous window is irrelevant
+                counter[2] = counter[1] if counter[0] == window - 1 else 0
+                counter[1] = 0
+                counter[0] = window
+
+        if _estimate(counter[2], counter[1], now, window_seconds) >= limit:
+            return False
+        counter[1] += 1
+        return True
+
+
+class MongoBackend:
+    """
+    Counters shared by every worker: one document per key and fixed window,
+    incremented atomically and removed by a TTL index once no longer needed.
+    """
+
+    collection = "rate_limits"
+
+    async def hit(self, key: str, limit: int, window_seconds: int) -> bool:
+        db = get_database()
+        now = time.time()
+        window = math.floor(now / window_seconds)
+        expires_at = datetime.utcfromtimestamp((window + 2) * window_seconds)
+
+        current, previous = await asyncio.gather(
+            db[self.collection].find_one_and_update(
+                {"_id": f"{key}:{window}"},
+                {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": expires_at}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            ),
+            db[self.collection].find_one({"_id": f"{key}:{window - 1}"}, {"count": 1}),
+        )
+        previous_count = previous["count"] if previous else 0
+        # current already includes this request
+        if _estimate(previous_count, current["count"] - 1, now, window_seconds) >= limit:
+            # Rejected requests don't use up quota
+            await db[self.collection].update_one({"_id": f"{key}:{window}"}, {"$inc": {"count": -1}})
+            return False
+        return True
+
+
+def _make_backend():
+    if settings.RATE_LIMIT_BACKEND == "mongo":
+        return MongoBackend()
+    return MemoryBackend(settings.RATE_LIMIT_MAX_KEYS)
+
+
+def client_key(request: Request) -> str:
+    """Authenticated user id when a valid bearer token is present, else client IP."""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        token_data = auth_cache.tokens.get(token)
+        subject = token_data.sub if token_data else security.decode_token_subject(token)
+        if subject:
+            return f"user:{subject}"
+    return f"ip:{request.client.host}"
+
 
 class RateLimiter:
-    def __init__(self, requests_limit: int, window_seconds: int):
+    def __init__(self, requests_limit: int, window_seconds: int, name: str = "default", backend=None):
         self.requests_limit = requests_limit
         self.window_seconds = window_seconds
-        self.requests: Dict[str, List[float]] = {}
+        self.name = name
+        self.backend = backend or _make_backend()
 
-    async def __call__(self, request: Request):
-        # Get client IP or user ID
-        # For simplicity, we'll use client IP
-        client_id = request.client.host
-        
-        now = time.time()
-        if client_id not in self.requests:
-            self.requests[client_id] = []
-        
-        # Filter out old requests
-        self.requests[client_id] = [t for t in self.requests[client_id] if now - t < self.window_seconds]
-        
-        if len(self.requests[client_id]) >= self.requests_limit:
+    async def hit(self, key: str) -> None:
+        """Count one request for key, raising 429 when over the limit."""
+        try:
+            allowed = await self.backend.hit(f"{self.name}:{key}", self.requests_limit, self.window_seconds)
+        except Exception as e:
+            # Fail open: a limiter outage shouldn't take the API down with it
+            logger.error(f"Rate limiter {self.name} backend error: {e}")
+            return
+        if not allowed:
+            metrics.rate_limit_rejections.inc(limiter=self.name)
             raise HTTPException(
                 status_code=429,
                 detail="Too many requests. Please try again later."
             )
-        
-        self.requests[client_id].append(now)
+
+    async def __call__(self, request: Request):
+        await self.hit(client_key(request))
 
 # 10 generations per hour
-generation_limiter = RateLimiter(requests_limit=10, window_seconds=3600)
+generation_limiter = RateLimiter(requests_limit=10, window_seconds=3600, name="generation")
 # 30 audio streams per hour
-audio_limiter = RateLimiter(requests_limit=30, window_seconds=3600)
+audio_limiter = RateLimiter(requests_limit=30, window_seconds=3600, name="audio")
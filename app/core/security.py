@@ -1,9 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Union
+from typing import Any, Callable, Optional, TypeVar, Union
+from fastapi import HTTPException
 from jose import jwt
+import asyncio
 import bcrypt
 import secrets
+import time
 from app.core.config import settings
+from app.core import metrics
+
+T = TypeVar("T")
 
 def create_access_token(
     subject: Union[str, Any], expires_delta: timedelta = None
@@ -18,6 +25,14 @@ def create_access_token(
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def decode_token_subject(token: str) -> Optional[str]:
+    """Return the subject of a valid token, or None."""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except jwt.JWTError:
+        return None
+    return payload.get("sub")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(
         plain_password.encode("utf-8"), 
@@ -27,9 +42,96 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return bcrypt.hashpw(
         password.encode("utf-8"), 
-        bcrypt.gensalt()
+        bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     ).decode("utf-8")
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was made with a different cost than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+class PasswordHasherPool:
+    """
+    Runs bcrypt off the event loop on a small dedicated thread pool.
+
+    bcrypt releases the GIL, so a few threads give real parallelism without
+    starving the default executor. Work beyond PASSWORD_HASH_MAX_QUEUE
+    waiting calls is refused with a 503 rather than queueing without bound.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy. Please try again shortly.",
+                headers={"Retry-After": "1"}
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return started, fn(*args), time.perf_counter() - started
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            started, result, elapsed = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        self.wait_seconds += started - submitted
+        self.run_seconds += elapsed
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": settings.BCRYPT_ROUNDS,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": 1000 * self.wait_seconds / self.completed if self.completed else 0.0,
+            "avg_run_ms": 1000 * self.run_seconds / self.completed if self.completed else 0.0,
+        }
+
+password_hasher = PasswordHasherPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_QUEUE)
+metrics.registry.register(metrics.Gauge(
+    "studyio_password_hash_in_flight", "bcrypt calls running or waiting", lambda: password_hasher.in_flight
+))
+metrics.registry.register(metrics.Gauge(
+    "studyio_password_hash_queued", "bcrypt calls waiting for a thread", lambda: password_hasher.queued
+))
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
+
 def create_verification_token() -> str:
     """Generate a secure random verification token"""
     return secrets.token_urlsafe(32)
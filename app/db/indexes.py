@@ -0,0 +1,211 @@
+"""
+Declarative registry of the indexes every hot query path relies on.
+
+ensure_indexes() is applied on startup from connect_to_mongo and can also be
+run by hand:
+
+    python -m app.db.indexes          # create missing indexes, report drift
+    python -m app.db.indexes --check  # report only, change nothing
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Options that change index behaviour and therefore count as drift when they differ
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    name: str
+    options: Dict = field(default_factory=dict, hash=False)
+
+
+INDEXES: List[IndexSpec] = [
+    # Login, register, forgot-password and resend-verification
+    IndexSpec("users", (("email", ASCENDING),), "email_unique", {"unique": True}),
+    # Tokens issued before auth_tokens existed are still looked up on the user
+    IndexSpec("users", (("verification_token", ASCENDING),), "verification_token", {"sparse": True}),
+    IndexSpec("users", (("reset_token", ASCENDING),), "reset_token", {"sparse": True}),
+    # Admin listing: keyset pagination on (created_at, _id), optionally filtered
+    IndexSpec("users", (("created_at", DESCENDING), ("_id", DESCENDING)), "created_keyset"),
+    IndexSpec("users", (("plan", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)), "plan_created_keyset"),
+    IndexSpec("users", (("role", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)), "role_created_keyset"),
+
+    # One-time email tokens expire on their own
+    IndexSpec("auth_tokens", (("expires_at", ASCENDING),), "expires_at_ttl", {"expireAfterSeconds": 0}),
+    IndexSpec("auth_tokens", (("user_id", ASCENDING), ("purpose", ASCENDING)), "user_purpose"),
+
+    # Generation cache check
+    IndexSpec(
+        "study_sessions",
+        (
+            ("user_id", ASCENDING),
+            ("topic", ASCENDING),
+            ("duration_minutes", ASCENDING),
+            ("exam_mode", ASCENDING),
+            ("prompt", ASCENDING),
+        ),
+        "session_cache_lookup",
+    ),
+    # One session per user and shared entry; absorbs double-submits
+    IndexSpec(
+        "study_sessions",
+        (("user_id", ASCENDING), ("content_key", ASCENDING)),
+        "user_content_unique",
+        {"unique": True, "partialFilterExpression": {"content_key": {"$exists": True}}},
+    ),
+    # History and admin listings, newest first with (created_at, _id) keyset pagination
+    IndexSpec(
+        "study_sessions",
+        (("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)),
+        "user_created_keyset",
+    ),
+    IndexSpec("study_sessions", (("created_at", DESCENDING), ("_id", DESCENDING)), "created_keyset"),
+    IndexSpec(
+        "study_sessions",
+        (("topic", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)),
+        "topic_created_keyset",
+    ),
+
+    # Shared content cache invalidation sweeps
+    IndexSpec("content_cache", (("content_version", ASCENDING),), "content_version"),
+
+    # Generation leases and idempotency records clean themselves up
+    IndexSpec(
+        "generation_leases",
+        (("lease_expires_at", ASCENDING),),
+        "lease_expires_at_ttl",
+        {"expireAfterSeconds": 3600},
+    ),
+    IndexSpec(
+        "idempotency_keys",
+        (("created_at", ASCENDING),),
+        "created_at_ttl",
+        {"expireAfterSeconds": settings.IDEMPOTENCY_KEY_TTL_SECONDS},
+    ),
+
+    # Audio segments pushed during streaming generation
+    IndexSpec("stream_segments", (("created_at", ASCENDING),), "created_at_ttl", {"expireAfterSeconds": 3600}),
+
+    # Generation jobs: claiming the oldest job, per-user pending counts, cleanup
+    IndexSpec("generation_jobs", (("status", ASCENDING), ("created_at", ASCENDING)), "status_created"),
+    IndexSpec("generation_jobs", (("user_id", ASCENDING), ("status", ASCENDING)), "user_status"),
+    IndexSpec(
+        "generation_jobs",
+        (("finished_at", ASCENDING),),
+        "finished_at_ttl",
+        {"expireAfterSeconds": settings.JOB_RETENTION_SECONDS},
+    ),
+
+    # Email outbox: due emails in order, cleanup
+    IndexSpec("email_outbox", (("status", ASCENDING), ("next_attempt_at", ASCENDING)), "status_next_attempt"),
+    IndexSpec(
+        "email_outbox",
+        (("created_at", ASCENDING),),
+        "created_at_ttl",
+        {"expireAfterSeconds": settings.EMAIL_RETENTION_SECONDS},
+    ),
+
+    # Shared rate-limit windows
+    IndexSpec("rate_limits", (("expires_at", ASCENDING),), "expires_at_ttl", {"expireAfterSeconds": 0}),
+
+    # Listens already counted per media token
+    IndexSpec("listen_starts", (("expires_at", ASCENDING),), "expires_at_ttl", {"expireAfterSeconds": 0}),
+
+    # Usage report per user
+    IndexSpec("usage", (("user_id", ASCENDING),), "user_id"),
+    # Daily rollups read by date range
+    IndexSpec("usage_daily", (("day", ASCENDING),), "day"),
+    IndexSpec("usage_daily_users", (("day", ASCENDING), ("user_id", ASCENDING)), "day_user"),
+    # Least recently used sentence fragments are trimmed first
+    IndexSpec("tts_fragments", (("last_used_at", ASCENDING),), "last_used_at"),
+    # Sightings of sentences that never made it into the cache expire
+    IndexSpec(
+        "tts_fragments",
+        (("seen_at", ASCENDING),),
+        "seen_at_ttl",
+        {"expireAfterSeconds": settings.TTS_FRAGMENT_SIGHTING_TTL_SECONDS},
+    ),
+]
+
+
+def _matches(spec: IndexSpec, info: dict) -> bool:
+    if tuple((k, int(d)) for k, d in info["key"]) != spec.keys:
+        return False
+    return all(info.get(opt) == spec.options.get(opt) for opt in _COMPARED_OPTIONS)
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase, create: bool = True) -> dict:
+    """
+    Create any registered index that is missing.
+
+    Existing indexes are never dropped or rebuilt: an index whose name matches
+    a spec but whose keys or options differ is reported as drift, and indexes
+    not in the registry are reported as unmanaged.
+    """
+    report = {"created": [], "missing": [], "drift": [], "unmanaged": []}
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in INDEXES:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection, specs in by_collection.items():
+        existing = await db[collection].index_information()
+        for spec in specs:
+            label = f"{collection}.{spec.name}"
+            info = existing.get(spec.name)
+            if info is not None:
+                if not _matches(spec, info):
+                    report["drift"].append(label)
+                    logger.warning(f"Index drift on {label}: found {info}, expected {spec.keys} {spec.options}")
+                continue
+            if not create:
+                report["missing"].append(label)
+                continue
+            try:
+                await db[collection].create_index(
+                    list(spec.keys), name=spec.name, background=True, **spec.options
+                )
+                report["created"].append(label)
+                logger.info(f"Created index {label}")
+            except Exception as e:
+                # e.g. duplicate emails blocking a unique index; keep going
+                report["missing"].append(label)
+                logger.error(f"Could not create index {label}: {e}")
+
+        managed = {spec.name for spec in specs} | {"_id_"}
+        report["unmanaged"].extend(
+            f"{collection}.{name}" for name in existing if name not in managed
+        )
+
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Apply or check the MongoDB index registry")
+    parser.add_argument("--check", action="store_true", help="report drift without creating indexes")
+    args = parser.parse_args()
+
+    async def main():
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        try:
+            report = await ensure_indexes(client[settings.DATABASE_NAME], create=not args.check)
+        finally:
+            client.close()
+        for key, labels in report.items():
+            print(f"{key}: {', '.join(labels) if labels else '-'}")
+        if report["drift"] or report["missing"]:
+            raise SystemExit(1)
+
+    asyncio.run(main())
@@ -1,5 +1,6 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -7,17 +8,31 @@ logger = logging.getLogger(__name__)
 class Database:
     client: AsyncIOMotorClient = None
     db = None
+    index_task: asyncio.Task = None
 
 db = Database()
 
+async def _apply_indexes():
+    from app.db.indexes import ensure_indexes
+    try:
+        report = await ensure_indexes(db.db)
+        logger.info(f"Index check complete: {report}")
+    except Exception as e:
+        logger.error(f"Index check failed: {e}")
+
 async def connect_to_mongo():
     logger.info("Connecting to MongoDB...")
     db.client = AsyncIOMotorClient(settings.MONGODB_URL)
     db.db = db.client[settings.DATABASE_NAME]
     logger.info("Connected to MongoDB.")
+    if settings.MONGODB_ENSURE_INDEXES:
+        # Index builds can take a while on large collections; don't hold up startup
+        db.index_task = asyncio.create_task(_apply_indexes())
 
 async def close_mongo_connection():
     logger.info("Closing MongoDB connection...")
+    if db.index_task and not db.index_task.done():
+        db.index_task.cancel()
     db.client.close()
     logger.info("MongoDB connection closed.")
 
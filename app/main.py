@@ -1,10 +1,19 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
-from app.db.mongodb import connect_to_mongo, close_mongo_connection
+from app.core import metrics
+from app.core.logging_config import setup_logging
+from app.db.mongodb import connect_to_mongo, close_mongo_connection, get_database
+from app.workers.generation_worker import generation_workers
+from app.workers.email_sender import email_sender
+from app.services.cache_stats import cache_stats
 
 from app.api.api_v1.api import api_router
 
+setup_logging()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json"
@@ -17,14 +26,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor", "X-Sync-More", "Server-Timing"],
 )
 
+# Stage timings (Server-Timing header) and request latency histograms
+app.add_middleware(metrics.MetricsMiddleware)
+
 @app.on_event("startup")
 async def startup_db_client():
     await connect_to_mongo()
+    generation_workers.start(get_database())
+    email_sender.start(get_database())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Let running jobs finish (or hand them back) while Mongo is still connected
+    await asyncio.gather(generation_workers.stop(), email_sender.stop())
+    await cache_stats.flush(get_database())
     await close_mongo_connection()
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -32,3 +50,9 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 @app.get("/")
 async def root():
     return {"message": "Welcome to Study.io API"}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
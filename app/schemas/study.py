@@ -15,9 +15,31 @@ class StudySessionResponse(BaseModel):
     topic: str
     content: str
     audio_url: Optional[str] = None
+    playlist_url: Optional[str] = None  # Segmented (HLS) delivery of the same audio
     listen_count: int = 0
     speech_marks: List[dict] = []
     created_at: datetime
 
+class StudySessionSummary(BaseModel):
+    id: str
+    topic: str
+    duration_minutes: Optional[int] = None
+    created_at: datetime
+
+class SpeechMarksWindow(BaseModel):
+    from_ms: int
+    to_ms: Optional[int] = None
+    speech_marks: List[dict] = []
+
+class StudyJobResponse(BaseModel):
+    id: str
+    status: str  # queued, running, completed or failed
+    stage: str
+    progress: float = 0.0
+    error: Optional[str] = None
+    session: Optional[StudySessionResponse] = None
+    created_at: datetime
+    updated_at: datetime
+
 class StudyHistory(BaseModel):
     sessions: List[StudySessionResponse]
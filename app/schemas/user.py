@@ -37,6 +37,7 @@ class UserInDB(UserBase):
 
 class UserResponse(UserBase):
     id: str
+    created_at: Optional[datetime] = None
 
 class Token(BaseModel):
     access_token: str
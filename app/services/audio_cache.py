@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from app.core.config import settings
+from app.core import metrics
+from app.core.ttl_cache import TTLCache
+from typing import Optional
+
+
+class AudioCache:
+    """
+    Per-process cache in front of the audio store for get_study_audio.
+
+    Payloads are bounded by total bytes (LRU). A file is only admitted on
+    its AUDIO_CACHE_ADMIT_AFTER-th request within the recently-seen window,
+    so one-off listens don't push out audio that is actually hot. Files are
+    content-addressed and never change; new audio means a new id.
+
+    Session metadata (owner, file id, frame index) is cached separately for
+    a short TTL; call invalidate_session() when a session is deleted or its
+    audio replaced.
+    """
+
+    def __init__(self, max_bytes: int, max_item_bytes: int, admit_after: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.admit_after = admit_after
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        # Recently requested ids that are not cached yet, with request counts
+        self._seen: "OrderedDict[str, int]" = OrderedDict()
+        self._seen_max = 10 * settings.AUDIO_CACHE_MAX_SESSIONS
+        self.sessions = TTLCache(settings.AUDIO_CACHE_MAX_SESSIONS, settings.AUDIO_CACHE_SESSION_TTL_SECONDS)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_id: str) -> Optional[bytes]:
+        data = self._data.get(file_id)
+        if data is None:
+            self.misses += 1
+            metrics.cache_requests.inc(cache="audio", result="miss")
+            return None
+        self._data.move_to_end(file_id)
+        self.hits += 1
+        metrics.cache_requests.inc(cache="audio", result="hit")
+        return data
+
+    def should_admit(self, file_id: str, size: int) -> bool:
+        """Record a request for an uncached file; True once it has earned a slot."""
+        if size > self.max_item_bytes or self.max_bytes <= 0:
+            return False
+        count = self._seen.pop(file_id, 0) + 1
+        if count >= self.admit_after:
+            return True
+        self._seen[file_id] = count
+        while len(self._seen) > self._seen_max:
+            self._seen.popitem(last=False)
+        return False
+
+    def put(self, file_id: str, data: bytes) -> None:
+        if len(data) > self.max_item_bytes:
+            return
+        self.invalidate_audio(file_id)
+        self._data[file_id] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+            metrics.cache_evictions.inc(cache="audio")
+
+    def invalidate_audio(self, file_id: str) -> None:
+        data = self._data.pop(file_id, None)
+        if data is not None:
+            self._bytes -= len(data)
+
+    def invalidate_session(self, session_id: str) -> None:
+        self.sessions.pop(session_id)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "sessions": self.sessions.stats(),
+        }
+
+audio_cache = AudioCache(
+    settings.AUDIO_CACHE_MAX_BYTES, settings.AUDIO_CACHE_MAX_ITEM_BYTES, settings.AUDIO_CACHE_ADMIT_AFTER
+)
+metrics.registry.register(metrics.Gauge(
+    "studyio_audio_cache_bytes", "Bytes of audio held in the hot-audio cache", lambda: audio_cache._bytes
+))
@@ -0,0 +1,344 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
+from app.core.config import settings
+from app.services.audio_cache import audio_cache
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+import asyncio
+import hashlib
+import os
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# File extension per content type. MP3 ids are bare content hashes (as they
+# always were); ids of other formats carry their extension.
+EXTENSIONS = {"audio/mpeg": ".mp3", "audio/ogg": ".ogg"}
+DEFAULT_EXTENSION = ".mp3"
+
+
+def file_name(file_id: str) -> str:
+    """Name of file_id's file on a backend."""
+    return file_id if "." in file_id else f"{file_id}{DEFAULT_EXTENSION}"
+
+
+def file_id_of(name: str) -> str:
+    """Inverse of file_name."""
+    return name.removesuffix(DEFAULT_EXTENSION)
+
+
+def content_type_of(file_id: str) -> str:
+    extension = Path(file_name(file_id)).suffix
+    return next((content_type for content_type, ext in EXTENSIONS.items() if ext == extension), "audio/mpeg")
+
+
+class AudioNotFound(Exception):
+    pass
+
+
+class AudioHandle(ABC):
+    """An opened audio file: its size, and byte ranges read on demand."""
+
+    def __init__(self, size: int, path: Optional[str] = None):
+        self.size = size
+        # Set when the bytes are a local file, which can be served with FileResponse
+        self.path = path
+
+    @abstractmethod
+    def read_range(self, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive) in chunk-sized pieces."""
+
+    async def read(self) -> bytes:
+        return b"".join([data async for data in self.read_range(0, self.size - 1)]) if self.size else b""
+
+
+class GridFSHandle(AudioHandle):
+    def __init__(self, grid_out):
+        super().__init__(grid_out.length)
+        self.grid_out = grid_out
+
+    async def read_range(self, start: int, end: int) -> AsyncIterator[bytes]:
+        self.grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = await self.grid_out.read(min(remaining, settings.AUDIO_CHUNK_SIZE_BYTES))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+class LocalFileHandle(AudioHandle):
+    """
+    Byte ranges are read with os.pread in a thread. Whole files are served
+    by FileResponse instead, which hands the path to the server when it
+    supports the ASGI pathsend extension.
+    """
+
+    async def read_range(self, start: int, end: int) -> AsyncIterator[bytes]:
+        fd = await asyncio.to_thread(os.open, self.path, os.O_RDONLY)
+        try:
+            position = start
+            while position <= end:
+                size = min(end - position + 1, settings.AUDIO_CHUNK_SIZE_BYTES)
+                data = await asyncio.to_thread(os.pread, fd, size, position)
+                if not data:
+                    break
+                position += len(data)
+                yield data
+        finally:
+            os.close(fd)
+
+
+class S3Handle(AudioHandle):
+    def __init__(self, backend: "S3Backend", key: str, size: int):
+        super().__init__(size)
+        self.backend = backend
+        self.key = key
+
+    async def read_range(self, start: int, end: int) -> AsyncIterator[bytes]:
+        response = await asyncio.to_thread(
+            self.backend.client.get_object,
+            Bucket=self.backend.bucket, Key=self.key, Range=f"bytes={start}-{end}"
+        )
+        body = response["Body"]
+        try:
+            while True:
+                data = await asyncio.to_thread(body.read, settings.AUDIO_CHUNK_SIZE_BYTES)
+                if not data:
+                    break
+                yield data
+        finally:
+            body.close()
+
+
+class GridFSBackend:
+    """Audio in a GridFS bucket of the application database."""
+
+    name = "gridfs"
+
+    def __init__(self, bucket_name: str = "audio"):
+        self.bucket_name = bucket_name
+
+    def _bucket(self, db: AsyncIOMotorDatabase) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(
+            db,
+            bucket_name=self.bucket_name,
+            chunk_size_bytes=settings.AUDIO_CHUNK_SIZE_BYTES
+        )
+
+    async def exists(self, db: AsyncIOMotorDatabase, file_id: str) -> bool:
+        doc = await db[f"{self.bucket_name}.files"].find_one({"_id": file_id}, {"_id": 1})
+        return doc is not None
+
+    async def put(self, db: AsyncIOMotorDatabase, file_id: str, data: bytes, content_type: str, metadata: dict) -> None:
+        try:
+            await self._bucket(db).upload_from_stream_with_id(
+                file_id,
+                file_name(file_id),
+                data,
+                metadata={"content_type": content_type, **metadata}
+            )
+        except DuplicateKeyError:
+            # Another request uploaded the same audio concurrently
+            logger.info(f"Audio {file_id} already stored")
+
+    async def open(self, db: AsyncIOMotorDatabase, file_id: str) -> AudioHandle:
+        from gridfs.errors import NoFile
+        try:
+            return GridFSHandle(await self._bucket(db).open_download_stream(file_id))
+        except NoFile:
+            raise AudioNotFound(file_id)
+
+    async def delete(self, db: AsyncIOMotorDatabase, file_id: str) -> None:
+        await self._bucket(db).delete(file_id)
+
+    async def list_ids(self, db: AsyncIOMotorDatabase) -> AsyncIterator[str]:
+        async for doc in db[f"{self.bucket_name}.files"].find({}, {"_id": 1}):
+            yield doc["_id"]
+
+
+class LocalBackend:
+    """
+    Audio as files on local disk, in a two-level directory tree by hash
+    (ab/cd/abcd....mp3) so no directory grows too large. Writes go to a
+    temporary file first and are renamed into place, so readers never see
+    a partial file.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, file_id: str) -> Path:
+        return self.root / file_id[:2] / file_id[2:4] / file_name(file_id)
+
+    async def exists(self, db: AsyncIOMotorDatabase, file_id: str) -> bool:
+        return await asyncio.to_thread(self.path(file_id).is_file)
+
+    def _write(self, file_id: str, data: bytes) -> None:
+        target = self.path(file_id)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def put(self, db: AsyncIOMotorDatabase, file_id: str, data: bytes, content_type: str, metadata: dict) -> None:
+        await asyncio.to_thread(self._write, file_id, data)
+
+    async def open(self, db: AsyncIOMotorDatabase, file_id: str) -> AudioHandle:
+        path = self.path(file_id)
+        try:
+            size = (await asyncio.to_thread(path.stat)).st_size
+        except FileNotFoundError:
+            raise AudioNotFound(file_id)
+        return LocalFileHandle(size, str(path))
+
+    async def delete(self, db: AsyncIOMotorDatabase, file_id: str) -> None:
+        await asyncio.to_thread(self.path(file_id).unlink, True)
+
+    async def list_ids(self, db: AsyncIOMotorDatabase) -> AsyncIterator[str]:
+        paths = await asyncio.to_thread(lambda: list(self.root.glob("*/*/*")))
+        for path in paths:
+            # Skips temporary files of writes in progress
+            if path.suffix in EXTENSIONS.values():
+                yield file_id_of(path.name)
+
+
+class S3Backend:
+    """
+    Audio in an S3-compatible bucket. AUDIO_S3_ENDPOINT_URL points it at
+    MinIO or another stand-in for local testing.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        import boto3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_REGION
+        )
+
+    def key(self, file_id: str) -> str:
+        return f"{self.prefix}{file_id[:2]}/{file_name(file_id)}"
+
+    async def _head(self, file_id: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+        try:
+            return await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.key(file_id))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    async def exists(self, db: AsyncIOMotorDatabase, file_id: str) -> bool:
+        return await self._head(file_id) is not None
+
+    async def put(self, db: AsyncIOMotorDatabase, file_id: str, data: bytes, content_type: str, metadata: dict) -> None:
+        await asyncio.to_thread(
+            self.client.put_object,
+            Bucket=self.bucket,
+            Key=self.key(file_id),
+            Body=data,
+            ContentType=content_type,
+            Metadata={k: str(v) for k, v in metadata.items()}
+        )
+
+    async def open(self, db: AsyncIOMotorDatabase, file_id: str) -> AudioHandle:
+        head = await self._head(file_id)
+        if head is None:
+            raise AudioNotFound(file_id)
+        return S3Handle(self, self.key(file_id), head["ContentLength"])
+
+    async def delete(self, db: AsyncIOMotorDatabase, file_id: str) -> None:
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self.key(file_id))
+
+    async def list_ids(self, db: AsyncIOMotorDatabase) -> AsyncIterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = await asyncio.to_thread(lambda: list(paginator.paginate(Bucket=self.bucket, Prefix=self.prefix)))
+        for page in pages:
+            for obj in page.get("Contents", []):
+                yield file_id_of(obj["Key"].rsplit("/", 1)[-1])
+
+
+def make_backend(name: str):
+    if name == "local":
+        return LocalBackend(settings.AUDIO_LOCAL_ROOT)
+    if name == "s3":
+        if not settings.AUDIO_S3_BUCKET:
+            raise ValueError("AUDIO_S3_BUCKET must be set for the s3 audio backend")
+        return S3Backend(settings.AUDIO_S3_BUCKET, settings.AUDIO_S3_PREFIX, settings.AUDIO_S3_ENDPOINT_URL)
+    if name == "gridfs":
+        return GridFSBackend()
+    raise ValueError(f"Unknown audio backend: {name}")
+
+
+class AudioStore:
+    """
+    Content-addressed audio storage on a pluggable backend (AUDIO_BACKEND).
+
+    Files are keyed by the SHA-256 of their bytes (plus the extension for
+    formats other than MP3), so identical audio is stored once, a session
+    only keeps the file id, and the same id is valid on every backend.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        # Created on first use so importing this module needs no credentials
+        if self._backend is None:
+            self._backend = make_backend(settings.AUDIO_BACKEND)
+        return self._backend
+
+    @staticmethod
+    def content_key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    async def exists(self, db: AsyncIOMotorDatabase, file_id: str) -> bool:
+        return await self.backend.exists(db, file_id)
+
+    async def put(
+        self,
+        db: AsyncIOMotorDatabase,
+        data: bytes,
+        content_type: str = "audio/mpeg",
+        metadata: Optional[dict] = None
+    ) -> str:
+        """Store data (if not already present) and return its file id."""
+        extension = EXTENSIONS.get(content_type, DEFAULT_EXTENSION)
+        file_id = self.content_key(data) + ("" if extension == DEFAULT_EXTENSION else extension)
+        if not await self.backend.exists(db, file_id):
+            await self.backend.put(db, file_id, data, content_type, metadata or {})
+        return file_id
+
+    async def open(self, db: AsyncIOMotorDatabase, file_id: str) -> AudioHandle:
+        """Open file_id for reading (raises AudioNotFound if missing)."""
+        return await self.backend.open(db, file_id)
+
+    async def read(self, db: AsyncIOMotorDatabase, file_id: str) -> bytes:
+        handle = await self.open(db, file_id)
+        return await handle.read()
+
+    async def delete(self, db: AsyncIOMotorDatabase, file_id: str) -> None:
+        await self.backend.delete(db, file_id)
+        audio_cache.invalidate_audio(file_id)
+
+audio_store = AudioStore()
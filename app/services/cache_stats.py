@@ -0,0 +1,77 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config import settings
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStatsBuffer:
+    """
+    Per-process buffer for shared cache counters.
+
+    Every cache lookup used to write the global cache_stats document (and
+    the entry it hit), which serialized all workers on one hot document.
+    Lookups now only bump in-process counters; they are written out every
+    CACHE_STATS_FLUSH_EVERY lookups or CACHE_STATS_FLUSH_SECONDS, whichever
+    comes first, and on shutdown.
+    Per-entry hits are flushed the same way, with the flush time standing in
+    for the exact time of the last hit.
+    """
+
+    def __init__(self):
+        # stats_id -> field -> pending increment
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # (collection, timestamp field) -> entry id -> pending hits
+        self._entry_hits: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def count(self, stats_id: str, **increments: int) -> None:
+        counters = self._counters[stats_id]
+        for field, amount in increments.items():
+            if amount:
+                counters[field] += amount
+                self._pending += amount
+
+    def hit(self, collection: str, touched_field: str, key: str) -> None:
+        self._entry_hits[(collection, touched_field)][key] += 1
+
+    def pending(self, stats_id: str) -> Dict[str, int]:
+        """Counters recorded by this process that are not in Mongo yet."""
+        return dict(self._counters.get(stats_id, {}))
+
+    async def maybe_flush(self, db: AsyncIOMotorDatabase) -> None:
+        if (
+            self._pending >= settings.CACHE_STATS_FLUSH_EVERY
+            or time.monotonic() - self._flushed_at >= settings.CACHE_STATS_FLUSH_SECONDS
+        ):
+            await self.flush(db)
+
+    async def flush(self, db: AsyncIOMotorDatabase) -> None:
+        counters, self._counters = self._counters, defaultdict(lambda: defaultdict(int))
+        entry_hits, self._entry_hits = self._entry_hits, defaultdict(lambda: defaultdict(int))
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        now = datetime.utcnow()
+        try:
+            for stats_id, fields in counters.items():
+                await db["cache_stats"].update_one({"_id": stats_id}, {"$inc": dict(fields)}, upsert=True)
+            for (collection, touched_field), hits in entry_hits.items():
+                # Most entries are hit once per flush, so this is a write or two
+                by_count: Dict[int, List[str]] = defaultdict(list)
+                for key, count in hits.items():
+                    by_count[count].append(key)
+                for count, keys in by_count.items():
+                    await db[collection].update_many(
+                        {"_id": {"$in": keys}},
+                        {"$inc": {"hits": count}, "$max": {touched_field: now}}
+                    )
+        except Exception as e:
+            # Counters are advisory; losing one batch beats failing a lookup
+            logger.warning(f"Failed to flush cache stats: {e}")
+
+cache_stats = CacheStatsBuffer()
@@ -0,0 +1,116 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config import settings
+from app.schemas.admin import AppConfig
+from typing import Dict, FrozenSet, Iterable, Optional
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Used when there is no app_config document at all
+DEFAULT_DAILY_LIMIT = 5
+DEFAULT_PLAN_ACCESS = {
+    "exam_mode": ["paid"],
+    "durations": {"3": ["trial", "paid"], "5": ["paid"], "10": ["paid"]}
+}
+
+
+class ConfigSnapshot:
+    """
+    Immutable view of the app_config document with its lookup tables
+    precomputed, so request handlers never scan lists.
+    """
+
+    def __init__(self, doc: Optional[dict]):
+        self.doc = doc
+        data = doc or {}
+        self.version: int = data.get("version", 0)
+        self.content_version: int = data.get("content_version", 0)
+        self.etag = f'W/"config-{self.version}"' if doc else 'W/"config-default"'
+
+        self.daily_limit: int = data.get("daily_generation_limit", DEFAULT_DAILY_LIMIT)
+        self.character_limits: Optional[dict] = data.get("character_limits")
+        self.features_enabled: dict = data.get("features_enabled") or {}
+
+        # Case-insensitive topic lookup; the first preset with a name wins
+        self.topic_templates: Dict[str, str] = {}
+        for t in data.get("topics", []):
+            self.topic_templates.setdefault(t["name"].lower(), t.get("prompt_template"))
+
+        plan_access = data.get("plan_access", {}) if doc else DEFAULT_PLAN_ACCESS
+        self.duration_access: Dict[str, FrozenSet[str]] = {
+            str(minutes): frozenset(plans)
+            for minutes, plans in plan_access.get("durations", {}).items()
+        }
+        self.feature_access: Dict[str, FrozenSet[str]] = {
+            feature: frozenset(plans)
+            for feature, plans in plan_access.items()
+            if feature != "durations"
+        }
+
+    def topic_template(self, topic: str) -> Optional[str]:
+        return self.topic_templates.get(topic.lower())
+
+    def duration_allowed(self, plan: str, duration_minutes: int, default: Iterable[str] = ("paid",)) -> bool:
+        return plan in self.duration_access.get(str(duration_minutes), default)
+
+    def feature_allowed(self, plan: str, feature: str, default: Iterable[str] = ("paid",)) -> bool:
+        return plan in self.feature_access.get(feature, default)
+
+    def highlighting_allowed(self, plan: str) -> bool:
+        return self.features_enabled.get("text_highlighting", True) and self.feature_allowed(plan, "text_highlighting")
+
+    def public(self):
+        return self.doc if self.doc else AppConfig()
+
+
+class ConfigCache:
+    """
+    Per-process cache of the app_config document.
+
+    Admin writes bump config.version. Other workers notice within
+    CONFIG_CACHE_POLL_SECONDS through a cheap version-only read and reload
+    the full document only when the version changed. The full document is
+    also re-read every CONFIG_CACHE_MAX_AGE_SECONDS to pick up manual edits
+    made without bumping the version.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self, db: AsyncIOMotorDatabase) -> ConfigSnapshot:
+        if self._snapshot is not None and time.monotonic() - self._checked_at < settings.CONFIG_CACHE_POLL_SECONDS:
+            return self._snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            snapshot = self._snapshot
+            if snapshot is not None and now - self._checked_at < settings.CONFIG_CACHE_POLL_SECONDS:
+                return snapshot
+
+            reload = snapshot is None or now - self._loaded_at >= settings.CONFIG_CACHE_MAX_AGE_SECONDS
+            if not reload:
+                probe = await db["config"].find_one({"_id": "app_config"}, {"version": 1})
+                reload = (probe is None) != (snapshot.doc is None) or (
+                    probe is not None and probe.get("version", 0) != snapshot.version
+                )
+
+            if reload:
+                doc = await db["config"].find_one({"_id": "app_config"})
+                self._snapshot = ConfigSnapshot(doc)
+                self._loaded_at = now
+                logger.info(f"Loaded app config version {self._snapshot.version}")
+            self._checked_at = now
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop the local snapshot; the next get() reloads it."""
+        self._snapshot = None
+
+config_cache = ConfigCache()
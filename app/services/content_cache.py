@@ -0,0 +1,140 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from app.core import metrics
+from app.services.cache_stats import cache_stats
+from datetime import datetime
+from typing import List, Optional
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when a change to the generation pipeline should orphan every entry
+CACHE_FORMAT_VERSION = 1
+
+# Fields a session document picks up from its shared content entry
+SHARED_FIELDS = (
+    "content", "speech_marks", "speech_marks_packed", "speech_timeline",
+    "audio_file_id", "audio_size", "audio_duration_ms", "audio_frame_index",
+)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form used for cache keys."""
+    return " ".join((text or "").split()).casefold()
+
+
+class ContentCache:
+    """
+    Content-addressed cache of generated study content and audio, shared by
+    every user.
+
+    Entries are keyed by a hash of everything that influences the output, so
+    sessions for different users asking the same thing point at one entry
+    instead of paying for another OpenAI + Polly run.
+    """
+
+    collection = "content_cache"
+    stats_id = "content_cache"
+
+    @staticmethod
+    def make_key(
+        *,
+        topic: str,
+        prompt: str,
+        duration_minutes: int,
+        exam_mode: bool,
+        system_prompt: str,
+        topic_template: str,
+        max_chars: int,
+        model: str,
+        content_version: int
+    ) -> str:
+        material = json.dumps(
+            [
+                CACHE_FORMAT_VERSION,
+                content_version,
+                model,
+                normalize_text(topic),
+                normalize_text(prompt),
+                duration_minutes,
+                bool(exam_mode),
+                max_chars,
+                topic_template,
+                system_prompt,
+            ],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, db: AsyncIOMotorDatabase, key: str) -> Optional[dict]:
+        """Look up an entry and record the hit or miss (persisted in batches)."""
+        entry = await db[self.collection].find_one({"_id": key})
+        metrics.cache_requests.inc(cache="content", result="hit" if entry else "miss")
+        cache_stats.count(self.stats_id, **{"hits" if entry else "misses": 1})
+        if entry:
+            cache_stats.hit(self.collection, "last_hit_at", key)
+        await cache_stats.maybe_flush(db)
+        return entry
+
+    async def find(self, db: AsyncIOMotorDatabase, key: str) -> Optional[dict]:
+        """Look up an entry without touching the hit counters."""
+        return await db[self.collection].find_one({"_id": key})
+
+    async def put(self, db: AsyncIOMotorDatabase, key: str, entry: dict) -> dict:
+        """Insert an entry; if one appeared concurrently, keep and return that."""
+        doc = {"_id": key, "hits": 0, "created_at": datetime.utcnow(), **entry}
+        try:
+            await db[self.collection].insert_one(doc)
+        except DuplicateKeyError:
+            return await db[self.collection].find_one({"_id": key})
+        return doc
+
+    async def invalidate(self, db: AsyncIOMotorDatabase, content_version: int) -> int:
+        """
+        Mark entries built under an older content_version as stale.
+
+        The version is part of every key so stale entries are already
+        unreachable for new requests; they are kept because existing sessions
+        still point at them.
+        """
+        result = await db[self.collection].update_many(
+            {"content_version": {"$lt": content_version}, "invalidated_at": {"$exists": False}},
+            {"$set": {"invalidated_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+
+    async def hydrate(self, db: AsyncIOMotorDatabase, sessions: List[dict], fields=SHARED_FIELDS) -> List[dict]:
+        """Fill shared fields into session documents that only hold a content_key."""
+        keys = {s["content_key"] for s in sessions if s.get("content_key")}
+        if not keys:
+            return sessions
+        projection = {field: 1 for field in fields}
+        entries = {
+            e["_id"]: e
+            async for e in db[self.collection].find({"_id": {"$in": list(keys)}}, projection)
+        }
+        for session in sessions:
+            entry = entries.get(session.get("content_key"))
+            if not entry:
+                continue
+            for field in fields:
+                if field in entry and field not in session:
+                    session[field] = entry[field]
+        return sessions
+
+    async def stats(self, db: AsyncIOMotorDatabase) -> dict:
+        counters = await db["cache_stats"].find_one({"_id": self.stats_id}) or {}
+        pending = cache_stats.pending(self.stats_id)
+        hits = counters.get("hits", 0) + pending.get("hits", 0)
+        misses = counters.get("misses", 0) + pending.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": await db[self.collection].estimated_document_count(),
+        }
+
+content_cache = ContentCache()
@@ -1,270 +1,252 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+import asyncio
+import uuid
 import logging
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Template name -> subject. Each has a .html and a .txt body in templates/email.
+TEMPLATES = {
+    "verify_email": "Verify Your Email - Study.io",
+    "reset_password": "Reset Your Password - Study.io",
+}
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+_env = Environment(
+    loader=FileSystemLoader(str(Path(__file__).resolve().parent.parent / "templates" / "email")),
+    autoescape=select_autoescape(["html"]),
+    trim_blocks=True,
+)
+# Compiled once at import; rendering is then just a function call
+_compiled = {
+    (name, kind): _env.get_template(f"{name}.{kind}")
+    for name in TEMPLATES
+    for kind in ("html", "txt")
+}
+
+
+def smtp_configured() -> bool:
+    return all([settings.SMTP_HOST, settings.SMTP_USER, settings.SMTP_PASSWORD, settings.EMAIL_FROM])
+
+
+def _smtp_connection() -> smtplib.SMTP:
+    server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+    try:
+        server.starttls()
+        server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
 class EmailService:
-    """Service for sending emails via SMTP"""
-    
-    @staticmethod
-    async def send_verification_email(email: str, token: str) -> bool:
+    """
+    Service for sending emails via SMTP.
+
+    Request handlers only write to the email_outbox collection; the
+    EmailSender worker delivers from there in batches, off the event loop.
+    """
+
+    collection = "email_outbox"
+
+    def render(self, template: str, to: str, context: dict) -> MIMEMultipart:
+        """Build the message for an outbox entry"""
+        context = {"app_name": settings.PROJECT_NAME, **context}
+        message = MIMEMultipart("alternative")
+        message["Subject"] = TEMPLATES[template]
+        message["From"] = f"{settings.EMAIL_FROM_NAME} <{settings.EMAIL_FROM}>"
+        message["To"] = to
+        message.attach(MIMEText(_compiled[(template, "txt")].render(context), "plain"))
+        message.attach(MIMEText(_compiled[(template, "html")].render(context), "html"))
+        return message
+
+    async def enqueue(self, db: AsyncIOMotorDatabase, to: str, template: str, context: dict) -> bool:
         """
-        Send email verification link to user
-        
-        Args:
-            email: Recipient email address
-            token: Verification token
-            
+        Queue an email for delivery
+
         Returns:
-            bool: True if email sent successfully, False otherwise
+            bool: True if the email was queued, False otherwise
         """
+        now = datetime.utcnow()
         try:
-            # Check if SMTP is configured
-            if not all([settings.SMTP_HOST, settings.SMTP_USER, settings.SMTP_PASSWORD, settings.EMAIL_FROM]):
-                logger.error("SMTP configuration is incomplete. Please set SMTP_HOST, SMTP_USER, SMTP_PASSWORD, and EMAIL_FROM in .env")
-                return False
-            
-            # Create verification link
-            verification_link = f"{settings.FRONTEND_URL}/verify-email?token={token}"
-            
-            # Create email message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = "Verify Your Email - Study.io"
-            message["From"] = f"{settings.EMAIL_FROM_NAME} <{settings.EMAIL_FROM}>"
-            message["To"] = email
-            
-            # Create HTML content
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        line-height: 1.6;
-                        color: #333;
-                    }}
-                    .container {{
-                        max-width: 600px;
-                        margin: 0 auto;
-                        padding: 20px;
-                    }}
-                    .button {{
-                        display: inline-block;
-                        padding: 12px 24px;
-                        background-color: #4F46E5;
-                        color: white;
-                        text-decoration: none;
-                        border-radius: 5px;
-                        margin: 20px 0;
-                    }}
-                    .footer {{
-                        margin-top: 30px;
-                        font-size: 12px;
-                        color: #666;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h2>Welcome to Study.io!</h2>
-                    <p>Thank you for registering. Please verify your email address to complete your registration and start using Study.io.</p>
-                    
-                    <a href="{verification_link}" class="button">Verify Email Address</a>
-                    
-                    <p>Or copy and paste this link into your browser:</p>
-                    <p style="word-break: break-all; color: #4F46E5;">{verification_link}</p>
-                    
-                    <p>This link will expire in 24 hours.</p>
-                    
-                    <div class="footer">
-                        <p>If you didn't create an account with Study.io, you can safely ignore this email.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Create plain text alternative
-            text_content = f"""
-            Welcome to Study.io!
-            
-            Thank you for registering. Please verify your email address to complete your registration.
-            
-            Click the link below to verify your email:
-            {verification_link}
-            
-            This link will expire in 24 hours.
-            
-            If you didn't create an account with Study.io, you can safely ignore this email.
-            """
-            
-            # Attach both versions
-            part1 = MIMEText(text_content, "plain")
-            part2 = MIMEText(html_content, "html")
-            message.attach(part1)
-            message.attach(part2)
-            
-            # Send email
-            with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-                server.starttls()
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-                server.send_message(message)
-            
-            logger.info(f"Verification email sent to {email}")
-            return True
-            
+            await db[self.collection].insert_one({
+                "_id": str(uuid.uuid4()),
+                "to": to,
+                "template": template,
+                "context": context,
+                "status": PENDING,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now
+            })
         except Exception as e:
-            logger.error(f"Failed to send verification email to {email}: {str(e)}")
+            logger.error(f"Failed to queue {template} email to {to}: {str(e)}")
             return False
-    
-    @staticmethod
-    async def send_password_reset_email(email: str, token: str) -> bool:
+        return True
+
+    async def send_verification_email(self, db: AsyncIOMotorDatabase, email: str, token: str) -> bool:
         """
-        Send password reset link to user
-        
+        Queue the email verification link for a user
+
         Args:
+            db: Database holding the outbox
+            email: Recipient email address
+            token: Verification token
+
+        Returns:
+            bool: True if the email was queued, False otherwise
+        """
+        link = f"{settings.FRONTEND_URL}/verify-email?token={token}"
+        return await self.enqueue(db, email, "verify_email", {"link": link})
+
+    async def send_password_reset_email(self, db: AsyncIOMotorDatabase, email: str, token: str) -> bool:
+        """
+        Queue the password reset link for a user
+
+        Args:
+            db: Database holding the outbox
             email: Recipient email address
             token: Password reset token
-            
+
         Returns:
-            bool: True if email sent successfully, False otherwise
+            bool: True if the email was queued, False otherwise
         """
-        try:
-            # Check if SMTP is configured
-            if not all([settings.SMTP_HOST, settings.SMTP_USER, settings.SMTP_PASSWORD, settings.EMAIL_FROM]):
-                logger.error("SMTP configuration is incomplete. Please set SMTP_HOST, SMTP_USER, SMTP_PASSWORD, and EMAIL_FROM in .env")
-                return False
-            
-            # Create password reset link
-            reset_link = f"{settings.FRONTEND_URL}/reset-password?token={token}"
-            
-            # Create email message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = "Reset Your Password - Study.io"
-            message["From"] = f"{settings.EMAIL_FROM_NAME} <{settings.EMAIL_FROM}>"
-            message["To"] = email
-            
-            # Create HTML content
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        line-height: 1.6;
-                        color: #333;
-                    }}
-                    .container {{
-                        max-width: 600px;
-                        margin: 0 auto;
-                        padding: 20px;
-                    }}
-                    .button {{
-                        display: inline-block;
-                        padding: 12px 24px;
-                        background-color: #4F46E5;
-                        color: white;
-                        text-decoration: none;
-                        border-radius: 5px;
-                        margin: 20px 0;
-                    }}
-                    .footer {{
-                        margin-top: 30px;
-                        font-size: 12px;
-                        color: #666;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h2>Reset Your Password</h2>
-                    <p>We received a request to reset your password for your Study.io account.</p>
-                    
-                    <a href="{reset_link}" class="button">Reset Password</a>
-                    
-                    <p>Or copy and paste this link into your browser:</p>
-                    <p style="word-break: break-all; color: #4F46E5;">{reset_link}</p>
-                    
-                    <p>This link will expire in 1 hour.</p>
-                    
-                    <div class="footer">
-                        <p>If you didn't request a password reset, you can safely ignore this email. Your password will not be changed.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Create plain text alternative
-            text_content = f"""
-            Reset Your Password
-            
-            We received a request to reset your password for your Study.io account.
-            
-            Click the link below to reset your password:
-            {reset_link}
-            
-            This link will expire in 1 hour.
-            
-            If you didn't request a password reset, you can safely ignore this email. Your password will not be changed.
-            """
-            
-            # Attach both versions
-            part1 = MIMEText(text_content, "plain")
-            part2 = MIMEText(html_content, "html")
-            message.attach(part1)
-            message.attach(part2)
-            
-            # Send email
-            with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-                server.starttls()
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-                server.send_message(message)
-            
-            logger.info(f"Password reset email sent to {email}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send password reset email to {email}: {str(e)}")
-            return False
-    
-    @staticmethod
-    async def send_test_email(email: str) -> bool:
+        link = f"{settings.FRONTEND_URL}/reset-password?token={token}"
+        return await self.enqueue(db, email, "reset_password", {"link": link})
+
+    async def send_test_email(self, email: str) -> bool:
         """
-        Send a test email to verify SMTP configuration
-        
+        Send a test email right away to verify SMTP configuration
+
         Args:
             email: Recipient email address
-            
+
         Returns:
             bool: True if email sent successfully, False otherwise
         """
-        try:
-            if not all([settings.SMTP_HOST, settings.SMTP_USER, settings.SMTP_PASSWORD, settings.EMAIL_FROM]):
-                logger.error("SMTP configuration is incomplete")
-                return False
-            
-            message = MIMEText("This is a test email from Study.io. Your SMTP configuration is working correctly!")
-            message["Subject"] = "Test Email - Study.io"
-            message["From"] = f"{settings.EMAIL_FROM_NAME} <{settings.EMAIL_FROM}>"
-            message["To"] = email
-            
-            with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-                server.starttls()
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        if not smtp_configured():
+            logger.error("SMTP configuration is incomplete")
+            return False
+
+        message = MIMEText("This is a test email from Study.io. Your SMTP configuration is working correctly!")
+        message["Subject"] = "Test Email - Study.io"
+        message["From"] = f"{settings.EMAIL_FROM_NAME} <{settings.EMAIL_FROM}>"
+        message["To"] = email
+
+        def send():
+            with _smtp_connection() as server:
                 server.send_message(message)
-            
-            logger.info(f"Test email sent to {email}")
-            return True
-            
+
+        try:
+            await asyncio.to_thread(send)
         except Exception as e:
             logger.error(f"Failed to send test email to {email}: {str(e)}")
             return False
+        logger.info(f"Test email sent to {email}")
+        return True
+
+    async def claim_batch(self, db: AsyncIOMotorDatabase, owner: str, limit: int) -> List[dict]:
+        """Lease up to limit due emails, including ones a crashed sender left behind"""
+        now = datetime.utcnow()
+        batch = []
+        while len(batch) < limit:
+            doc = await db[self.collection].find_one_and_update(
+                {"$or": [
+                    {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                    {"status": SENDING, "lease_expires_at": {"$lt": now}},
+                ]},
+                {"$set": {
+                    "status": SENDING,
+                    "owner": owner,
+                    "lease_expires_at": now + timedelta(seconds=settings.EMAIL_LEASE_SECONDS)
+                }},
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if doc is None:
+                break
+            batch.append(doc)
+        return batch
+
+    def deliver_batch(self, batch: List[dict]) -> List[Optional[str]]:
+        """
+        Blocking: send a batch over one SMTP connection.
+
+        Returns an error string (or None on success) per message. If the
+        connection itself fails every message gets that error.
+        """
+        try:
+            server = _smtp_connection()
+        except Exception as e:
+            return [f"connect: {e}"] * len(batch)
+
+        errors: List[Optional[str]] = []
+        with server:
+            for doc in batch:
+                try:
+                    server.send_message(self.render(doc["template"], doc["to"], doc["context"]))
+                    errors.append(None)
+                except smtplib.SMTPServerDisconnected as e:
+                    # The rest of the batch can't go out on this connection
+                    errors.extend([str(e)] * (len(batch) - len(errors)))
+                    break
+                except Exception as e:
+                    errors.append(str(e))
+        return errors
+
+    async def record_result(self, db: AsyncIOMotorDatabase, doc: dict, error: Optional[str]) -> None:
+        now = datetime.utcnow()
+        if error is None:
+            # The context holds single-use links; no need to keep them around
+            update = {
+                "$set": {"status": SENT, "sent_at": now},
+                "$unset": {"context": "", "lease_expires_at": "", "owner": ""}
+            }
+            logger.info(f"Sent {doc['template']} email to {doc['to']}")
+        else:
+            attempts = doc.get("attempts", 0) + 1
+            if attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                update = {"$set": {"status": FAILED, "attempts": attempts, "last_error": error, "failed_at": now}}
+                logger.error(f"Giving up on {doc['template']} email to {doc['to']}: {error}")
+            else:
+                delay = min(
+                    settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+                    settings.EMAIL_RETRY_MAX_SECONDS
+                )
+                update = {"$set": {
+                    "status": PENDING,
+                    "attempts": attempts,
+                    "last_error": error,
+                    "next_attempt_at": now + timedelta(seconds=delay)
+                }}
+                logger.warning(f"Failed to send {doc['template']} email to {doc['to']}, retrying in {delay}s: {error}")
+            update["$unset"] = {"lease_expires_at": "", "owner": ""}
+        # Only the claim this doc came from: if the lease ran out and another
+        # sender re-claimed the email, that sender records the outcome
+        result = await db[self.collection].update_one(
+            {
+                "_id": doc["_id"],
+                "status": SENDING,
+                "owner": doc["owner"],
+                "lease_expires_at": doc["lease_expires_at"]
+            },
+            update
+        )
+        if result.modified_count == 0:
+            logger.warning(f"Lease on {doc['template']} email to {doc['to']} was lost before its result was recorded")
 
 email_service = EmailService()
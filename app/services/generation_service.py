@@ -0,0 +1,432 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from app.schemas.study import StudyPrompt
+from app.schemas.user import UserInDB
+from app.services.study_service import study_service
+from app.services.polly_service import polly_service, SegmentMerger, split_sentences
+from app.services.audio_store import audio_store
+from app.services.content_cache import content_cache
+from app.services.config_cache import ConfigSnapshot
+from app.services.single_flight import single_flight
+from app.services.usage_rollup import usage_rollup
+from app.services import mp3
+from app.services import speech_marks as speech_mark_store
+from app.core.auth_cache import auth_cache
+from app.core import metrics
+from app.core.config import settings
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+import asyncio
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# GPT-4 rates: $0.03/1k input, $0.06/1k output (approximate average $0.045/1k)
+OPENAI_COST_PER_1K_TOKENS = 0.045
+# Polly Neural: $16.00 per 1M characters
+POLLY_COST_PER_1M_CHARS = 16.00
+
+# Progress reported to callers, in order
+STAGES = ("queued", "checking_cache", "generating_content", "synthesizing_audio", "saving", "completed")
+
+StageCallback = Optional[Callable[[str], Awaitable[None]]]
+
+
+async def _report(on_stage: StageCallback, stage: str) -> None:
+    if on_stage is not None:
+        await on_stage(stage)
+
+
+class GenerationService:
+    """Produces shared study content and links per-user sessions to it."""
+
+    def content_key(self, config: ConfigSnapshot, study_in: StudyPrompt) -> str:
+        max_chars, topic_template, system_prompt = study_service.resolve_settings(
+            config, study_in.topic, study_in.duration_minutes, study_in.system_prompt
+        )
+        return content_cache.make_key(
+            topic=study_in.topic,
+            prompt=study_in.prompt,
+            duration_minutes=study_in.duration_minutes,
+            exam_mode=study_in.exam_mode,
+            system_prompt=system_prompt,
+            topic_template=topic_template,
+            max_chars=max_chars,
+            model=study_service.model,
+            content_version=config.content_version,
+        )
+
+    async def produce(
+        self,
+        db: AsyncIOMotorDatabase,
+        key: str,
+        config: ConfigSnapshot,
+        study_in: StudyPrompt,
+        on_stage: StageCallback = None,
+        with_marks: bool = True
+    ) -> dict:
+        """Run OpenAI + Polly for a cache miss and store the shared entry."""
+        await _report(on_stage, "generating_content")
+        with metrics.timer("openai"):
+            content, openai_usage = await study_service.generate_content(
+                db=db,
+                topic=study_in.topic,
+                duration_minutes=study_in.duration_minutes,
+                prompt=study_in.prompt,
+                exam_mode=study_in.exam_mode,
+                system_prompt_override=study_in.system_prompt,
+                config=config
+            )
+
+        await _report(on_stage, "synthesizing_audio")
+        with metrics.timer("polly"):
+            audio_data, speech_marks, polly_usage, timeline = await polly_service.text_to_speech(content, with_marks, db)
+
+        await _report(on_stage, "saving")
+        with metrics.timer("db_write"):
+            return await self.store_entry(
+                db, key, config, study_in, content, openai_usage, audio_data,
+                speech_marks if with_marks else None, polly_usage, timeline
+            )
+
+    def wants_speech_marks(self, config: ConfigSnapshot, user: UserInDB, study_in: StudyPrompt) -> bool:
+        """Word marks are only worth a Polly request when they will be shown."""
+        return study_in.text_highlighting and config.highlighting_allowed(user.plan)
+
+    @staticmethod
+    def has_speech_marks(doc: dict) -> bool:
+        return "speech_marks_packed" in doc or "speech_marks" in doc
+
+    async def ensure_speech_marks(self, db: AsyncIOMotorDatabase, key: str, doc: dict) -> dict:
+        """
+        Return doc (an entry or a hydrated session of entry key) with speech
+        marks, requesting them from Polly and storing them on the shared
+        entry if it was synthesized without.
+        """
+        if self.has_speech_marks(doc) or not doc.get("content"):
+            return doc
+
+        async def produce():
+            marks = await polly_service.speech_marks_for(doc["content"], doc.get("speech_timeline") or [[0, 0]], db)
+            packed = speech_mark_store.pack(marks)
+            await db[content_cache.collection].update_one(
+                {"_id": key}, {"$set": {"speech_marks_packed": packed}}
+            )
+            return {"speech_marks_packed": packed}
+
+        async def lookup():
+            entry = await db[content_cache.collection].find_one(
+                {"_id": key, "speech_marks_packed": {"$exists": True}}, {"speech_marks_packed": 1}
+            )
+            return {"speech_marks_packed": entry["speech_marks_packed"]} if entry else None
+
+        fields, _ = await single_flight.run(db, f"marks:{key}", produce=produce, lookup=lookup)
+        return {**doc, **fields}
+
+    async def generate_session(
+        self,
+        db: AsyncIOMotorDatabase,
+        user: UserInDB,
+        study_in: StudyPrompt,
+        config: ConfigSnapshot,
+        key: str,
+        now: datetime,
+        on_stage: StageCallback = None
+    ) -> tuple[dict, dict]:
+        """
+        Get or generate the shared entry for key and link a session for user
+        to it. Returns (session, entry).
+
+        Identical requests in flight (double-clicks, retries, other users)
+        wait for a single generation instead of starting their own.
+        """
+        await _report(on_stage, "checking_cache")
+        with metrics.timer("cache_lookup"):
+            entry = await content_cache.get(db, key)
+        cache_hit = entry is not None
+        with_marks = self.wants_speech_marks(config, user, study_in)
+        if not cache_hit:
+            entry, cache_hit = await single_flight.run(
+                db,
+                f"content:{key}",
+                produce=lambda: self.produce(db, key, config, study_in, on_stage, with_marks),
+                lookup=lambda: content_cache.find(db, key)
+            )
+        if with_marks:
+            entry = await self.ensure_speech_marks(db, key, entry)
+
+        await _report(on_stage, "saving")
+        with metrics.timer("db_write"):
+            session = await self.create_session(db, user, study_in, entry, cache_hit, now)
+        return session, entry
+
+    async def store_entry(
+        self,
+        db: AsyncIOMotorDatabase,
+        key: str,
+        config: ConfigSnapshot,
+        study_in: StudyPrompt,
+        content: str,
+        openai_usage: int,
+        audio_data: bytes,
+        speech_marks: Optional[list],
+        polly_usage: int,
+        timeline: List[List[int]]
+    ) -> dict:
+        """speech_marks is None when they were not requested; they are then added on demand."""
+        metrics.openai_tokens.inc(openai_usage)
+
+        # Audio lives in the blob store; the entry only references it
+        audio_file_id = await audio_store.put(db, audio_data, metadata={"content_key": key})
+
+        marks_fields = {} if speech_marks is None else {"speech_marks_packed": speech_mark_store.pack(speech_marks)}
+        return await content_cache.put(db, key, {
+            "topic": study_in.topic,
+            "content": content,
+            **marks_fields,
+            "speech_timeline": timeline,
+            "audio_file_id": audio_file_id,
+            "audio_size": len(audio_data),
+            "audio_duration_ms": round(mp3.duration_ms(audio_data)),
+            "audio_frame_index": mp3.build_frame_index(audio_data),
+            "content_version": config.content_version,
+            "openai_tokens": openai_usage,
+            "polly_characters": polly_usage,
+        })
+
+    async def stream(
+        self,
+        db: AsyncIOMotorDatabase,
+        key: str,
+        config: ConfigSnapshot,
+        study_in: StudyPrompt,
+        stream_id: str,
+        with_marks: bool = True
+    ) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Streaming variant of produce().
+
+        Completed sentences go to Polly while the rest of the text is still
+        being generated. Yields ("delta", ...) and ("segment", ...) events as
+        they become ready, in order, and finally ("entry", entry) once the
+        shared entry has been stored exactly as produce() stores it.
+        """
+        content_stream = await study_service.stream_content(
+            db=db,
+            topic=study_in.topic,
+            duration_minutes=study_in.duration_minutes,
+            prompt=study_in.prompt,
+            exam_mode=study_in.exam_mode,
+            system_prompt_override=study_in.system_prompt,
+            config=config
+        )
+        merger = SegmentMerger()
+        texts: List[str] = []
+        tasks: List[asyncio.Task] = []
+        emitted = 0
+        billed = 0  # Characters sent to Polly, which cached sentences are not
+        pending = ""  # Streamed text after the last sentence boundary
+        buffer = ""  # Complete sentences not yet sent to Polly
+
+        def schedule(text: str):
+            texts.append(text)
+            tasks.append(asyncio.create_task(polly_service.synthesize_segment(text, with_marks, db)))
+
+        async def finished_segments(wait: bool):
+            # Segments are emitted strictly in order so offsets are known
+            nonlocal emitted, billed
+            while emitted < len(tasks) and (wait or tasks[emitted].done()):
+                audio, marks, timeline, segment_billed = await tasks[emitted]
+                billed += segment_billed
+                yield await self._store_segment(
+                    db, stream_id, emitted, texts[emitted], audio, marks, timeline, merger
+                )
+                emitted += 1
+
+        try:
+            async for delta in content_stream:
+                yield "delta", {"text": delta}
+                sentences = split_sentences(pending + delta)
+                pending = sentences.pop() if sentences else ""
+                buffer += "".join(sentences)
+                # Start speaking as early as possible, then batch sentences
+                if buffer and (not tasks or len(buffer) >= settings.STREAM_SEGMENT_MIN_CHARS):
+                    schedule(buffer)
+                    buffer = ""
+                async for segment in finished_segments(wait=False):
+                    yield "segment", segment
+
+            # A sentence cut off by the length limit is not spoken
+            tail = buffer if content_stream.truncated else buffer + pending
+            if tail:
+                schedule(tail)
+            async for segment in finished_segments(wait=True):
+                yield "segment", segment
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # Keep the stored text identical to what was spoken
+        content = "".join(texts) if content_stream.truncated else content_stream.content
+        entry = await self.store_entry(
+            db, key, config, study_in, content, content_stream.usage,
+            merger.audio(), merger.speech_marks if with_marks else None, billed, merger.timeline
+        )
+        yield "entry", entry
+
+    async def stream_once(
+        self,
+        db: AsyncIOMotorDatabase,
+        key: str,
+        config: ConfigSnapshot,
+        study_in: StudyPrompt,
+        stream_id: str,
+        with_marks: bool = True
+    ) -> AsyncIterator[tuple[str, dict]]:
+        """
+        stream() under the same single flight as generate_session, so
+        identical requests don't generate the content twice.
+
+        The leader's events are passed through and end with ("entry", entry).
+        Any other caller waits for the leader's stored entry, gets its text
+        as one delta, and ends with ("shared", entry).
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def produce():
+            entry = None
+            async for kind, data in self.stream(db, key, config, study_in, stream_id, with_marks):
+                if kind == "entry":
+                    entry = data
+                else:
+                    events.put_nowait((kind, data))
+            return entry
+
+        async def fly():
+            try:
+                return await single_flight.run(
+                    db,
+                    f"content:{key}",
+                    produce=produce,
+                    lookup=lambda: content_cache.find(db, key)
+                )
+            finally:
+                events.put_nowait(finished)
+
+        flight = asyncio.create_task(fly())
+        try:
+            while (event := await events.get()) is not finished:
+                yield event
+            entry, shared = await flight
+        finally:
+            flight.cancel()
+
+        if shared:
+            yield "delta", {"text": entry["content"]}
+            if with_marks:
+                entry = await self.ensure_speech_marks(db, key, entry)
+        yield ("shared" if shared else "entry"), entry
+
+    async def _store_segment(
+        self,
+        db: AsyncIOMotorDatabase,
+        stream_id: str,
+        index: int,
+        text: str,
+        audio: bytes,
+        marks: list,
+        timeline: List[List[int]],
+        merger: SegmentMerger
+    ) -> dict:
+        offset_ms = merger.time_offset
+        shifted = merger.add(text, audio, marks, timeline)
+        # Short-lived; a TTL index drops segments once the session is stored
+        await db["stream_segments"].insert_one({
+            "_id": f"{stream_id}:{index}",
+            "audio": audio,
+            "created_at": datetime.utcnow()
+        })
+        return {
+            "index": index,
+            "offset_ms": round(offset_ms),
+            "duration_ms": round(merger.time_offset - offset_ms),
+            "speech_marks": shifted,
+        }
+
+    async def create_session(
+        self,
+        db: AsyncIOMotorDatabase,
+        user: UserInDB,
+        study_in: StudyPrompt,
+        entry: dict,
+        cache_hit: bool,
+        now: datetime
+    ) -> dict:
+        """
+        Create the user's session pointing at a shared entry and record usage.
+
+        A user has at most one session per entry (unique index), so a
+        duplicate request gets the existing session back and is not counted
+        or billed again.
+        """
+        session_id = str(uuid.uuid4())
+
+        session_dict = {
+            "_id": session_id,
+            "user_id": user.id,
+            "topic": study_in.topic,
+            "prompt": study_in.prompt,
+            "content_key": entry["_id"],
+            "audio_file_id": entry["audio_file_id"],
+            "audio_size": entry.get("audio_size"),
+            "duration_minutes": study_in.duration_minutes,
+            "exam_mode": study_in.exam_mode,
+            "listen_count": 0,
+            "created_at": now
+        }
+        try:
+            await db["study_sessions"].insert_one(session_dict)
+        except DuplicateKeyError:
+            existing = await db["study_sessions"].find_one(
+                {"user_id": user.id, "content_key": entry["_id"]}, {"audio_data": 0}
+            )
+            if existing:
+                return existing
+            raise
+
+        # Update user usage
+        await db["users"].update_one(
+            {"_id": user.id},
+            {
+                "$set": {"last_generation_date": now},
+                "$inc": {"daily_generations": 1}
+            }
+        )
+        # The daily limit check reads daily_generations from the cached user
+        auth_cache.invalidate_user(user.id)
+
+        # Store usage and cost (Cost Awareness); a cache hit costs nothing
+        openai_usage = 0 if cache_hit else entry.get("openai_tokens", 0)
+        polly_usage = 0 if cache_hit else entry.get("polly_characters", 0)
+        openai_cost = (openai_usage / 1000) * OPENAI_COST_PER_1K_TOKENS
+        polly_cost = (polly_usage / 1000000) * POLLY_COST_PER_1M_CHARS
+        usage = {
+            "session_id": session_id,
+            "user_id": user.id,
+            "content_key": entry["_id"],
+            "cache_hit": cache_hit,
+            "openai_tokens": openai_usage,
+            "polly_characters": polly_usage,
+            "openai_cost": openai_cost,
+            "polly_cost": polly_cost,
+            "total_cost": openai_cost + polly_cost,
+            "created_at": now
+        }
+        await db["usage"].insert_one(usage)
+        await usage_rollup.record(db, usage)
+
+        return session_dict
+
+generation_service = GenerationService()
@@ -0,0 +1,195 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from app.core.config import settings
+from datetime import datetime, timedelta
+from typing import Optional
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Mongo-backed generation job queue.
+
+    Workers claim a job by atomically flipping it to running with a lease
+    that they keep renewing. A job whose lease runs out (its worker died) is
+    claimable again, up to JOB_MAX_ATTEMPTS times; after that a periodic
+    sweep (fail_abandoned) fails it. A job that raised is requeued with
+    exponential backoff. Only the worker holding a job can finish it.
+    """
+
+    collection = "generation_jobs"
+
+    async def enqueue(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        request: dict,
+        content_key: str,
+        session_id: Optional[str] = None
+    ) -> dict:
+        """Queue a job; with session_id the result is already known and the job is born completed."""
+        now = datetime.utcnow()
+        job = {
+            "_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "request": request,
+            "content_key": content_key,
+            "status": QUEUED,
+            "stage": QUEUED,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        }
+        if session_id:
+            job.update(status=COMPLETED, stage=COMPLETED, session_id=session_id, finished_at=now)
+        await db[self.collection].insert_one(job)
+        return job
+
+    async def pending_count(self, db: AsyncIOMotorDatabase, user_id: str) -> int:
+        return await db[self.collection].count_documents(
+            {"user_id": user_id, "status": {"$in": [QUEUED, RUNNING]}}
+        )
+
+    @staticmethod
+    def claimable(now: datetime) -> dict:
+        """
+        Queued jobs past their retry backoff, and running ones whose worker
+        stopped renewing, with attempts left.
+        """
+        return {
+            "$or": [
+                {"status": QUEUED, "not_before": {"$not": {"$gt": now}}},
+                {"status": RUNNING, "lease_expires_at": {"$lt": now}},
+            ],
+            "attempts": {"$lt": settings.JOB_MAX_ATTEMPTS}
+        }
+
+    @staticmethod
+    def abandoned(now: datetime) -> dict:
+        """Running jobs whose worker died on their last attempt."""
+        return {
+            "status": RUNNING,
+            "lease_expires_at": {"$lt": now},
+            "attempts": {"$gte": settings.JOB_MAX_ATTEMPTS}
+        }
+
+    async def fail_abandoned(self, db: AsyncIOMotorDatabase, now: datetime) -> int:
+        """
+        Mark abandoned jobs failed, so they stop counting as pending and the
+        TTL index can remove them.
+        """
+        result = await db[self.collection].update_many(
+            self.abandoned(now),
+            {
+                "$set": {
+                    "status": FAILED,
+                    "stage": FAILED,
+                    "error": "Worker stopped responding on the last attempt",
+                    "finished_at": now,
+                    "updated_at": now
+                },
+                "$unset": {"lease_expires_at": ""}
+            }
+        )
+        if result.modified_count:
+            logger.warning(f"Failed {result.modified_count} abandoned generation jobs")
+        return result.modified_count
+
+    async def claim(self, db: AsyncIOMotorDatabase, worker_id: str) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await db[self.collection].find_one_and_update(
+            self.claimable(now),
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker_id": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                    "started_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1},
+                "$unset": {"not_before": ""}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renew(self, db: AsyncIOMotorDatabase, job_id: str, worker_id: str) -> bool:
+        result = await db[self.collection].update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": RUNNING},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS)}}
+        )
+        return result.modified_count == 1
+
+    async def set_stage(self, db: AsyncIOMotorDatabase, job_id: str, stage: str) -> None:
+        await db[self.collection].update_one(
+            {"_id": job_id},
+            {"$set": {"stage": stage, "updated_at": datetime.utcnow()}}
+        )
+
+    @staticmethod
+    def held(job_id: str, worker_id: str) -> dict:
+        """The job, as long as worker_id still holds it (its lease wasn't taken over)."""
+        return {"_id": job_id, "worker_id": worker_id, "status": RUNNING}
+
+    async def complete(self, db: AsyncIOMotorDatabase, job_id: str, worker_id: str, session_id: str) -> bool:
+        now = datetime.utcnow()
+        result = await db[self.collection].update_one(
+            self.held(job_id, worker_id),
+            {
+                "$set": {
+                    "status": COMPLETED,
+                    "stage": COMPLETED,
+                    "session_id": session_id,
+                    "finished_at": now,
+                    "updated_at": now
+                },
+                "$unset": {"lease_expires_at": ""}
+            }
+        )
+        return result.modified_count == 1
+
+    async def fail(self, db: AsyncIOMotorDatabase, job: dict, worker_id: str, error: str) -> bool:
+        """Requeue the job after a backoff, or mark it failed once it is out of attempts."""
+        now = datetime.utcnow()
+        attempts = job.get("attempts", 0)
+        if attempts >= settings.JOB_MAX_ATTEMPTS:
+            update = {"status": FAILED, "stage": FAILED, "error": error, "finished_at": now, "updated_at": now}
+        else:
+            delay = min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+            update = {
+                "status": QUEUED,
+                "stage": QUEUED,
+                "error": error,
+                "not_before": now + timedelta(seconds=delay),
+                "updated_at": now
+            }
+        result = await db[self.collection].update_one(
+            self.held(job["_id"], worker_id),
+            {"$set": update, "$unset": {"lease_expires_at": ""}}
+        )
+        return result.modified_count == 1
+
+    async def release(self, db: AsyncIOMotorDatabase, job: dict, worker_id: str) -> None:
+        """Hand a job back untouched (e.g. on shutdown) without using up an attempt."""
+        await db[self.collection].update_one(
+            self.held(job["_id"], worker_id),
+            {
+                "$set": {"status": QUEUED, "stage": QUEUED, "updated_at": datetime.utcnow()},
+                "$inc": {"attempts": -1},
+                "$unset": {"lease_expires_at": "", "worker_id": ""}
+            }
+        )
+
+    async def get(self, db: AsyncIOMotorDatabase, job_id: str) -> Optional[dict]:
+        return await db[self.collection].find_one({"_id": job_id})
+
+job_queue = JobQueue()
@@ -0,0 +1,149 @@
+"""
+Minimal MPEG audio frame parser.
+
+Polly returns plain MPEG-1/2/2.5 Layer III streams, so walking the frame
+headers is enough to get exact durations without decoding any audio.
+"""
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+# Bitrates in kbps indexed by [is_mpeg1][layer][bitrate_index]
+_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+
+# Sample rates indexed by version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1)
+_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+
+def _skip_id3(data: bytes) -> int:
+    """Return the offset of the first byte after a leading ID3v2 tag."""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        return 10 + size
+    return 0
+
+
+def _parse_header(data: bytes, pos: int):
+    """Return (frame_length, samples, sample_rate) for a header at pos, or None."""
+    if pos + 4 > len(data):
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = (b2 >> 4) & 0x0F
+    rate_index = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits
+    is_mpeg1 = version == 3
+    bitrate = _BITRATES[is_mpeg1][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or is_mpeg1:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate // sample_rate + padding
+
+    if length <= 4:
+        return None
+    return length, samples, sample_rate
+
+
+def iter_frames(data: bytes) -> Iterator[tuple[int, int, float]]:
+    """
+    Yield (offset, length, duration_ms) for every audio frame in data.
+
+    Garbage between frames is skipped one byte at a time until the next
+    valid sync word, which also tolerates trailing tags.
+    """
+    pos = _skip_id3(data)
+    end = len(data)
+    while pos < end - 4:
+        header = _parse_header(data, pos)
+        if header is None:
+            pos += 1
+            continue
+        length, samples, sample_rate = header
+        if pos + length > end:
+            break
+        yield pos, length, samples * 1000.0 / sample_rate
+        pos += length
+
+
+def duration_ms(data: bytes) -> float:
+    """Total playback duration of an MP3 byte string in milliseconds."""
+    return sum(frame[2] for frame in iter_frames(data))
+
+
+def build_frame_index(data: bytes, interval_ms: int = 1000) -> List[List[int]]:
+    """
+    Map playback time to byte offsets, one entry per interval_ms.
+
+    Each entry is [time_ms, byte_offset] for the first frame starting at or
+    after a multiple of interval_ms, so seeking to that offset always lands
+    on a frame boundary.
+    """
+    index = []
+    elapsed = 0.0
+    next_mark = 0
+    for offset, _, frame_ms in iter_frames(data):
+        if elapsed >= next_mark:
+            index.append([round(elapsed), offset])
+            next_mark = (int(elapsed // interval_ms) + 1) * interval_ms
+        elapsed += frame_ms
+    return index
+
+
+def offset_for_time(index: List[List[int]], time_ms: float) -> int:
+    """Byte offset of the last indexed frame at or before time_ms."""
+    if not index:
+        return 0
+    pos = bisect_right([entry[0] for entry in index], time_ms) - 1
+    return index[max(pos, 0)][1]
+
+
+def segment_bounds(
+    index: List[List[int]], size: int, target_ms: int, total_ms: Optional[float] = None
+) -> List[Tuple[int, int, float]]:
+    """
+    Split a file into pieces of about target_ms cut at indexed frame
+    boundaries. Returns (start, end inclusive, duration_ms) per piece.
+
+    Without total_ms the last piece's duration is estimated from the
+    average byte rate of the indexed part.
+    """
+    if size <= 0:
+        return []
+    cuts = [(0, 0)]
+    for time_ms, offset in index:
+        if time_ms >= cuts[-1][0] + target_ms and cuts[-1][1] < offset < size:
+            cuts.append((time_ms, offset))
+    if total_ms is None:
+        last_time, last_offset = index[-1] if index else (0, 0)
+        total_ms = last_time + (size - last_offset) * (last_time / last_offset if last_offset else 0)
+    ends = cuts[1:] + [(total_ms, size)]
+    return [(offset, next_offset - 1, next_time - time_ms) for (time_ms, offset), (next_time, next_offset) in zip(cuts, ends)]
@@ -1,11 +1,123 @@
+import asyncio
+import json
+import re
 import boto3
 from app.core.config import settings
+from app.core import metrics
+from app.services import mp3
+from app.services.tts_fragments import normalize_sentence, tts_fragment_cache
 import logging
-from typing import IO
+from typing import List, Optional
 from contextlib import closing
 
 logger = logging.getLogger(__name__)
 
+# A sentence ends at terminal punctuation (plus any closing quotes/brackets)
+# followed by whitespace, or at a line break. The whitespace stays with the
+# preceding sentence so that joining the pieces gives back the original text.
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+
+# Words whose period does not end the sentence ("Dr. Smith", "e.g. this")
+_ABBREVIATIONS = {
+    "approx", "cf", "dept", "dr", "e.g", "etc", "fig", "i.e", "jr", "mr", "mrs", "ms", "prof", "sr", "st", "vs",
+}
+
+
+def _ends_with_abbreviation(text: str) -> bool:
+    """Whether text ends with an abbreviation or an initial ("J.") rather than a full stop."""
+    if not text.endswith("."):
+        return False
+    words = text.rsplit(None, 1)
+    if not words:
+        return False
+    word = words[-1].lstrip("\"'([").rstrip(".").lower()
+    return word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences without dropping any characters."""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        if "\n" not in match.group() and _ends_with_abbreviation(text[start:match.start()]):
+            continue
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def chunk_text(text: str, chunk_size: int) -> List[str]:
+    """
+    Pack whole sentences into chunks of at most chunk_size characters.
+
+    Sentences longer than chunk_size are cut at the last whitespace before
+    the limit (or hard-cut if there is none).
+    """
+    chunks = []
+    current = ""
+    for sentence in split_sentences(text):
+        while len(sentence) > chunk_size:
+            cut = sentence.rfind(" ", 0, chunk_size) + 1 or chunk_size
+            piece, sentence = sentence[:cut], sentence[cut:]
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(piece)
+        if current and len(current) + len(sentence) > chunk_size:
+            chunks.append(current)
+            current = ""
+        current += sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SegmentMerger:
+    """
+    Concatenates synthesized segments in order and shifts their speech marks
+    onto the combined timeline.
+
+    timeline records where each Polly request's text and audio start, as
+    [byte offset, time offset in ms] pairs, so speech marks can be requested
+    later and placed exactly without the audio.
+    """
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.speech_marks: List[dict] = []
+        self.timeline: List[List[int]] = []
+        self.byte_offset = 0
+        self.time_offset = 0.0
+
+    def add(self, text: str, audio: bytes, marks: List[dict], timeline: Optional[List[List[int]]] = None) -> List[dict]:
+        """
+        Append one segment; returns its marks shifted to the combined timeline.
+
+        timeline is the segment's own timeline when it was merged from
+        several requests; by default the segment is one request.
+        """
+        self.parts.append(audio)
+        for byte_offset, time_offset in timeline or [[0, 0]]:
+            self.timeline.append([byte_offset + self.byte_offset, time_offset + round(self.time_offset)])
+        # Shift marks by the real playback length of the preceding segments.
+        # Polly reports start/end as byte offsets into the request text.
+        shifted = []
+        for mark in marks:
+            mark["time"] += round(self.time_offset)
+            mark["start"] += self.byte_offset
+            mark["end"] += self.byte_offset
+            shifted.append(mark)
+        self.speech_marks.extend(shifted)
+        self.time_offset += mp3.duration_ms(audio)
+        self.byte_offset += len(text.encode("utf-8"))
+        return shifted
+
+    def audio(self) -> bytes:
+        return b"".join(self.parts)
+
+
 class PollyService:
     def __init__(self):
         if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
@@ -17,79 +129,263 @@ class PollyService:
             )
         else:
             self.client = None
+        self.voice_id = settings.POLLY_VOICE_ID
+        self.engine = settings.POLLY_ENGINE
+        self.chunk_size = settings.POLLY_CHUNK_SIZE
+        # Created lazily so it binds to the running event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.POLLY_MAX_CONCURRENCY)
+        return self._semaphore
+
+    def _synthesize(self, **params) -> bytes:
+        """Blocking Polly call; always run through asyncio.to_thread."""
+        response = self.client.synthesize_speech(
+            VoiceId=self.voice_id,
+            Engine=self.engine,
+            **params
+        )
+        logger.debug("Polly response", extra={
+            "format": params["OutputFormat"],
+            "chars": len(params["Text"]),
+            "request_id": response.get("ResponseMetadata", {}).get("RequestId")
+        })
+        if "AudioStream" not in response:
+            raise Exception(f"Could not synthesize speech ({params['OutputFormat']})")
+        with closing(response["AudioStream"]) as stream:
+            return stream.read()
+
+    async def _call(self, **params) -> bytes:
+        metrics.polly_characters.inc(len(params["Text"]))
+        async with self._get_semaphore():
+            return await asyncio.to_thread(self._synthesize, **params)
+
+    async def _chunk_marks(self, chunk: str) -> list[dict]:
+        marks_raw = await self._call(Text=chunk, OutputFormat="json", SpeechMarkTypes=["word"])
+        # Polly returns multiple JSON objects, one per line
+        return [json.loads(line) for line in marks_raw.decode("utf-8").splitlines() if line]
+
+    async def _synthesize_chunk(self, chunk: str, with_marks: bool = True) -> tuple[bytes, list[dict], int]:
+        """Returns (audio, marks, characters billed)."""
+        if not chunk.strip():
+            return b"", [], 0
+        with metrics.timer("polly_chunk"):
+            if not with_marks:
+                return await self._call(Text=chunk, OutputFormat="mp3"), [], len(chunk)
+            # Audio and speech marks are independent requests, so issue them together
+            audio, marks = await asyncio.gather(
+                self._call(Text=chunk, OutputFormat="mp3"),
+                self._chunk_marks(chunk),
+            )
+            return audio, marks, 2 * len(chunk)
+
+    def _fragment_key(self, normalized: str) -> str:
+        return tts_fragment_cache.make_key(normalized, self.voice_id, self.engine, "mp3", None)
 
-    async def text_to_speech(self, text: str) -> tuple[bytes, list[dict], int]:
+    async def _fragment(self, db, key: str, normalized: str, fragment: Optional[dict], with_marks: bool):
+        """
+        Audio, marks and characters billed for one normalized sentence,
+        synthesizing (and caching) what is missing.
+        """
+        if fragment is None or "audio" not in fragment:
+            audio, marks, billed = await self._synthesize_chunk(normalized, with_marks)
+            await tts_fragment_cache.put(db, key, audio, marks if with_marks else None)
+            return audio, marks, billed
+        audio, marks = fragment["audio"], fragment.get("marks")
+        if with_marks and marks is None:
+            marks = await self._chunk_marks(normalized)
+            await tts_fragment_cache.set_marks(db, key, marks)
+            return audio, marks, len(normalized)
+        return audio, marks or [], 0
+
+    async def _plan(self, db, text: str) -> list[tuple[str, Optional[str], Optional[tuple], Optional[dict]]]:
+        """
+        Pieces of text as (piece, fragment key, normalized sentence, fragment).
+
+        Sentences that are cached, or seen often enough to be worth caching,
+        are pieces of their own with a key. The sentences between them are
+        packed into chunks again (key None), so a cold cache costs no more
+        Polly requests than no cache at all.
+        """
+        sentences = [piece for sentence in split_sentences(text) for piece in chunk_text(sentence, self.chunk_size)]
+        normalized = [normalize_sentence(sentence) for sentence in sentences]
+        keys = [self._fragment_key(sentence) if sentence else None for sentence, _ in normalized]
+        fragments = await tts_fragment_cache.get_many(db, [key for key in keys if key])
+
+        plan = []
+        run = ""
+        for sentence, key, norm in zip(sentences, keys, normalized):
+            if key and tts_fragment_cache.admits(fragments.get(key)):
+                plan.extend((chunk, None, None, None) for chunk in chunk_text(run, self.chunk_size))
+                run = ""
+                plan.append((sentence, key, norm, fragments.get(key)))
+            else:
+                run += sentence
+        plan.extend((chunk, None, None, None) for chunk in chunk_text(run, self.chunk_size))
+        return plan
+
+    async def _synthesize_pieces(
+        self, db, text: str, with_marks: bool
+    ) -> tuple[list[tuple[str, bytes, list[dict]]], int]:
+        """
+        Synthesize text as (piece, audio, marks) in order, through the
+        fragment cache when given a database. Also returns the characters
+        actually sent to Polly.
+        """
+        if db is None or not settings.TTS_FRAGMENT_CACHE_ENABLED:
+            plan = [(chunk, None, None, None) for chunk in chunk_text(text, self.chunk_size)]
+        else:
+            plan = await self._plan(db, text)
+
+        # A sentence repeated within the text is synthesized once
+        tasks = []
+        fragment_tasks = {}
+        for piece, key, norm, fragment in plan:
+            if key is None:
+                tasks.append(asyncio.ensure_future(self._synthesize_chunk(piece, with_marks)))
+                continue
+            if key not in fragment_tasks:
+                fragment_tasks[key] = asyncio.ensure_future(self._fragment(db, key, norm[0], fragment, with_marks))
+            tasks.append(fragment_tasks[key])
+        try:
+            await asyncio.gather(*set(tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        results = []
+        billed = 0
+        for (piece, key, norm, _), task in zip(plan, tasks):
+            audio, marks, task_billed = task.result()
+            if key is None or fragment_tasks.pop(key, None) is not None:
+                # Repeated sentences share one task; bill it once
+                billed += task_billed
+            if key is not None:
+                # Marks refer to the normalized sentence; map them back onto this piece
+                offsets = norm[1]
+                last = len(offsets) - 1
+                marks = [
+                    {**mark, "start": offsets[min(mark["start"], last)], "end": offsets[min(mark["end"], last)]}
+                    for mark in marks
+                ]
+            results.append((piece, audio, marks))
+        return results, billed
+
+    async def synthesize_segment(
+        self, text: str, with_marks: bool = True, db=None
+    ) -> tuple[bytes, list[dict], list[list[int]], int]:
+        """
+        Synthesize one piece of a larger text (e.g. a few sentences while
+        content is still streaming in). Returns (audio, marks, timeline,
+        characters billed); marks and timeline are relative to the segment,
+        and marks are only requested when with_marks is set.
+
+        Polly has a character limit per request (3000 for neural, 6000 for
+        standard), so the text goes out in chunks of whole sentences below
+        it. With a database, sentences found in the shared fragment cache
+        are reused instead of synthesized.
+        """
+        if not self.client:
+            return b"Mock audio data", [], [[0, 0]], len(text)
+
+        merger = SegmentMerger()
+        pieces, billed = await self._synthesize_pieces(db, text, with_marks)
+        for piece, audio, marks in pieces:
+            merger.add(piece, audio, marks)
+        return merger.audio(), merger.speech_marks, merger.timeline, billed
+
+    async def text_to_speech(
+        self, text: str, with_marks: bool = True, db=None
+    ) -> tuple[bytes, list[dict], int, list[list[int]]]:
+        """Returns (audio, speech marks, characters billed, timeline)."""
         if not self.client:
             logger.warning("AWS Polly client not initialized. Returning mock audio data.")
-            return b"Mock audio data", [], len(text)
+            return b"Mock audio data", [], len(text), [[0, 0]]
 
         try:
-            # Polly has a character limit per request (3000 for neural, 6000 for standard)
-            # We'll use a safe chunk size of 2500 characters
-            chunk_size = 2500
-            text_chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
-            
-            combined_audio = b""
-            combined_speech_marks = []
-            total_chars = 0
-            current_time_offset = 0
-
-            for chunk in text_chunks:
-                # 1. Synthesize Audio
-                audio_response = self.client.synthesize_speech(
-                    Text=chunk,
-                    OutputFormat="mp3",
-                    VoiceId="Joanna",
-                    Engine="neural"
-                )
-                logger.info(f"Polly Audio Response Metadata: {audio_response.get('ResponseMetadata')}")
-                
-                if "AudioStream" in audio_response:
-                    with closing(audio_response["AudioStream"]) as stream:
-                        combined_audio += stream.read()
-                else:
-                    raise Exception("Could not synthesize speech audio")
-
-                # 2. Synthesize Speech Marks (Timestamps)
-                marks_response = self.client.synthesize_speech(
-                    Text=chunk,
-                    OutputFormat="json",
-                    SpeechMarkTypes=["word"],
-                    VoiceId="Joanna",
-                    Engine="neural"
-                )
-                logger.info(f"Polly Marks Response Metadata: {marks_response.get('ResponseMetadata')}")
-
-                last_mark_time = 0
-                if "AudioStream" in marks_response:
-                    with closing(marks_response["AudioStream"]) as stream:
-                        marks_text = stream.read().decode("utf-8")
-                        # Polly returns multiple JSON objects, one per line
-                        for line in marks_text.strip().split("\n"):
-                            if line:
-                                import json
-                                mark = json.loads(line)
-                                # Adjust time and start position for combined marks
-                                mark["time"] += current_time_offset
-                                mark["start"] += total_chars
-                                combined_speech_marks.append(mark)
-                                last_mark_time = max(last_mark_time, mark["time"])
-                
-                # Update offsets for next chunk
-                # We use the last mark's time as a base for the next chunk's offset.
-                # We add a small buffer (e.g., 500ms) to account for the pause between chunks/sentences.
-                if last_mark_time > current_time_offset:
-                    current_time_offset = last_mark_time + 300 # Approximate pause between chunks
-                
-                total_chars += len(chunk)
-                # We'll need a way to get the duration of the audio chunk to update current_time_offset
-                # For MP3, we can estimate or use a library. 
-                # Given the constraints, let's at least ensure all text is synthesized.
-                
-            return combined_audio, combined_speech_marks, len(text)
-                
+            audio, speech_marks, timeline, billed = await self.synthesize_segment(text, with_marks, db)
+            return audio, speech_marks, billed, timeline
+
         except Exception as e:
             logger.error(f"Error in Polly synthesis: {e}")
             raise e
 
+    async def synthesize_rendition(
+        self, text: str, output_format: str, sample_rate: Optional[str] = None
+    ) -> tuple[bytes, int]:
+        """Audio for text in another format or sample rate, and characters billed; no speech marks."""
+        if not self.client:
+            return b"Mock audio data", len(text)
+
+        params = {"OutputFormat": output_format}
+        if sample_rate:
+            params["SampleRate"] = sample_rate
+        chunks = [chunk for chunk in chunk_text(text, self.chunk_size) if chunk.strip()]
+        with metrics.timer("polly_rendition"):
+            parts = await asyncio.gather(*(self._call(Text=chunk, **params) for chunk in chunks))
+        return b"".join(parts), sum(len(chunk) for chunk in chunks)
+
+    async def _slice_marks(self, db, slice_text: str, fragment: Optional[dict]) -> list[dict]:
+        """Marks of one timeline slice, relative to the slice."""
+        if fragment is None:
+            return await self._chunk_marks(slice_text)
+        # The slice was synthesized from a cached fragment, whose marks refer
+        # to its normalized text
+        normalized, offsets = normalize_sentence(slice_text)
+        marks = fragment.get("marks")
+        if marks is None:
+            marks = await self._chunk_marks(normalized)
+            await tts_fragment_cache.set_marks(db, fragment["_id"], marks)
+        last = len(offsets) - 1
+        return [
+            {**mark, "start": offsets[min(mark["start"], last)], "end": offsets[min(mark["end"], last)]}
+            for mark in marks
+        ]
+
+    async def speech_marks_for(self, text: str, timeline: List[List[int]], db=None) -> list[dict]:
+        """
+        Word marks for audio synthesized earlier without them, placed with the
+        timeline recorded at the time.
+
+        Each timeline slice was one Polly request or one cached sentence.
+        With a database, slices found in the fragment cache take their marks
+        from there (requesting and storing them once if the fragment has
+        none); the rest are requested slice by slice, as they were
+        synthesized.
+        """
+        if not self.client:
+            return []
+
+        data = text.encode("utf-8")
+        bounds = [byte_offset for byte_offset, _ in timeline[1:]] + [len(data)]
+        slices = []
+        for (byte_offset, time_offset), end in zip(timeline, bounds):
+            slice_text = data[byte_offset:end].decode("utf-8")
+            if slice_text.strip():
+                slices.append((byte_offset, time_offset, slice_text))
+
+        fragments = {}
+        keys = [None] * len(slices)
+        if db is not None and settings.TTS_FRAGMENT_CACHE_ENABLED:
+            keys = [self._fragment_key(normalize_sentence(slice_text)[0]) for _, _, slice_text in slices]
+            fragments = await tts_fragment_cache.get_many(db, keys, sightings=False)
+
+        cached = {key: doc for key, doc in fragments.items() if "audio" in doc}
+        with metrics.timer("polly_marks"):
+            results = await asyncio.gather(*(
+                self._slice_marks(db, slice_text, cached.get(key))
+                for (_, _, slice_text), key in zip(slices, keys)
+            ))
+
+        speech_marks = []
+        for (byte_offset, time_offset, _), marks in zip(slices, results):
+            for mark in marks:
+                mark["time"] += time_offset
+                mark["start"] += byte_offset
+                mark["end"] += byte_offset
+                speech_marks.append(mark)
+        return speech_marks
+
 polly_service = PollyService()
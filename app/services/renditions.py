@@ -0,0 +1,134 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config import settings
+from app.core.ttl_cache import TTLCache
+from app.services.audio_store import audio_store
+from app.services.content_cache import content_cache
+from app.services.generation_service import POLLY_COST_PER_1M_CHARS
+from app.services.polly_service import polly_service
+from app.services.single_flight import single_flight
+from app.services.usage_rollup import usage_rollup
+from app.services import mp3
+from datetime import datetime
+from typing import Mapping, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Alternative encodings of a session's audio, synthesized on first request
+RENDITIONS = {
+    "mp3_16k": {"output_format": "mp3", "sample_rate": "16000", "media_type": "audio/mpeg"},
+    "mp3_22k": {"output_format": "mp3", "sample_rate": "22050", "media_type": "audio/mpeg"},
+    "mp3_24k": {"output_format": "mp3", "sample_rate": "24000", "media_type": "audio/mpeg"},
+    "ogg": {"output_format": "ogg_vorbis", "sample_rate": None, "media_type": "audio/ogg"},
+}
+ORIGINAL = "original"
+
+# Sample rate of Polly's MP3 output per engine when none is requested; the
+# rendition at that rate is the original audio
+DEFAULT_MP3_SAMPLE_RATES = {"standard": "22050", "neural": "24000", "long-form": "24000", "generative": "24000"}
+
+# Connection types (ECT client hint) that get the smallest rendition by default
+SLOW_CONNECTIONS = {"slow-2g", "2g", "3g"}
+
+
+def _same_as_original(spec: dict) -> bool:
+    return spec["output_format"] == "mp3" and spec["sample_rate"] == DEFAULT_MP3_SAMPLE_RATES.get(settings.POLLY_ENGINE)
+
+
+def choose(quality: Optional[str], headers: Mapping[str, str]) -> str:
+    """
+    Rendition for a request: the explicit quality if given, else the
+    smallest one for clients asking to save data or on a slow connection.
+    A quality identical to the original audio is served as the original.
+    """
+    if quality and quality != "auto":
+        if quality != ORIGINAL and quality not in RENDITIONS:
+            raise ValueError(f"Unknown quality {quality}")
+        if quality != ORIGINAL and _same_as_original(RENDITIONS[quality]):
+            return ORIGINAL
+        return quality
+    if headers.get("save-data", "").lower() == "on" or headers.get("ect", "").lower() in SLOW_CONNECTIONS:
+        return "mp3_16k"
+    return ORIGINAL
+
+
+class RenditionService:
+    """
+    Lazily created renditions of shared content entries.
+
+    The first request for a rendition synthesizes the entry's text again in
+    that format and stores it in the audio store; the entry records it under
+    renditions.<name> so every later session of the entry reuses it.
+    """
+
+    def __init__(self):
+        # (content key, name) -> rendition fields; renditions never change once stored
+        self._cache = TTLCache(1024, 600)
+
+    async def get(
+        self, db: AsyncIOMotorDatabase, key: str, name: str, user_id: str, session_id: Optional[str] = None
+    ) -> dict:
+        """
+        Audio fields (audio_file_id, audio_size, ...) of rendition name of
+        entry key. Creating it is billed to user_id (and session_id).
+        """
+        rendition = self._cache.get((key, name))
+        if rendition is None:
+            rendition, _ = await single_flight.run(
+                db,
+                f"rendition:{key}:{name}",
+                produce=lambda: self._produce(db, key, name, user_id, session_id),
+                lookup=lambda: self._lookup(db, key, name)
+            )
+            self._cache.set((key, name), rendition)
+        return rendition
+
+    async def _lookup(self, db: AsyncIOMotorDatabase, key: str, name: str) -> Optional[dict]:
+        entry = await db[content_cache.collection].find_one({"_id": key}, {f"renditions.{name}": 1})
+        return ((entry or {}).get("renditions") or {}).get(name)
+
+    async def _produce(
+        self, db: AsyncIOMotorDatabase, key: str, name: str, user_id: str, session_id: Optional[str]
+    ) -> dict:
+        entry = await db[content_cache.collection].find_one({"_id": key}, {"content": 1})
+        if not entry:
+            raise LookupError(f"Content entry {key} not found")
+        spec = RENDITIONS[name]
+        audio_data, polly_usage = await polly_service.synthesize_rendition(
+            entry["content"], spec["output_format"], spec["sample_rate"]
+        )
+        file_id = await audio_store.put(
+            db, audio_data, content_type=spec["media_type"], metadata={"content_key": key, "rendition": name}
+        )
+        is_mp3 = spec["output_format"] == "mp3"
+        rendition = {
+            "audio_file_id": file_id,
+            "audio_size": len(audio_data),
+            # Seeking by time and HLS segments need MP3 frames
+            "audio_frame_index": mp3.build_frame_index(audio_data) if is_mp3 else [],
+            "audio_duration_ms": round(mp3.duration_ms(audio_data)) if is_mp3 else None,
+            "media_type": spec["media_type"],
+        }
+        await db[content_cache.collection].update_one({"_id": key}, {"$set": {f"renditions.{name}": rendition}})
+        logger.info("Created audio rendition", extra={"content_key": key, "rendition": name, "bytes": len(audio_data)})
+
+        # Billed like a session's synthesis, without counting as a session
+        polly_cost = (polly_usage / 1000000) * POLLY_COST_PER_1M_CHARS
+        usage = {
+            "session_id": session_id,
+            "user_id": user_id,
+            "content_key": key,
+            "rendition": name,
+            "cache_hit": False,
+            "openai_tokens": 0,
+            "polly_characters": polly_usage,
+            "openai_cost": 0.0,
+            "polly_cost": polly_cost,
+            "total_cost": polly_cost,
+            "created_at": datetime.utcnow()
+        }
+        await db["usage"].insert_one(usage)
+        await usage_rollup.record(db, usage)
+        return rendition
+
+rendition_service = RenditionService()
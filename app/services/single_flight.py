@@ -0,0 +1,119 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from app.core.config import settings
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import os
+import socket
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Run a piece of work at most once at a time per key.
+
+    Callers in the same process share one asyncio future. Across uvicorn
+    workers the leader holds a lease document in Mongo that it keeps renewing;
+    everyone else polls for the result and takes the lease over if the
+    holder stops renewing it (e.g. the worker crashed).
+    """
+
+    collection = "generation_leases"
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def run(
+        self,
+        db: AsyncIOMotorDatabase,
+        key: str,
+        produce: Callable[[], Awaitable[T]],
+        lookup: Callable[[], Awaitable[Optional[T]]]
+    ) -> tuple[T, bool]:
+        """
+        Return (result, shared). shared is True when the result was produced
+        by another caller rather than by this call's own produce().
+
+        lookup() must return the stored result of a finished flight, or None.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            result, _ = await asyncio.shield(future)
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            outcome = await self._lead(db, key, produce, lookup)
+            future.set_result(outcome)
+            return outcome
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                e = RuntimeError(f"Flight {key} was cancelled")
+            future.set_exception(e)
+            # Mark as retrieved so unawaited failures don't log warnings
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _lead(self, db, key, produce, lookup) -> tuple:
+        while True:
+            result = await lookup()
+            if result is not None:
+                return result, True
+
+            if await self._acquire(db, key):
+                try:
+                    # The previous holder may have finished just before we took over
+                    result = await lookup()
+                    if result is not None:
+                        return result, True
+                    heartbeat = asyncio.create_task(self._heartbeat(db, key))
+                    try:
+                        return await produce(), False
+                    finally:
+                        heartbeat.cancel()
+                finally:
+                    await db[self.collection].delete_one({"_id": key, "owner": self.owner})
+
+            await asyncio.sleep(settings.GENERATION_POLL_SECONDS)
+
+    async def _acquire(self, db: AsyncIOMotorDatabase, key: str) -> bool:
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=settings.GENERATION_LEASE_SECONDS)
+        try:
+            await db[self.collection].insert_one({
+                "_id": key,
+                "owner": self.owner,
+                "lease_expires_at": expires,
+                "created_at": now
+            })
+            return True
+        except DuplicateKeyError:
+            # Take over a lease whose holder stopped renewing it
+            taken = await db[self.collection].find_one_and_update(
+                {"_id": key, "lease_expires_at": {"$lt": now}},
+                {"$set": {"owner": self.owner, "lease_expires_at": expires}}
+            )
+            if taken:
+                logger.warning(f"Took over expired lease {key} from {taken.get('owner')}")
+            return taken is not None
+
+    async def _heartbeat(self, db: AsyncIOMotorDatabase, key: str):
+        interval = settings.GENERATION_LEASE_SECONDS / 3
+        while True:
+            await asyncio.sleep(interval)
+            await db[self.collection].update_one(
+                {"_id": key, "owner": self.owner},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=settings.GENERATION_LEASE_SECONDS)}}
+            )
+
+single_flight = SingleFlight()
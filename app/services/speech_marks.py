@@ -0,0 +1,143 @@
+"""
+Compact storage for Polly speech marks.
+
+Marks are kept column-wise: times and text offsets as delta-encoded int32
+arrays, mark types and words as indexes into string tables, all zlib
+compressed. A 10-minute session shrinks from thousands of JSON objects to
+a few KB, and a time window can be cut out with a binary search.
+"""
+from app.core.ttl_cache import TTLCache
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Optional
+import json
+import struct
+import sys
+import zlib
+
+FORMAT_VERSION = 1
+
+# version, mark count, string table length
+_HEADER = struct.Struct("<BII")
+
+# Decoded marks by content key; entries never change once stored
+decoded_cache = TTLCache(512, 600)
+
+
+def _delta(values: List[int]) -> array:
+    return array("i", [b - a for a, b in zip([0] + values, values)])
+
+
+def _pack(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _unpack(data: bytes, count: int, offset: int) -> List[int]:
+    column = array("i")
+    column.frombytes(data[offset:offset + 4 * count])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tolist()
+
+
+class SpeechMarks:
+    """Speech marks in columns, ordered by time."""
+
+    def __init__(self, times: List[int], starts: List[int], ends: List[int], types: List[str], values: List[str]):
+        self.times = times
+        self.starts = starts
+        self.ends = ends
+        self.types = types
+        self.values = values
+
+    @classmethod
+    def from_list(cls, marks: List[dict]) -> "SpeechMarks":
+        marks = sorted(marks, key=lambda m: m["time"])
+        return cls(
+            [int(m["time"]) for m in marks],
+            [int(m["start"]) for m in marks],
+            [int(m["end"]) for m in marks],
+            [m.get("type", "word") for m in marks],
+            [m.get("value", "") for m in marks],
+        )
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _mark(self, i: int) -> dict:
+        return {
+            "time": self.times[i],
+            "type": self.types[i],
+            "start": self.starts[i],
+            "end": self.ends[i],
+            "value": self.values[i],
+        }
+
+    def to_list(self) -> List[dict]:
+        return [self._mark(i) for i in range(len(self))]
+
+    def window(self, from_ms: int, to_ms: Optional[int] = None) -> List[dict]:
+        """
+        Marks starting in [from_ms, to_ms), plus the one already being
+        spoken at from_ms so the player can highlight it straight away.
+        """
+        lo = max(bisect_right(self.times, from_ms) - 1, 0)
+        hi = len(self) if to_ms is None else bisect_left(self.times, to_ms)
+        return [self._mark(i) for i in range(lo, max(hi, lo))]
+
+    def encode(self) -> bytes:
+        type_table = sorted(set(self.types))
+        word_table = sorted(set(self.values))
+        type_ids = {t: i for i, t in enumerate(type_table)}
+        word_ids = {w: i for i, w in enumerate(word_table)}
+        strings = json.dumps([type_table, word_table], ensure_ascii=False).encode("utf-8")
+        body = b"".join([
+            _HEADER.pack(FORMAT_VERSION, len(self), len(strings)),
+            strings,
+            _pack(_delta(self.times)),
+            _pack(_delta(self.starts)),
+            # Lengths rather than end offsets; words are short so these compress well
+            _pack(array("i", [end - start for start, end in zip(self.starts, self.ends)])),
+            _pack(array("i", [type_ids[t] for t in self.types])),
+            _pack(array("i", [word_ids[w] for w in self.values])),
+        ])
+        return zlib.compress(body)
+
+    @classmethod
+    def decode(cls, blob: bytes) -> "SpeechMarks":
+        data = zlib.decompress(blob)
+        version, count, strings_length = _HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported speech mark format {version}")
+        offset = _HEADER.size
+        type_table, word_table = json.loads(data[offset:offset + strings_length].decode("utf-8"))
+        offset += strings_length
+        columns = []
+        for _ in range(5):
+            columns.append(_unpack(data, count, offset))
+            offset += 4 * count
+        time_deltas, start_deltas, lengths, type_ids, word_ids = columns
+        starts = list(accumulate(start_deltas))
+        return cls(
+            list(accumulate(time_deltas)),
+            starts,
+            [start + length for start, length in zip(starts, lengths)],
+            [type_table[i] for i in type_ids],
+            [word_table[i] for i in word_ids],
+        )
+
+
+def pack(marks: List[dict]) -> bytes:
+    return SpeechMarks.from_list(marks).encode()
+
+
+def from_document(doc: dict) -> SpeechMarks:
+    """Marks of a content entry or session, packed or in the old list form."""
+    packed = doc.get("speech_marks_packed")
+    if packed is not None:
+        return SpeechMarks.decode(bytes(packed))
+    return SpeechMarks.from_list(doc.get("speech_marks") or [])
@@ -1,58 +1,16 @@
 from openai import AsyncOpenAI
 from app.core.config import settings
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.services.config_cache import ConfigSnapshot, config_cache
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
-class StudyService:
-    def __init__(self):
-        api_key = settings.OPENAI_API_KEY
-        if api_key and api_key.startswith("ey"):
-            logger.error("OPENAI_API_KEY appears to be a JWT token instead of a valid OpenAI API key.")
-            self.client = None
-        else:
-            self.client = AsyncOpenAI(api_key=api_key) if api_key else None
-
-    async def generate_content(
-        self, 
-        db: AsyncIOMotorDatabase, 
-        topic: str, 
-        duration_minutes: int, 
-        prompt: str,
-        exam_mode: bool = False,
-        system_prompt_override: str = None
-    ) -> tuple[str, int]:
-        if not self.client:
-            logger.warning("OpenAI client not initialized. Returning mock content.")
-            return f"Mock study content for topic: {topic}. Duration: {duration_minutes} minutes. Exam Mode: {exam_mode}", 0
-
-        # Fetch dynamic config
-        config = await db["config"].find_one({"_id": "app_config"})
-        if not config:
-            # Fallback to defaults if config not found
-            char_limits = {"3": 2500, "5": 4500, "10": 9000}
-            topics = []
-        else:
-            char_limits = config.get("character_limits", {"3": 2500, "5": 4500, "10": 9000})
-            topics = config.get("topics", [])
-
-        max_chars = char_limits.get(str(duration_minutes), 2500)
-        
-        # Find topic template
-        topic_template = "Generate a comprehensive study guide about {topic}."
-        for t in topics:
-            if t["name"].lower() == topic.lower():
-                topic_template = t.get("prompt_template", topic_template)
-                break
-        
-        base_prompt = topic_template.format(topic=topic)
-        
-        if system_prompt_override:
-            system_prompt = system_prompt_override
-        else:
-            system_prompt = (
-                "You are an expert academic tutor. Generate accurate, engaging, and pedagogically effective study content based on the user’s topic and requirements."
+DEFAULT_CHARACTER_LIMITS = {"3": 2500, "5": 4500, "10": 9000}
+DEFAULT_TOPIC_TEMPLATE = "Generate a comprehensive study guide about {topic}."
+DEFAULT_SYSTEM_PROMPT = (
+    "You are an expert academic tutor. Generate accurate, engaging, and pedagogically effective study content based on the user’s topic and requirements."
 
 "Follow these rules:"
 
@@ -77,7 +35,51 @@ class StudyService:
 "Provide summaries, study tips, or practice questions"
 
 "Avoid unnecessary verbosity. Ensure factual accuracy and educational value at all times."
-            )
+)
+
+class StudyService:
+    def __init__(self):
+        api_key = settings.OPENAI_API_KEY
+        if api_key and api_key.startswith("ey"):
+            logger.error("OPENAI_API_KEY appears to be a JWT token instead of a valid OpenAI API key.")
+            self.client = None
+        else:
+            self.client = AsyncOpenAI(api_key=api_key) if api_key else None
+        self.model = settings.OPENAI_MODEL
+
+    def resolve_settings(
+        self,
+        config: ConfigSnapshot,
+        topic: str,
+        duration_minutes: int,
+        system_prompt_override: str = None
+    ) -> tuple[int, str, str]:
+        """Return (max_chars, topic_template, base system prompt) for a request."""
+        char_limits = config.character_limits
+        if char_limits is None:
+            # Fallback to defaults if not configured
+            char_limits = DEFAULT_CHARACTER_LIMITS
+
+        max_chars = char_limits.get(str(duration_minutes), 2500)
+        topic_template = config.topic_template(topic) or DEFAULT_TOPIC_TEMPLATE
+
+        system_prompt = system_prompt_override or DEFAULT_SYSTEM_PROMPT
+        return max_chars, topic_template, system_prompt
+
+    def build_request(
+        self,
+        config: ConfigSnapshot,
+        topic: str,
+        duration_minutes: int,
+        prompt: str,
+        exam_mode: bool = False,
+        system_prompt_override: str = None
+    ) -> tuple[list[dict], int, int]:
+        """Return (messages, max_tokens, max_chars) for a chat completion."""
+        max_chars, topic_template, system_prompt = self.resolve_settings(
+            config, topic, duration_minutes, system_prompt_override
+        )
+        base_prompt = topic_template.format(topic=topic)
 
         # Always append constraints to ensure output fits app requirements
         system_prompt += (
@@ -97,22 +99,48 @@ class StudyService:
         
         # Estimate tokens (roughly 1 token per 4 characters)
         max_tokens = (max_chars // 4) + 500 
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        return messages, max_tokens, max_chars
+
+    async def generate_content(
+        self, 
+        db: AsyncIOMotorDatabase, 
+        topic: str, 
+        duration_minutes: int, 
+        prompt: str,
+        exam_mode: bool = False,
+        system_prompt_override: str = None,
+        config: Optional[ConfigSnapshot] = None
+    ) -> tuple[str, int]:
+        if not self.client:
+            logger.warning("OpenAI client not initialized. Returning mock content.")
+            return self._mock_content(topic, duration_minutes, exam_mode), 0
+
+        if config is None:
+            # Fetch dynamic config
+            config = await config_cache.get(db)
+        messages, max_tokens, max_chars = self.build_request(
+            config, topic, duration_minutes, prompt, exam_mode, system_prompt_override
+        )
         
         try:
             response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                model=self.model,
+                messages=messages,
                 max_tokens=max_tokens
             )
-            logger.info(f"Full OpenAI Response:\n{response.model_dump_json(indent=2)}")
             content = response.choices[0].message.content
             usage = response.usage.total_tokens
-            
-            logger.info(f"OpenAI Response Content: {content}")
-            logger.info(f"OpenAI Response Usage: {usage} tokens")
+            logger.info("OpenAI completion", extra={
+                "model": response.model,
+                "tokens": usage,
+                "chars": len(content),
+                "finish_reason": response.choices[0].finish_reason
+            })
             
             # Final trim to ensure strict limit
             if len(content) > max_chars:
@@ -123,4 +151,96 @@ class StudyService:
             logger.error(f"Error generating content: {e}")
             raise e
 
+    async def stream_content(
+        self,
+        db: AsyncIOMotorDatabase,
+        topic: str,
+        duration_minutes: int,
+        prompt: str,
+        exam_mode: bool = False,
+        system_prompt_override: str = None,
+        config: Optional[ConfigSnapshot] = None
+    ) -> "ContentStream":
+        """Like generate_content, but returns the text as it is generated."""
+        if not self.client:
+            logger.warning("OpenAI client not initialized. Returning mock content.")
+            return ContentStream(None, mock=self._mock_content(topic, duration_minutes, exam_mode))
+
+        if config is None:
+            config = await config_cache.get(db)
+        messages, max_tokens, max_chars = self.build_request(
+            config, topic, duration_minutes, prompt, exam_mode, system_prompt_override
+        )
+        request = dict(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        return ContentStream(self.client.chat.completions.create(**request), max_chars=max_chars)
+
+    @staticmethod
+    def _mock_content(topic: str, duration_minutes: int, exam_mode: bool) -> str:
+        return f"Mock study content for topic: {topic}. Duration: {duration_minutes} minutes. Exam Mode: {exam_mode}"
+
+
+class ContentStream:
+    """
+    Async iterator over content deltas from a streamed chat completion.
+
+    Once exhausted, content holds the final text and usage the total tokens.
+    Output stops at max_chars; the unfinished sentence at the cut is dropped
+    from content (it may already have been yielded as a delta).
+    """
+
+    def __init__(self, request, max_chars: Optional[int] = None, mock: Optional[str] = None):
+        self._request = request
+        self._mock = mock
+        self.max_chars = max_chars
+        self.content = ""
+        self.usage = 0
+        self.truncated = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        if self._mock is not None:
+            self.content = self._mock
+            yield self._mock
+            return
+
+        try:
+            stream = await self._request
+            async for chunk in stream:
+                if chunk.usage:
+                    self.usage = chunk.usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                # Past the limit, keep reading only for the final usage chunk
+                if not delta or self.truncated:
+                    continue
+                room = self.max_chars - len(self.content)
+                if len(delta) > room:
+                    delta = delta[:room]
+                    self.truncated = True
+                    if not delta:
+                        continue
+                self.content += delta
+                yield delta
+        except Exception as e:
+            logger.error(f"Error streaming content: {e}")
+            raise e
+
+        if self.truncated:
+            # Same rule as generate_content: end on the last full stop
+            self.content = self.content.rsplit('.', 1)[0] + '.'
+        logger.info("OpenAI stream completion", extra={
+            "tokens": self.usage,
+            "chars": len(self.content),
+            "truncated": self.truncated
+        })
+
 study_service = StudyService()
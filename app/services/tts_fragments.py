@@ -0,0 +1,172 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.core.config import settings
+from app.core import metrics
+from app.services.cache_stats import cache_stats
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_sentence(sentence: str) -> Tuple[str, List[int]]:
+    """
+    Whitespace-normalized sentence (trimmed, runs collapsed to one space)
+    and, for every UTF-8 byte of it plus the end, the matching byte offset
+    in the original, so speech marks can be mapped back.
+    """
+    chars: List[str] = []
+    offsets: List[int] = []
+    position = 0
+    end = 0
+    pending_space = None
+    for char in sentence:
+        size = len(char.encode("utf-8"))
+        if char.isspace():
+            if chars and pending_space is None:
+                pending_space = position
+        else:
+            if pending_space is not None:
+                chars.append(" ")
+                offsets.append(pending_space)
+                pending_space = None
+            chars.append(char)
+            offsets.extend(range(position, position + size))
+            end = position + size
+        position += size
+    offsets.append(end)
+    return "".join(chars), offsets
+
+
+class TTSFragmentCache:
+    """
+    Synthesized audio (and speech marks) per sentence, shared by every
+    session.
+
+    Fragments are keyed by a hash of the normalized sentence and everything
+    that changes how Polly renders it. The collection is kept under
+    TTS_FRAGMENT_CACHE_MAX_BYTES by dropping the least recently used
+    fragments.
+
+    A sentence is only worth its own Polly request once it repeats, so a
+    miss first leaves a sighting (a document with a seen count but no
+    audio); sightings expire after TTS_FRAGMENT_SIGHTING_TTL_SECONDS.
+    """
+
+    collection = "tts_fragments"
+    stats_id = "tts_fragments"
+
+    @staticmethod
+    def make_key(sentence: str, voice: str, engine: str, output_format: str, sample_rate: Optional[str]) -> str:
+        material = json.dumps([sentence, voice, engine, output_format, sample_rate], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get_many(self, db: AsyncIOMotorDatabase, keys: List[str], sightings: bool = True) -> Dict[str, dict]:
+        """
+        Documents found for keys, fragments and sightings alike, recording
+        hits and misses (persisted in batches, so last_used_at lags by up to
+        a flush). With sightings, every miss counts towards admission; the
+        returned sightings show the count from before this lookup.
+        """
+        unique = list(dict.fromkeys(keys))
+        if not unique:
+            return {}
+        found = {doc["_id"]: doc async for doc in db[self.collection].find({"_id": {"$in": unique}})}
+        cached = [key for key in unique if "audio" in found.get(key, {})]
+        hits = sum(1 for key in keys if key in cached)
+        misses = len(keys) - hits
+        for key in cached:
+            cache_stats.hit(self.collection, "last_used_at", key)
+        missed = [key for key in unique if key not in cached]
+        if sightings and missed:
+            try:
+                await db[self.collection].bulk_write([
+                    UpdateOne({"_id": key}, {"$inc": {"seen": 1}, "$setOnInsert": {"seen_at": datetime.utcnow()}}, upsert=True)
+                    for key in missed
+                ], ordered=False)
+            except BulkWriteError:
+                # Concurrent upserts of the same sentence; a lost sighting is harmless
+                pass
+        metrics.cache_requests.inc(hits, cache="tts_fragment", result="hit")
+        metrics.cache_requests.inc(misses, cache="tts_fragment", result="miss")
+        cache_stats.count(self.stats_id, hits=hits, misses=misses)
+        await cache_stats.maybe_flush(db)
+        return found
+
+    @staticmethod
+    def admits(doc: Optional[dict]) -> bool:
+        """Whether a sentence looked up as doc should be synthesized on its own and cached."""
+        if doc is not None and "audio" in doc:
+            return True
+        return (doc or {}).get("seen", 0) + 1 >= settings.TTS_FRAGMENT_ADMIT_AFTER
+
+    async def put(self, db: AsyncIOMotorDatabase, key: str, audio: bytes, marks: Optional[List[dict]]) -> None:
+        """Store a fragment, replacing its sighting; marks is None when they were not requested."""
+        now = datetime.utcnow()
+        fields = {"audio": audio, "size": len(audio), "hits": 0, "created_at": now, "last_used_at": now}
+        if marks is not None:
+            fields["marks"] = marks
+        try:
+            await db[self.collection].update_one(
+                {"_id": key, "audio": {"$exists": False}},
+                {"$set": fields, "$unset": {"seen_at": ""}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Synthesized concurrently elsewhere
+            return
+        stats = await db["cache_stats"].find_one_and_update(
+            {"_id": self.stats_id},
+            {"$inc": {"bytes": len(audio)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if stats["bytes"] > settings.TTS_FRAGMENT_CACHE_MAX_BYTES:
+            await self.trim(db, stats["bytes"] - settings.TTS_FRAGMENT_CACHE_MAX_BYTES)
+
+    async def set_marks(self, db: AsyncIOMotorDatabase, key: str, marks: List[dict]) -> None:
+        await db[self.collection].update_one({"_id": key}, {"$set": {"marks": marks}})
+
+    async def trim(self, db: AsyncIOMotorDatabase, excess: int) -> None:
+        """Drop least recently used fragments until about excess bytes are freed."""
+        freed = 0
+        victims = []
+        # A bit more than needed so every insert doesn't trigger another trim
+        target = excess + settings.TTS_FRAGMENT_CACHE_MAX_BYTES // 20
+        cursor = db[self.collection].find({"audio": {"$exists": True}}, {"size": 1}).sort("last_used_at", 1)
+        async for doc in cursor:
+            victims.append(doc["_id"])
+            freed += doc.get("size", 0)
+            if freed >= target:
+                break
+        if not victims:
+            return
+        result = await db[self.collection].delete_many({"_id": {"$in": victims}})
+        await db["cache_stats"].update_one(
+            {"_id": self.stats_id},
+            {"$inc": {"bytes": -freed, "evictions": result.deleted_count}}
+        )
+        metrics.cache_evictions.inc(result.deleted_count, cache="tts_fragment")
+        logger.info("Trimmed TTS fragment cache", extra={"fragments": result.deleted_count, "bytes": freed})
+
+    async def stats(self, db: AsyncIOMotorDatabase) -> dict:
+        counters = await db["cache_stats"].find_one({"_id": self.stats_id}) or {}
+        pending = cache_stats.pending(self.stats_id)
+        hits = counters.get("hits", 0) + pending.get("hits", 0)
+        misses = counters.get("misses", 0) + pending.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "bytes": counters.get("bytes", 0),
+            "max_bytes": settings.TTS_FRAGMENT_CACHE_MAX_BYTES,
+            "entries": await db[self.collection].estimated_document_count(),
+        }
+
+tts_fragment_cache = TTSFragmentCache()
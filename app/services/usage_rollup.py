@@ -0,0 +1,107 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import date, datetime, time
+from typing import List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Summed into the rollups for every usage event
+COUNTERS = ("openai_tokens", "polly_characters", "openai_cost", "polly_cost", "total_cost")
+
+# Usage report summary key -> rollup counter it sums (keys as the report has always returned them)
+SUMMARY_FIELDS = {
+    "total_openai_tokens": "openai_tokens",
+    "total_polly_characters": "polly_characters",
+    "total_openai_cost": "openai_cost",
+    "total_polly_cost": "polly_cost",
+    "total_cost": "total_cost",
+    "total_sessions": "sessions",
+    "total_cache_hits": "cache_hits",
+}
+
+
+def day_start(moment: datetime) -> datetime:
+    return datetime.combine(moment.date(), time.min)
+
+
+class UsageRollup:
+    """
+    Daily usage totals maintained at write time.
+
+    Every usage event $inc's one global document per day and one per user
+    and day, so reports sum a handful of small documents instead of
+    scanning the whole usage collection.
+    """
+
+    daily = "usage_daily"
+    daily_users = "usage_daily_users"
+
+    def increments(self, usage: dict) -> dict:
+        inc = {field: usage.get(field, 0) for field in COUNTERS}
+        # Renditions bill Polly for an existing session
+        inc["sessions"] = 0 if usage.get("rendition") else 1
+        inc["cache_hits"] = 1 if usage.get("cache_hit") else 0
+        return inc
+
+    async def record(self, db: AsyncIOMotorDatabase, usage: dict) -> None:
+        day = day_start(usage["created_at"])
+        inc = self.increments(usage)
+        await asyncio.gather(
+            db[self.daily].update_one(
+                {"_id": day.strftime("%Y-%m-%d")},
+                {"$inc": inc, "$setOnInsert": {"day": day}},
+                upsert=True
+            ),
+            db[self.daily_users].update_one(
+                {"_id": f"{day:%Y-%m-%d}:{usage['user_id']}"},
+                {"$inc": inc, "$setOnInsert": {"day": day, "user_id": usage["user_id"]}},
+                upsert=True
+            ),
+        )
+
+    @staticmethod
+    def _day_filter(start: Optional[date], end: Optional[date]) -> dict:
+        day = {}
+        if start:
+            day["$gte"] = datetime.combine(start, time.min)
+        if end:
+            day["$lte"] = datetime.combine(end, time.min)
+        return {"day": day} if day else {}
+
+    async def summary(self, db: AsyncIOMotorDatabase, start: Optional[date], end: Optional[date]) -> dict:
+        totals = {key: {"$sum": f"${field}"} for key, field in SUMMARY_FIELDS.items()}
+        result = await db[self.daily].aggregate([
+            {"$match": self._day_filter(start, end)},
+            {"$group": {"_id": None, **totals}},
+            {"$project": {"_id": 0}}
+        ]).to_list(length=1)
+        return result[0] if result else {key: 0 for key in totals}
+
+    async def per_user(
+        self,
+        db: AsyncIOMotorDatabase,
+        start: Optional[date],
+        end: Optional[date],
+        skip: int,
+        limit: int
+    ) -> List[dict]:
+        """Per-user totals for the range, most expensive first."""
+        sums = {field: {"$sum": f"${field}"} for field in ("openai_tokens", "polly_characters", "total_cost")}
+        rows = await db[self.daily_users].aggregate([
+            {"$match": self._day_filter(start, end)},
+            {"$group": {"_id": "$user_id", **sums, "sessions": {"$sum": "$sessions"}}},
+            {"$sort": {"total_cost": -1, "_id": 1}},
+            {"$skip": skip},
+            {"$limit": limit}
+        ]).to_list(length=limit)
+
+        users = await db["users"].find(
+            {"_id": {"$in": [row["_id"] for row in rows]}}, {"email": 1}
+        ).to_list(length=None)
+        emails = {u["_id"]: u.get("email") for u in users}
+        for row in rows:
+            row["email"] = emails.get(row["_id"])
+        return rows
+
+usage_rollup = UsageRollup()
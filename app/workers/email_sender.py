@@ -0,0 +1,73 @@
+"""
+Background delivery of the email outbox, started inside each API process.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config import settings
+from app.services.email import email_service, smtp_configured
+from typing import Optional
+import asyncio
+import os
+import socket
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmailSender:
+    """
+    Drains email_outbox: claims a batch of due emails, sends them over a
+    single SMTP connection in a worker thread, then records each result.
+    Failed sends are retried with exponential backoff.
+    """
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        if self._task is not None:
+            return
+        if not smtp_configured():
+            logger.error("SMTP configuration is incomplete. Please set SMTP_HOST, SMTP_USER, SMTP_PASSWORD, and EMAIL_FROM in .env; emails stay queued until then")
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(db))
+
+    async def stop(self) -> None:
+        """Finish the batch in progress, then stop."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, settings.EMAIL_LEASE_SECONDS)
+        except asyncio.TimeoutError:
+            # Unfinished emails are picked up again once their lease expires
+            pass
+        self._task = None
+
+    async def _loop(self, db: AsyncIOMotorDatabase) -> None:
+        while not self._stopping.is_set():
+            try:
+                sent = await self._drain_once(db)
+            except Exception as e:
+                logger.error(f"Email outbox error: {e}")
+                sent = 0
+            if sent < settings.EMAIL_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), settings.EMAIL_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _drain_once(self, db: AsyncIOMotorDatabase) -> int:
+        batch = await email_service.claim_batch(db, self.owner, settings.EMAIL_BATCH_SIZE)
+        if not batch:
+            return 0
+        errors = await asyncio.to_thread(email_service.deliver_batch, batch)
+        await asyncio.gather(*(
+            email_service.record_result(db, doc, error) for doc, error in zip(batch, errors)
+        ))
+        return len(batch)
+
+email_sender = EmailSender()
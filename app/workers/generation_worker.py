@@ -0,0 +1,166 @@
+"""
+Workers that run queued generation jobs.
+
+Started inside each API process (GENERATION_WORKERS) or on their own:
+
+    python -m app.workers.generation_worker [--concurrency N]
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config import settings
+from app.core.logging_config import setup_logging
+from app.schemas.study import StudyPrompt
+from app.schemas.user import UserInDB
+from app.services.config_cache import config_cache
+from app.services.generation_service import generation_service
+from app.services.job_queue import job_queue
+from datetime import datetime
+from typing import List, Optional
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationWorkerPool:
+    """
+    A fixed number of asyncio workers claiming jobs from the queue.
+
+    stop() drains: workers stop claiming, running jobs get JOB_DRAIN_SECONDS
+    to finish, and whatever is still running after that is cancelled and put
+    back in the queue for another worker. Alongside the workers, a sweeper
+    fails jobs abandoned on their last attempt every JOB_SWEEP_SECONDS.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Event] = None
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        if self._tasks or self.concurrency <= 0:
+            return
+        self._stopping = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._loop(db)) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._sweep(db)))
+        logger.info(f"Started {self.concurrency} generation workers ({self.worker_id})")
+
+    async def stop(self, timeout: float = None) -> None:
+        if not self._tasks:
+            return
+        self._stopping.set()
+        timeout = settings.JOB_DRAIN_SECONDS if timeout is None else timeout
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Generation workers stopped ({len(pending)} jobs handed back)")
+
+    async def _loop(self, db: AsyncIOMotorDatabase) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await job_queue.claim(db, self.worker_id)
+            except Exception as e:
+                logger.error(f"Claiming generation job failed: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), settings.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(db, job)
+
+    async def _process(self, db: AsyncIOMotorDatabase, job: dict) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(db, job["_id"]))
+        try:
+            session = await self._run(db, job)
+        except asyncio.CancelledError:
+            # Shutting down mid-job: let another worker pick it up
+            await asyncio.shield(job_queue.release(db, job, self.worker_id))
+            raise
+        except Exception as e:
+            logger.error(f"Generation job {job['_id']} failed (attempt {job['attempts']}): {e}")
+            if not await job_queue.fail(db, job, self.worker_id, "Generation failed. Please try again."):
+                logger.warning(f"Generation job {job['_id']} was taken over before it could be requeued")
+        else:
+            if not await job_queue.complete(db, job["_id"], self.worker_id, session["_id"]):
+                logger.warning(f"Generation job {job['_id']} was taken over before it completed")
+        finally:
+            heartbeat.cancel()
+
+    async def _run(self, db: AsyncIOMotorDatabase, job: dict) -> dict:
+        user_doc = await db["users"].find_one({"_id": job["user_id"]})
+        if not user_doc:
+            raise RuntimeError("User no longer exists")
+        user = UserInDB(**user_doc)
+        study_in = StudyPrompt(**job["request"])
+
+        # Key on the config in force now, like a synchronous request would
+        config = await config_cache.get(db)
+        content_key = generation_service.content_key(config, study_in)
+
+        async def on_stage(stage: str):
+            await job_queue.set_stage(db, job["_id"], stage)
+
+        session, _ = await generation_service.generate_session(
+            db, user, study_in, config, content_key, datetime.utcnow(), on_stage=on_stage
+        )
+        return session
+
+    async def _sweep(self, db: AsyncIOMotorDatabase) -> None:
+        while not self._stopping.is_set():
+            try:
+                await job_queue.fail_abandoned(db, datetime.utcnow())
+            except Exception as e:
+                logger.error(f"Sweeping abandoned generation jobs failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), settings.JOB_SWEEP_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self, db: AsyncIOMotorDatabase, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            try:
+                if not await job_queue.renew(db, job_id, self.worker_id):
+                    logger.warning(f"Lost lease on generation job {job_id}")
+                    return
+            except Exception as e:
+                logger.error(f"Renewing lease on generation job {job_id} failed: {e}")
+
+generation_workers = GenerationWorkerPool(settings.GENERATION_WORKERS)
+
+
+async def main(concurrency: int):
+    from app.db.mongodb import connect_to_mongo, close_mongo_connection, get_database
+
+    await connect_to_mongo()
+    pool = GenerationWorkerPool(concurrency)
+    pool.start(get_database())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Shutting down, draining running jobs...")
+    await pool.stop()
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run generation job workers")
+    parser.add_argument("--concurrency", type=int, default=max(settings.GENERATION_WORKERS, 1))
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(main(args.concurrency))
@@ -3,6 +3,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
 from app.core import security
 import uuid
+from datetime import datetime
 
 async def create_admin():
     client = AsyncIOMotorClient(settings.MONGODB_URL)
@@ -24,7 +25,8 @@ async def create_admin():
         "hashed_password": hashed_password,
         "is_active": True,
         "role": "admin",
-        "plan": "paid"
+        "plan": "paid",
+        "created_at": datetime.utcnow()
     }
     
     await db["users"].insert_one(user_dict)
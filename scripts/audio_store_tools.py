@@ -0,0 +1,108 @@
+"""
+Tools for the pluggable audio store.
+
+Run from the project root:
+    python scripts/audio_store_tools.py migrate --from gridfs --to local [--dry-run]
+    python scripts/audio_store_tools.py check [--backend local] [--delete-orphans]
+
+migrate copies every audio file referenced by a session or content cache
+entry from one backend to another; ids are content hashes, so they are the
+same on both and no document changes. Switch AUDIO_BACKEND afterwards.
+Safe to re-run; files already on the target are skipped.
+
+check compares the files a backend holds with the ids documents reference
+and reports missing files (broken playback) and orphans (wasted space).
+Only use --delete-orphans while nothing is generating: a file is written
+just before the document that references it.
+"""
+import argparse
+import asyncio
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.services.audio_store import AudioStore, content_type_of, make_backend
+
+async def referenced_ids(db) -> Counter:
+    """audio_file_id -> number of documents pointing at it (renditions included)"""
+    refs = Counter()
+    for collection in ("content_cache", "study_sessions"):
+        cursor = db[collection].find({"audio_file_id": {"$exists": True}}, {"audio_file_id": 1, "renditions": 1})
+        async for doc in cursor:
+            refs[doc["audio_file_id"]] += 1
+            for rendition in (doc.get("renditions") or {}).values():
+                refs[rendition["audio_file_id"]] += 1
+    return refs
+
+async def migrate(db, source_name: str, target_name: str, dry_run: bool):
+    source, target = make_backend(source_name), make_backend(target_name)
+    refs = await referenced_ids(db)
+    print(f"📊 {len(refs)} referenced audio files")
+    copied = skipped = failed = 0
+    for file_id in refs:
+        if await target.exists(db, file_id):
+            skipped += 1
+            continue
+        if dry_run:
+            copied += 1
+            continue
+        try:
+            data = await (await source.open(db, file_id)).read()
+            if AudioStore.content_key(data) != file_id.split(".")[0]:
+                raise ValueError("content hash mismatch")
+            await target.put(db, file_id, data, content_type_of(file_id), {})
+            copied += 1
+        except Exception as e:
+            print(f"✗ {file_id}: {str(e)}")
+            failed += 1
+    print(f"✓ {'Would copy' if dry_run else 'Copied'} {copied}, already present {skipped}, failed {failed}")
+    if failed:
+        sys.exit(1)
+
+async def check(db, backend_name: str, delete_orphans: bool):
+    backend = make_backend(backend_name)
+    refs = await referenced_ids(db)
+    stored = set()
+    async for file_id in backend.list_ids(db):
+        stored.add(file_id)
+
+    missing = [file_id for file_id in refs if file_id not in stored]
+    orphans = [file_id for file_id in stored if file_id not in refs]
+    print(f"📊 {backend.name}: {len(stored)} stored, {len(refs)} referenced")
+    for file_id in missing:
+        print(f"✗ Missing {file_id} ({refs[file_id]} documents)")
+    print(f"{'✗' if missing else '✓'} {len(missing)} missing, {len(orphans)} orphaned")
+
+    if orphans and delete_orphans:
+        for file_id in orphans:
+            await backend.delete(db, file_id)
+        print(f"✓ Deleted {len(orphans)} orphans")
+    if missing:
+        sys.exit(1)
+
+async def main(args):
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db = client[settings.DATABASE_NAME]
+    try:
+        if args.command == "migrate":
+            await migrate(db, args.source, args.target, args.dry_run)
+        else:
+            await check(db, args.backend, args.delete_orphans)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Copy referenced audio between backends")
+    migrate_parser.add_argument("--from", dest="source", required=True, choices=["gridfs", "local", "s3"])
+    migrate_parser.add_argument("--to", dest="target", required=True, choices=["gridfs", "local", "s3"])
+    migrate_parser.add_argument("--dry-run", action="store_true")
+    check_parser = commands.add_parser("check", help="Compare stored audio with referencing documents")
+    check_parser.add_argument("--backend", default=settings.AUDIO_BACKEND, choices=["gridfs", "local", "s3"])
+    check_parser.add_argument("--delete-orphans", action="store_true")
+    asyncio.run(main(parser.parse_args()))
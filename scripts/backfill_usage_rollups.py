@@ -0,0 +1,94 @@
+"""
+Backfill script that rebuilds the daily usage rollups (usage_daily and
+usage_daily_users) from the raw usage events.
+
+Run from the project root: python scripts/backfill_usage_rollups.py [--from YYYY-MM-DD] [--dry-run]
+Totals are recomputed and overwritten, so it is safe to re-run. Run it
+before live writes start updating the rollups, or with --from set to a
+day that has fully passed, so increments made while it runs aren't lost.
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.services.usage_rollup import COUNTERS, usage_rollup
+
+BATCH_SIZE = 1000
+
+async def backfill(start: datetime, dry_run: bool):
+    """Group usage by (day, user) and write both rollup levels"""
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db = client[settings.DATABASE_NAME]
+
+    try:
+        match = {"created_at": {"$gte": start}} if start else {}
+        sums = {field: {"$sum": {"$ifNull": [f"${field}", 0]}} for field in COUNTERS}
+        cursor = db["usage"].aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    "user_id": "$user_id"
+                },
+                **sums,
+                "sessions": {"$sum": {"$cond": [{"$ifNull": ["$rendition", False]}, 0, 1]}},
+                "cache_hits": {"$sum": {"$cond": [{"$eq": ["$cache_hit", True]}, 1, 0]}}
+            }}
+        ], allowDiskUse=True)
+
+        daily = {}
+        user_ops = []
+        rows = 0
+        async for row in cursor:
+            day_key = row["_id"]["day"]
+            user_id = row["_id"]["user_id"]
+            day = datetime.strptime(day_key, "%Y-%m-%d")
+            totals = {field: row[field] for field in (*COUNTERS, "sessions", "cache_hits")}
+
+            day_totals = daily.setdefault(day_key, {"day": day, **{k: 0 for k in totals}})
+            for field, value in totals.items():
+                day_totals[field] += value
+
+            user_ops.append(UpdateOne(
+                {"_id": f"{day_key}:{user_id}"},
+                {"$set": {"day": day, "user_id": user_id, **totals}},
+                upsert=True
+            ))
+            rows += 1
+            if len(user_ops) >= BATCH_SIZE and not dry_run:
+                await db[usage_rollup.daily_users].bulk_write(user_ops, ordered=False)
+                user_ops = []
+
+        print(f"📊 {rows} user-days across {len(daily)} days")
+        if dry_run:
+            return
+
+        if user_ops:
+            await db[usage_rollup.daily_users].bulk_write(user_ops, ordered=False)
+        if daily:
+            await db[usage_rollup.daily].bulk_write([
+                UpdateOne({"_id": day_key}, {"$set": totals}, upsert=True)
+                for day_key, totals in daily.items()
+            ], ordered=False)
+        print("✓ Backfill complete!")
+
+    except Exception as e:
+        print(f"✗ Backfill failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild daily usage rollups from usage events")
+    parser.add_argument("--from", dest="start", type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+                        help="Only rebuild days from this date (UTC) on")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be written")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.start, args.dry_run))
@@ -0,0 +1,55 @@
+"""
+Migration script to give users created before created_at was recorded a
+created_at, so they show up in the keyset-paginated admin listing.
+
+Run from the project root: python scripts/backfill_user_created_at.py [--dry-run]
+The earliest known activity (first study session, else last generation)
+is used, else the time of the migration. Safe to re-run.
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+
+async def backfill(dry_run: bool):
+    """Set created_at on users that lack it"""
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db = client[settings.DATABASE_NAME]
+    now = datetime.utcnow()
+
+    try:
+        users = db["users"].find({"created_at": {"$exists": False}}, {"last_generation_date": 1})
+        updated = 0
+        async for user in users:
+            first_session = await db["study_sessions"].find_one(
+                {"user_id": user["_id"]}, {"created_at": 1}, sort=[("created_at", 1)]
+            )
+            created_at = (
+                (first_session or {}).get("created_at")
+                or user.get("last_generation_date")
+                or now
+            )
+            if not dry_run:
+                await db["users"].update_one({"_id": user["_id"]}, {"$set": {"created_at": created_at}})
+            updated += 1
+
+        print(f"✓ {'Would update' if dry_run else 'Updated'} {updated} users")
+        print("Migration complete!")
+
+    except Exception as e:
+        print(f"✗ Migration failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.dry_run))
@@ -0,0 +1,86 @@
+"""
+Migration script to move embedded audio_data blobs out of study_sessions
+into the audio store (the GridFS bucket unless AUDIO_BACKEND says otherwise).
+
+Run from the project root: python scripts/migrate_audio_to_gridfs.py [--batch-size N] [--dry-run]
+Safe to re-run; sessions that were already migrated are skipped.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.services.audio_store import audio_store
+from app.services import mp3
+
+async def migrate_audio(batch_size: int, dry_run: bool):
+    """Move audio_data into GridFS, batch_size sessions at a time"""
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db = client[settings.DATABASE_NAME]
+    sessions = db["study_sessions"]
+
+    try:
+        remaining = await sessions.count_documents({"audio_data": {"$exists": True}})
+        print(f"📊 Found {remaining} sessions with embedded audio")
+        if dry_run or remaining == 0:
+            return
+
+        migrated = 0
+        failed = set()
+        while True:
+            # Only ids here; each blob is loaded on its own below
+            batch = await sessions.find(
+                {"audio_data": {"$exists": True}, "_id": {"$nin": list(failed)}},
+                {"_id": 1}
+            ).limit(batch_size).to_list(length=batch_size)
+            if not batch:
+                break
+
+            for doc in batch:
+                session = await sessions.find_one({"_id": doc["_id"]}, {"audio_data": 1})
+                audio_data = session.get("audio_data") if session else None
+                if not audio_data:
+                    failed.add(doc["_id"])
+                    continue
+                try:
+                    audio_file_id = await audio_store.put(
+                        db, bytes(audio_data), metadata={"session_id": doc["_id"]}
+                    )
+                    await sessions.update_one(
+                        {"_id": doc["_id"]},
+                        {
+                            "$set": {
+                                "audio_file_id": audio_file_id,
+                                "audio_size": len(audio_data),
+                                "audio_frame_index": mp3.build_frame_index(bytes(audio_data))
+                            },
+                            "$unset": {"audio_data": ""}
+                        }
+                    )
+                    migrated += 1
+                except Exception as e:
+                    print(f"✗ Session {doc['_id']}: {str(e)}")
+                    failed.add(doc["_id"])
+
+            print(f"✓ Migrated {migrated}/{remaining} sessions")
+
+        if failed:
+            print(f"⚠ {len(failed)} sessions could not be migrated")
+        print("Migration complete!")
+
+    except Exception as e:
+        print(f"✗ Migration failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate_audio(args.batch_size, args.dry_run))
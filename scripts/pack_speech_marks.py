@@ -0,0 +1,60 @@
+"""
+Migration script to convert speech marks stored as a list of per-word
+objects into the packed columnar form (speech_marks_packed).
+
+Run from the project root: python scripts/pack_speech_marks.py [--dry-run]
+Covers shared content entries and legacy sessions with embedded marks.
+Safe to re-run; reads handle both forms in the meantime.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.services import speech_marks
+
+async def pack_collection(db, collection: str, dry_run: bool) -> tuple[int, int, int]:
+    """Returns (documents converted, bytes before, bytes after)"""
+    converted = before = after = 0
+    docs = db[collection].find({"speech_marks": {"$type": "array"}}, {"speech_marks": 1})
+    async for doc in docs:
+        marks = doc["speech_marks"]
+        packed = speech_marks.pack(marks)
+        before += len(str(marks))
+        after += len(packed)
+        if not dry_run:
+            await db[collection].update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"speech_marks_packed": packed}, "$unset": {"speech_marks": ""}}
+            )
+        converted += 1
+    return converted, before, after
+
+async def migrate(dry_run: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db = client[settings.DATABASE_NAME]
+
+    try:
+        for collection in ("content_cache", "study_sessions"):
+            converted, before, after = await pack_collection(db, collection, dry_run)
+            print(
+                f"✓ {'Would convert' if dry_run else 'Converted'} {converted} documents in {collection} "
+                f"(~{before} -> {after} bytes of marks)"
+            )
+        print("Migration complete!")
+
+    except Exception as e:
+        print(f"✗ Migration failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run))
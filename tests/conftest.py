@@ -0,0 +1,31 @@
+import os
+
+# app.core.config builds its settings at import time and requires these;
+# the tests never connect anywhere, so placeholders will do
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["study_io_test"]
+
+
+@pytest.fixture
+def api(db):
+    """Build an httpx client for a router on the mock database, with dependency overrides."""
+    httpx = pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from app.db.mongodb import get_database
+
+    def make(router, prefix: str = "", overrides: dict = None):
+        app = FastAPI()
+        app.include_router(router, prefix=prefix)
+        app.dependency_overrides[get_database] = lambda: db
+        app.dependency_overrides.update(overrides or {})
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+    return make
@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from app.api import deps
+from app.api.api_v1.endpoints import admin
+
+USERS = [
+    {"_id": "new", "email": "new@example.com", "created_at": datetime(2024, 3, 1)},
+    {"_id": "older", "email": "older@example.com", "created_at": datetime(2024, 1, 1)},
+    # Registered before created_at was recorded
+    {"_id": "legacy-c", "email": "c@example.com"},
+    {"_id": "legacy-b", "email": "b@example.com"},
+    {"_id": "legacy-a", "email": "a@example.com"},
+]
+
+
+def run(db, api, requests):
+    async def scenario():
+        await db["users"].insert_many([
+            {"full_name": None, "is_active": True, "role": "user", "plan": "trial", **user} for user in USERS
+        ])
+        async with api(admin.router, overrides={deps.get_current_active_admin: lambda: object()}) as client:
+            return await requests(client)
+    return asyncio.run(scenario())
+
+
+def test_pages_through_legacy_users(db, api):
+    async def requests(client):
+        ids, cursor = [], None
+        while True:
+            params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+            response = await client.get("/users", params=params)
+            assert response.status_code == 200
+            ids.extend(user["id"] for user in response.json())
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                return ids
+
+    assert run(db, api, requests) == ["new", "older", "legacy-c", "legacy-b", "legacy-a"]
+
+
+def test_legacy_users_are_older_than_any_created_from(db, api):
+    async def requests(client):
+        before = await client.get("/users", params={"created_to": "2024-02-01T00:00:00"})
+        since = await client.get("/users", params={"created_from": "2023-01-01T00:00:00"})
+        return [u["id"] for u in before.json()], [u["id"] for u in since.json()]
+
+    before, since = run(db, api, requests)
+    assert before == ["older", "legacy-c", "legacy-b", "legacy-a"]
+    assert since == ["new", "older"]
+
+
+def test_config_edits_keep_content_version(db, api):
+    async def requests(client):
+        await db["config"].insert_one({"_id": "app_config", "version": 1, "content_version": 4})
+        await client.post("/topics", json={"name": "History", "prompt_template": "Teach {topic}"})
+        await client.put("/config", json={"character_limits": {"3": 2000}})
+        return await db["config"].find_one({"_id": "app_config"})
+
+    config = run(db, api, requests)
+    assert config["version"] == 3
+    assert config["content_version"] == 4
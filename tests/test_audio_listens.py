@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from app.api.api_v1.endpoints import study
+from app.core import security
+
+AUDIO = bytes(range(256)) * 20
+
+
+def token(n: int = 0):
+    # Tokens issued within the same second are identical; n tells plays apart
+    return security.create_access_token(subject="s1", expires_delta=timedelta(hours=1, seconds=n))
+
+
+def run(db, api, requests):
+    async def scenario():
+        await db["users"].insert_one({
+            "_id": "u1", "email": "trial@example.com", "hashed_password": "x", "plan": "trial"
+        })
+        await db["study_sessions"].insert_one({
+            "_id": "s1", "user_id": "u1", "audio_data": AUDIO, "listen_count": 0, "created_at": datetime(2024, 1, 1)
+        })
+        async with api(study.router) as client:
+            await requests(client)
+            return (await db["study_sessions"].find_one({"_id": "s1"}))["listen_count"]
+    return asyncio.run(scenario())
+
+
+def test_probe_then_play_is_one_listen(db, api):
+    async def requests(client):
+        play = token()
+        full = await client.get("/audio/s1", params={"token": play})
+        probe = await client.get("/audio/s1", params={"token": play}, headers={"Range": "bytes=0-1"})
+        start = await client.get("/audio/s1", params={"token": play}, headers={"Range": "bytes=0-"})
+        assert (full.status_code, probe.status_code, start.status_code) == (200, 206, 206)
+        assert probe.content == AUDIO[:2]
+
+    assert run(db, api, requests) == 1
+
+
+def test_each_play_counts_until_the_trial_limit(db, api):
+    async def requests(client):
+        for n in range(3):
+            play = token(n)
+            await client.get("/audio/s1", params={"token": play}, headers={"Range": "bytes=0-1"})
+            response = await client.get("/audio/s1", params={"token": play}, headers={"Range": "bytes=0-"})
+            assert response.status_code == 206
+        response = await client.get("/audio/s1", params={"token": token(3)})
+        assert response.status_code == 403
+
+    assert run(db, api, requests) == 3
+
+
+def segment_urls(playlist: str):
+    return [line for line in playlist.splitlines() if line.startswith("segments/")]
+
+
+def test_playlist_segments_count_one_listen_per_fetch(db, api):
+    async def requests(client):
+        for n in range(3):
+            playlist = await client.get("/audio/s1/playlist.m3u8", params={"token": token(n)})
+            assert playlist.status_code == 200
+            for url in segment_urls(playlist.text) * 2:
+                assert (await client.get(f"/audio/s1/{url}")).status_code == 200
+        playlist = await client.get("/audio/s1/playlist.m3u8", params={"token": token(3)})
+        response = await client.get(f"/audio/s1/{segment_urls(playlist.text)[0]}")
+        assert response.status_code == 403
+
+    assert run(db, api, requests) == 3
+
+
+def test_segments_need_a_playlist_token(db, api):
+    async def requests(client):
+        response = await client.get("/audio/s1/segments/0.mp3", params={"token": token()})
+        assert response.status_code == 403
+
+    assert run(db, api, requests) == 0
+
+
+def test_stream_segments_are_for_live_playback_only(db, api):
+    async def requests(client):
+        await db["stream_segments"].insert_one({"_id": "st1:0", "audio": AUDIO, "created_at": datetime.utcnow()})
+        stream_token = security.create_access_token(subject="st1:u1", expires_delta=timedelta(hours=1))
+        statuses = [
+            (await client.get("/stream/st1/segments/0", params={"token": stream_token})).status_code
+            for _ in range(3)
+        ]
+        assert statuses == [200, 200, 404]
+        response = await client.get("/stream/st1/segments/0", params={"token": token()})
+        assert response.status_code == 403
+
+    run(db, api, requests)
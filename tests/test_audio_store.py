@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("motor")
+
+from app.services.audio_store import AudioHandle, LocalFileHandle, content_type_of, file_id_of, file_name
+
+
+def test_mp3_ids_are_bare_hashes():
+    assert file_name("abcd") == "abcd.mp3"
+    assert file_id_of("abcd.mp3") == "abcd"
+    assert content_type_of("abcd") == "audio/mpeg"
+
+
+def test_other_formats_keep_their_extension():
+    assert file_name("abcd.ogg") == "abcd.ogg"
+    assert file_id_of("abcd.ogg") == "abcd.ogg"
+    assert content_type_of("abcd.ogg") == "audio/ogg"
+
+
+def test_handles_must_implement_read_range():
+    with pytest.raises(TypeError):
+        AudioHandle(0)
+
+
+def test_local_handle_reads_inclusive_ranges(tmp_path):
+    path = tmp_path / "abcd.mp3"
+    path.write_bytes(bytes(range(10)))
+    handle = LocalFileHandle(10, str(path))
+
+    async def read(start, end):
+        return b"".join([data async for data in handle.read_range(start, end)])
+
+    assert asyncio.run(read(2, 4)) == bytes([2, 3, 4])
+    assert asyncio.run(handle.read()) == bytes(range(10))
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("motor")
+
+from app.services.cache_stats import CacheStatsBuffer
+from app.services.content_cache import ContentCache
+from app.services import content_cache as content_cache_module
+
+
+def test_lookups_are_written_in_one_flush(db, monkeypatch):
+    buffer = CacheStatsBuffer()
+    monkeypatch.setattr(content_cache_module, "cache_stats", buffer)
+    cache = ContentCache()
+
+    async def scenario():
+        await cache.put(db, "k", {"content": "x"})
+        for key in ("k", "k", "missing"):
+            await cache.get(db, key)
+        before = await db["cache_stats"].find_one({"_id": cache.stats_id}), await cache.stats(db)
+        await buffer.flush(db)
+        after = await db["cache_stats"].find_one({"_id": cache.stats_id}), await cache.stats(db)
+        return before, after, await db[cache.collection].find_one({"_id": "k"})
+
+    (stored, stats), (stored_after, stats_after), entry = asyncio.run(scenario())
+    assert stored is None
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert (stored_after["hits"], stored_after["misses"]) == (2, 1)
+    assert (stats_after["hits"], stats_after["misses"]) == (2, 1)
+    assert entry["hits"] == 2 and "last_hit_at" in entry
@@ -0,0 +1,29 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+
+from app.services.email import SENDING, SENT, EmailService
+
+
+def test_only_the_current_claim_records_a_result(db):
+    outbox = EmailService()
+
+    async def scenario():
+        await outbox.enqueue(db, "a@example.com", "verify_email", {"link": "x"})
+        [first] = await outbox.claim_batch(db, "sender-1", 10)
+        # sender-1 stalls past its lease and sender-2 re-claims the email
+        await db[outbox.collection].update_one(
+            {"_id": first["_id"]}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        [second] = await outbox.claim_batch(db, "sender-2", 10)
+        await outbox.record_result(db, first, "timed out")
+        after_stale = await db[outbox.collection].find_one({"_id": first["_id"]})
+        await outbox.record_result(db, second, None)
+        return after_stale, await db[outbox.collection].find_one({"_id": first["_id"]})
+
+    after_stale, final = asyncio.run(scenario())
+    assert (after_stale["status"], after_stale["owner"], after_stale["attempts"]) == (SENDING, "sender-2", 0)
+    assert final["status"] == SENT
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from app.core import http_range
+from app.core.http_range import RangeNotSatisfiable, parse_range
+
+
+def test_absent_or_malformed_means_full_body():
+    assert parse_range(None, 100) is None
+    assert parse_range("items=0-10", 100) is None
+    assert parse_range("bytes=abc", 100) is None
+    assert parse_range("bytes=50-10", 100) is None
+    assert parse_range("bytes=-", 100) is None
+
+
+def test_closed_range():
+    assert parse_range("bytes=0-9", 100) == [(0, 9)]
+    assert parse_range("bytes=90-200", 100) == [(90, 99)]
+
+
+def test_open_ended_range():
+    assert parse_range("bytes=10-", 100) == [(10, 99)]
+    assert parse_range("bytes=99-", 100) == [(99, 99)]
+
+
+def test_suffix_range():
+    assert parse_range("bytes=-10", 100) == [(90, 99)]
+    assert parse_range("bytes=-500", 100) == [(0, 99)]
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-", "bytes=100-150", "bytes=-0"])
+def test_past_eof_is_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 100)
+
+
+def test_multi_range_sorted_and_merged():
+    assert parse_range("bytes=50-59, 0-9, 5-20", 100) == [(0, 20), (50, 59)]
+    assert parse_range("bytes=0-9,10-19", 100) == [(0, 19)]
+    # Ranges past the end are dropped when others overlap
+    assert parse_range("bytes=0-9,200-", 100) == [(0, 9)]
+
+
+def test_too_many_ranges_means_full_body():
+    header = "bytes=" + ",".join(f"{i * 2}-{i * 2}" for i in range(http_range.MAX_RANGES + 1))
+    assert parse_range(header, 1000) is None
+
+
+def test_multipart_layout_length():
+    parts, closing, total = http_range.multipart_layout([(0, 9), (20, 29)], 100, "audio/mpeg", "b")
+    assert total == sum(len(header) + end - start + 1 for header, start, end in parts) + len(closing)
+
+
+def test_conditional_headers():
+    modified = datetime(2024, 1, 2, 3, 4, 5)
+    assert http_range.is_not_modified({"if-none-match": '"abc"'}, '"abc"', modified)
+    assert not http_range.is_not_modified({"if-none-match": '"x"'}, '"abc"', modified)
+    assert http_range.is_not_modified({"if-modified-since": http_range.http_date(modified)}, '"abc"', modified)
+    assert http_range.if_range_allows({"if-range": '"abc"'}, '"abc"', modified)
+    assert not http_range.if_range_allows({"if-range": '"old"'}, '"abc"', modified)
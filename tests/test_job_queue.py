@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+
+from app.core.config import settings
+from app.services.job_queue import COMPLETED, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """The subset of Mongo query semantics the queue filters use."""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == "$not":
+                    if matches(doc, {field: operand}):
+                        return False
+                    continue
+                if value is None:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+NOW = datetime(2024, 1, 1, 12)
+EXPIRED = NOW - timedelta(seconds=1)
+LIVE = NOW + timedelta(seconds=30)
+LAST = settings.JOB_MAX_ATTEMPTS
+
+
+@pytest.mark.parametrize("job, claimable, abandoned", [
+    ({"status": QUEUED, "attempts": 0}, True, False),
+    # Requeued after a failure: waits out its backoff
+    ({"status": QUEUED, "attempts": 1, "not_before": LIVE}, False, False),
+    ({"status": QUEUED, "attempts": 1, "not_before": EXPIRED}, True, False),
+    ({"status": RUNNING, "attempts": 1, "lease_expires_at": LIVE}, False, False),
+    ({"status": RUNNING, "attempts": 1, "lease_expires_at": EXPIRED}, True, False),
+    # Worker died on the last attempt: never claimable again, failed instead
+    ({"status": RUNNING, "attempts": LAST, "lease_expires_at": EXPIRED}, False, True),
+    ({"status": RUNNING, "attempts": LAST, "lease_expires_at": LIVE}, False, False),
+    ({"status": FAILED, "attempts": LAST}, False, False),
+])
+def test_claim_filters(job, claimable, abandoned):
+    assert matches(job, JobQueue.claimable(NOW)) is claimable
+    assert matches(job, JobQueue.abandoned(NOW)) is abandoned
+
+
+def test_every_expired_running_job_is_claimable_or_abandoned():
+    for attempts in range(LAST + 2):
+        job = {"status": RUNNING, "attempts": attempts, "lease_expires_at": EXPIRED}
+        assert matches(job, JobQueue.claimable(NOW)) != matches(job, JobQueue.abandoned(NOW))
+
+
+def test_only_the_holding_worker_finishes_a_job(db):
+    queue = JobQueue()
+
+    async def scenario():
+        await queue.enqueue(db, "u1", {}, "key")
+        first = await queue.claim(db, "w1")
+        # w1 stalls past its lease and w2 takes the job over
+        await db[queue.collection].update_one({"_id": first["_id"]}, {"$set": {"lease_expires_at": EXPIRED}})
+        second = await queue.claim(db, "w2")
+        stale = await queue.fail(db, first, "w1", "boom"), await queue.complete(db, first["_id"], "w1", "s1")
+        done = await queue.complete(db, second["_id"], "w2", "s2")
+        return stale, done, await queue.get(db, first["_id"])
+
+    stale, done, job = asyncio.run(scenario())
+    assert stale == (False, False)
+    assert done is True
+    assert (job["status"], job["session_id"], job["attempts"]) == (COMPLETED, "s2", 2)
+
+
+def test_failed_job_is_requeued_after_a_backoff(db):
+    queue = JobQueue()
+
+    async def scenario():
+        await queue.enqueue(db, "u1", {}, "key")
+        job = await queue.claim(db, "w1")
+        await queue.fail(db, job, "w1", "boom")
+        return await queue.claim(db, "w2"), await queue.get(db, job["_id"])
+
+    reclaimed, job = asyncio.run(scenario())
+    assert reclaimed is None
+    assert job["status"] == QUEUED
+    assert job["not_before"] > datetime.utcnow()
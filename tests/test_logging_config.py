@@ -0,0 +1,26 @@
+import json
+import logging
+import time
+
+import pytest
+
+from app.core.logging_config import JsonFormatter
+
+
+@pytest.fixture
+def local_time_not_utc(monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("needs time.tzset")
+    monkeypatch.setenv("TZ", "EST+05")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_json_timestamps_are_utc(local_time_not_utc):
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "hello", (), None)
+    record.created = 0.25
+    record.msecs = 250.0
+    entry = json.loads(JsonFormatter(100).format(record))
+    assert entry["ts"] == "1970-01-01T00:00:00.250Z"
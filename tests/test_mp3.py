@@ -0,0 +1,64 @@
+import pytest
+
+from app.services import mp3
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417-byte frames of 1152 samples
+FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+FRAME_MS = 1152 * 1000 / 44100
+
+
+def audio(frames: int) -> bytes:
+    return FRAME * frames
+
+
+def test_duration():
+    assert mp3.duration_ms(audio(100)) == pytest.approx(100 * FRAME_MS)
+
+
+def test_id3_tag_and_trailing_garbage_are_skipped():
+    tag = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"x" * 5
+    frames = list(mp3.iter_frames(tag + audio(3) + b"TAG"))
+    assert [offset for offset, _, _ in frames] == [15, 15 + 417, 15 + 834]
+
+
+def test_frame_index_lands_on_frame_boundaries():
+    index = mp3.build_frame_index(audio(100), interval_ms=500)
+    assert index[0] == [0, 0]
+    assert all(offset % len(FRAME) == 0 for _, offset in index)
+    times = [time_ms for time_ms, _ in index]
+    assert times == sorted(times)
+    # One entry per interval, at the first frame starting after each multiple
+    assert len(index) == int(100 * FRAME_MS // 500) + 1
+    for time_ms, _ in index[1:]:
+        assert time_ms % 500 < FRAME_MS
+
+
+def test_offset_for_time():
+    index = mp3.build_frame_index(audio(100), interval_ms=500)
+    assert mp3.offset_for_time(index, 0) == 0
+    assert mp3.offset_for_time(index, 1200) == index[2][1]
+    assert mp3.offset_for_time([], 1200) == 0
+
+
+def test_segment_bounds_cover_the_file():
+    data = audio(400)
+    index = mp3.build_frame_index(data)
+    total = mp3.duration_ms(data)
+    segments = mp3.segment_bounds(index, len(data), 3000, total)
+    assert segments[0][0] == 0
+    assert segments[-1][1] == len(data) - 1
+    for (_, end, _), (start, _, _) in zip(segments, segments[1:]):
+        assert start == end + 1
+        assert start % len(FRAME) == 0
+    assert sum(duration for _, _, duration in segments) == pytest.approx(total)
+    assert all(duration >= 3000 for _, _, duration in segments[:-1])
+
+
+def test_segment_bounds_estimate_the_last_duration():
+    data = audio(400)
+    segments = mp3.segment_bounds(mp3.build_frame_index(data), len(data), 3000)
+    assert sum(duration for _, _, duration in segments) == pytest.approx(400 * FRAME_MS, rel=0.01)
+
+
+def test_segment_bounds_of_empty_file():
+    assert mp3.segment_bounds([], 0, 3000) == []
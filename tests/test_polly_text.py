@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("motor")
+
+from app.services.polly_service import chunk_text, split_sentences
+
+
+def test_split_keeps_every_character():
+    text = "One.  Two!\nThree? \"Four.\" Five"
+    sentences = split_sentences(text)
+    assert "".join(sentences) == text
+    assert sentences == ["One.  ", "Two!\n", "Three? ", "\"Four.\" ", "Five"]
+
+
+def test_split_skips_abbreviations_and_initials():
+    assert split_sentences("This is Dr. Smith. Hello.") == ["This is Dr. Smith. ", "Hello."]
+    assert split_sentences("Fruit, e.g. apples, i.e. food. Next.") == ["Fruit, e.g. apples, i.e. food. ", "Next."]
+    assert split_sentences("J. R. R. Tolkien wrote it.") == ["J. R. R. Tolkien wrote it."]
+
+
+def test_line_break_always_ends_a_sentence():
+    assert split_sentences("Mr.\nNext") == ["Mr.\n", "Next"]
+
+
+def test_chunks_pack_whole_sentences():
+    text = "One two. Three four. Five six."
+    chunks = chunk_text(text, 21)
+    assert chunks == ["One two. Three four. ", "Five six."]
+    assert all(len(chunk) <= 21 for chunk in chunks)
+
+
+def test_long_sentence_is_cut_at_whitespace():
+    text = "alpha beta gamma delta epsilon"
+    chunks = chunk_text(text, 12)
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 12 for chunk in chunks)
+    assert chunks[0] == "alpha beta "
@@ -0,0 +1,52 @@
+import pytest
+
+from app.services import speech_marks
+
+MARKS = [
+    {"time": 0, "type": "word", "start": 0, "end": 5, "value": "Hello"},
+    {"time": 400, "type": "word", "start": 6, "end": 12, "value": "world,"},
+    {"time": 900, "type": "word", "start": 13, "end": 18, "value": "héllo"},
+    {"time": 1500, "type": "word", "start": 19, "end": 25, "value": "again."},
+]
+
+
+def test_pack_round_trip():
+    decoded = speech_marks.SpeechMarks.decode(speech_marks.pack(MARKS))
+    assert decoded.to_list() == MARKS
+
+
+def test_pack_sorts_by_time():
+    decoded = speech_marks.SpeechMarks.decode(speech_marks.pack(list(reversed(MARKS))))
+    assert decoded.to_list() == MARKS
+
+
+def test_empty_marks():
+    assert speech_marks.SpeechMarks.decode(speech_marks.pack([])).to_list() == []
+
+
+def test_unknown_version_is_rejected():
+    import zlib
+    data = bytearray(zlib.decompress(speech_marks.pack(MARKS)))
+    data[0] = speech_marks.FORMAT_VERSION + 1
+    with pytest.raises(ValueError):
+        speech_marks.SpeechMarks.decode(zlib.compress(bytes(data)))
+
+
+def test_window_includes_the_word_being_spoken():
+    marks = speech_marks.SpeechMarks.from_list(MARKS)
+    assert [m["value"] for m in marks.window(500, 1500)] == ["world,", "héllo"]
+    assert [m["value"] for m in marks.window(900, 901)] == ["héllo"]
+
+
+def test_window_edges():
+    marks = speech_marks.SpeechMarks.from_list(MARKS)
+    assert marks.window(0) == MARKS
+    assert [m["value"] for m in marks.window(5000)] == ["again."]
+    assert marks.window(0, 0) == []
+
+
+def test_from_document_reads_both_forms():
+    packed = speech_marks.from_document({"speech_marks_packed": speech_marks.pack(MARKS)})
+    legacy = speech_marks.from_document({"speech_marks": MARKS})
+    assert packed.to_list() == legacy.to_list() == MARKS
+    assert len(speech_marks.from_document({})) == 0
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("motor")
+
+from app.services.tts_fragments import normalize_sentence
+
+
+def test_collapses_and_trims_whitespace():
+    normalized, offsets = normalize_sentence("  Hello \n  world.  ")
+    assert normalized == "Hello world."
+    assert len(offsets) == len(normalized.encode("utf-8")) + 1
+
+
+def test_offsets_map_back_to_the_original():
+    original = "  Hello \n  world.  "
+    normalized, offsets = normalize_sentence(original)
+    start = normalized.index("world")
+    assert original.encode("utf-8")[offsets[start]:offsets[start + 5]] == b"world"
+    # The end maps to just past the last visible character
+    assert offsets[-1] == original.index(".") + 1
+
+
+def test_offsets_are_utf8_bytes():
+    original = "Café  au lait"
+    normalized, offsets = normalize_sentence(original)
+    assert normalized == "Café au lait"
+    start = len("Café ".encode("utf-8"))
+    assert original.encode("utf-8")[offsets[start]:offsets[-1]] == b"au lait"
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("motor")
+
+from app.services.usage_rollup import COUNTERS, SUMMARY_FIELDS, UsageRollup
+
+
+def test_summary_keeps_report_keys():
+    # The admin dashboard reads these keys from /admin/usage-report
+    for key in ("total_openai_tokens", "total_polly_characters", "total_openai_cost",
+                "total_polly_cost", "total_cost", "total_sessions"):
+        assert key in SUMMARY_FIELDS
+    assert "total_total_cost" not in SUMMARY_FIELDS
+
+
+def test_summary_sums_every_counter():
+    assert set(COUNTERS) <= set(SUMMARY_FIELDS.values())
+
+
+def test_increments():
+    inc = UsageRollup().increments({"openai_tokens": 10, "total_cost": 0.5, "cache_hit": True})
+    assert inc["openai_tokens"] == 10
+    assert inc["total_cost"] == 0.5
+    assert inc["polly_characters"] == 0
+    assert inc["sessions"] == 1
+    assert inc["cache_hits"] == 1
+
+
+def test_rendition_usage_is_not_a_session():
+    inc = UsageRollup().increments({"polly_characters": 1200, "rendition": "ogg"})
+    assert inc["polly_characters"] == 1200
+    assert inc["sessions"] == 0